@@ -5,6 +5,7 @@
 # internal packages
 from source.TestBoxIF.I2C import I2C
 from source.TestBoxIF.TestBoxHalf import TestBoxHalf
+from source.TestBoxIF.Calibration import GasGaugeCalibration
 from source.BatTest.TestLog import TestLog
 from source.BatTest.FSM import FSM, States
 
@@ -12,13 +13,17 @@ class BatteryTest(object):
     """docstring for BatteryTest"""
     def __init__(
         self,
-        i2c: I2C = None):
+        i2c: I2C = None,
+        calibration: GasGaugeCalibration = None,
+        clock = None,
+        checkpoint_fname: str = None):
 
         self._i2c = i2c
         
 
-        self._if_board = TestBoxHalf(i2c)
-        self._fsm = FSM(self._if_board)
+        self._if_board = TestBoxHalf(i2c, calibration)
+        self._fsm = FSM(
+            self._if_board, clock=clock, checkpoint_fname=checkpoint_fname)
         self._result = None
         self._charge_setpoint = 100
         self._status = None
@@ -34,7 +39,7 @@ class BatteryTest(object):
 
     @property
     def test_log(self):
-        return self._fsm._test_log
+        return self._fsm.test_log
 
     @property
     def state_name(self):
@@ -59,6 +64,14 @@ class BatteryTest(object):
     def done(self):
         return self._fsm.done
 
+    @property
+    def abort_reason(self):
+        return self._fsm.abort_reason
+
+    @property
+    def tick_transactions(self):
+        return self._fsm.tick_transactions
+
     def start_test(
         self,
         charge_setpoint: int = 35,
@@ -75,6 +88,10 @@ class BatteryTest(object):
     def start_quickcharge(self, charge_setpoint: int = 100):
         self._fsm.start(charge_setpoint,quickcharge=True)
 
+    def restore(self, checkpoint: dict):
+        '''Resume a test from a checkpoint taken before a restart'''
+        self._fsm.restore(checkpoint)
+
     def stop(self):
         self._fsm.stop()
 
@@ -0,0 +1,176 @@
+'''
+Compact binary test logs.
+
+A log starts with a versioned header: magic, version and a JSON block
+with the box id, start time, column keys, test limits and gas gauge
+calibration, padded to a multiple of 8 bytes.  Fixed width records
+follow, one little endian double per column, appended as results come in.
+
+Logs are read through mmap, columns are zero copy strided memoryviews.
+export_csv converts a log to the csv layout of TestLog.
+'''
+
+# standard library
+from __future__ import annotations
+from array import array
+from datetime import timedelta
+import os
+import sys
+import csv
+import json
+import math
+import mmap
+import struct
+import logging
+
+# external packages
+
+# internal packages
+
+MAGIC = b'BATLOG'
+BINLOG_VERSION = 1
+BINLOG_EXT = '.bin'
+
+_PREFIX = struct.Struct('<6sHI')    # magic, version, JSON length
+_ALIGN = 8
+
+logger = logging.getLogger('batman.BatTest.BinaryLog')
+
+def record_struct(keys: list) -> struct.Struct:
+    return struct.Struct(f'<{len(keys)}d')
+
+def encode_header(header: dict) -> bytes:
+    data = json.dumps(header).encode()
+    data += b' ' * (-(_PREFIX.size + len(data)) % _ALIGN)
+    return _PREFIX.pack(MAGIC, BINLOG_VERSION, len(data)) + data
+
+def decode_header(data: bytes) -> tuple:
+    '''(header, header length in bytes) of a log starting with data'''
+    if len(data) < _PREFIX.size:
+        raise BinaryLogError('log is shorter than its header')
+    magic, version, length = _PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise BinaryLogError('not a binary test log')
+    if version != BINLOG_VERSION:
+        raise BinaryLogError(f'unsupported log version {version}')
+
+    end = _PREFIX.size + length
+    try:
+        header = json.loads(bytes(data[_PREFIX.size:end]))
+    except ValueError as e:
+        raise BinaryLogError(f'corrupt log header: {e}') from e
+    return header, end
+
+def truncate_torn(fname: str) -> int:
+    '''Cut off a record torn by a crash, returns the number of records'''
+    with open(fname, 'rb+') as file:
+        header, header_len = decode_header(file.read(_PREFIX.size + 65536))
+        record_size = record_struct(header['keys']).size
+        size = file.seek(0, os.SEEK_END)
+        num_records = max(size - header_len, 0) // record_size
+        file.truncate(header_len + num_records * record_size)
+    return num_records
+
+def export_csv(fname: str, csv_fname: str = None, csv_headers: list = None) -> str:
+    '''Write binary log fname as csv, returns the csv file name
+
+    :param csv_headers: column titles, the result keys if not given
+    '''
+    if csv_fname is None:
+        csv_fname = os.path.splitext(fname)[0] + '.csv'
+
+    with BinaryLogReader(fname) as reader, \
+            open(csv_fname, 'w', newline='') as file:
+        timedelta_keys = set(reader.header.get('timedelta_keys', []))
+        writer = csv.writer(file)
+        writer.writerows([[csv_fname], ['BatMan test results'],
+            csv_headers if csv_headers else reader.keys])
+        for values in reader.records():
+            writer.writerow([_csv_cell(value, key in timedelta_keys)
+                for key, value in zip(reader.keys, values)])
+    return csv_fname
+
+def _csv_cell(value: float, is_timedelta: bool):
+    if math.isnan(value):
+        return ''
+    if is_timedelta:
+        return str(timedelta(seconds=value))
+    return int(value) if value.is_integer() else value
+
+class BinaryLogReader(object):
+    """Memory mapped binary log, records written later are not seen"""
+    def __init__(self, fname: str):
+        self._fname = fname
+        with open(fname, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._header, header_len = decode_header(self._mmap)
+        self._keys = self._header['keys']
+        record_size = record_struct(self._keys).size
+        self._len = (len(self._mmap) - header_len) // record_size
+
+        self._data = memoryview(self._mmap)[
+            header_len : header_len + self._len * record_size]
+        if sys.byteorder == 'little':
+            self._values = self._data.cast('d')
+        else:
+            values = array('d')
+            values.frombytes(self._data)
+            values.byteswap()
+            self._values = memoryview(values)
+
+    def __enter__(self) -> BinaryLogReader:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._len
+
+    # API
+    @property
+    def header(self) -> dict:
+        return self._header
+
+    @property
+    def keys(self) -> list:
+        return list(self._keys)
+
+    def column(self, key: str) -> memoryview:
+        '''zero copy view of one column'''
+        return self._values[self._keys.index(key)::len(self._keys)]
+
+    def values(self, i: int) -> list:
+        width = len(self._keys)
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('record index out of range')
+        return self._values[i * width : (i + 1) * width].tolist()
+
+    def records(self):
+        width = len(self._keys)
+        values = self._values.tolist()
+        for i in range(0, len(values), width):
+            yield values[i : i + width]
+
+    def row(self, i: int) -> dict:
+        return dict(zip(self._keys, self.values(i)))
+
+    def close(self):
+        self._values.release()
+        self._data.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # column views still in use keep the mapping open until freed
+            logger.debug(f'{self._fname} still mapped by column views')
+
+class BinaryLogError(Exception):
+    pass
+
+if __name__ == '__main__':
+    # convert a binary log to csv
+    from source.BatTest.TestLog import csv_headers
+    print(export_csv(sys.argv[1], *sys.argv[2:3], csv_headers=csv_headers))
@@ -0,0 +1,54 @@
+'''
+Crash safe FSM checkpoints, one small JSON file per box.
+
+A checkpoint is written to a temporary file next to its target and moved
+over it with os.replace, so a crash leaves either the previous or the new
+checkpoint on disk, never a torn one.
+'''
+
+# standard library
+import os
+import json
+import logging
+
+# external packages
+
+# internal packages
+
+# absolute, so a restart from another working directory finds them
+CHECKPOINT_DIR = os.path.join(os.path.expanduser('~'), '.batman', 'checkpoints')
+CHECKPOINT_VERSION = 1
+
+logger = logging.getLogger('batman.BatTest.Checkpoint')
+
+def checkpoint_fname(box_id: str, checkpoint_dir: str = CHECKPOINT_DIR) -> str:
+    return os.path.join(checkpoint_dir, f'{box_id}.json')
+
+def save_checkpoint(fname: str, checkpoint: dict):
+    '''Atomically replace fname with checkpoint'''
+    directory = os.path.dirname(fname)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_fname = f'{fname}.tmp'
+    with open(tmp_fname, 'w') as file:
+        json.dump({'version' : CHECKPOINT_VERSION, **checkpoint}, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_fname, fname)
+
+def load_checkpoint(fname: str) -> dict:
+    '''Checkpoint in fname, None if there is no usable checkpoint'''
+    try:
+        with open(fname, 'r') as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f'unreadable checkpoint {fname}: {e!r}')
+        return None
+
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        logger.warning(f'unsupported checkpoint version in {fname}')
+        return None
+    return checkpoint
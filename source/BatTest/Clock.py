@@ -0,0 +1,44 @@
+'''
+Clocks for the battery test FSM.
+
+States, the FSM and test logs take the time from a clock object instead of
+calling datetime.now() directly, so a test cycle can run against a
+VirtualClock that is advanced by the caller, many times faster than real
+time.
+'''
+
+# standard library
+import time
+from datetime import datetime, timedelta
+
+# external packages
+
+# internal packages
+
+class SystemClock(object):
+    """Wall clock time"""
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+class VirtualClock(object):
+    """Clock that only moves when advanced
+
+    :param start: initial time, defaults to the current wall clock time
+    """
+    def __init__(self, start: datetime = None):
+        self._now = start if start else datetime.now()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance(self, seconds: float):
+        if seconds < 0:
+            raise ValueError('cannot move a clock backwards')
+        self._now += timedelta(seconds=seconds)
+
+    def sleep(self, seconds: float):
+        '''waiting on a virtual clock moves it forward instead'''
+        self.advance(seconds)
@@ -1,43 +1,113 @@
 # standard library
 import logging
 from enum import Enum, auto
+from typing import NamedTuple
 from datetime import datetime, timedelta
-from time import sleep
 # external packages
 
 # internal packages
 from source import Config
 from source.TestBoxIF.I2C import I2CError, I2CReadError, I2CWriteError
 from source.TestBoxIF.TestBoxHalf import TestBoxHalf
+from source.TestBoxIF.LTC2943 import Alert
+from source.TestBoxIF.LTC2943 import GasGaugeSample
+from source.TestBoxIF.Calibration import GasGaugeCalibration
 from source.BatTest.TestLog import TestLog
 from source.BatTest.TestLog import result_str
+from source.BatTest.TestLog import LIMIT_PERSISTENCE
+from source.BatTest.Clock import SystemClock
+from source.BatTest.Checkpoint import save_checkpoint
 
-# test settings
-test_log = None
-charge_setpoint = None
-charge_test_level = None
+class TestContext(object):
+    """Test settings and results of one FSM, shared by its states"""
+    def __init__(
+        self,
+        clock = None,
+        limit_persistence: int = LIMIT_PERSISTENCE,
+        binary_log: bool = False):
+
+        self.clock = clock if clock else SystemClock()
+        self.limit_persistence = limit_persistence
+        self.binary_log = binary_log
+        self.test_log = None
+        self.last_log = None    # log of the finished test, not checkpointed
+        self.charge_setpoint = None
+        self.charge_test_level = None
+        self.test_pass = False
+        self.done = False
+        self.abort_reason = None
+
+    def checkpoint(self) -> dict:
+        test_log = self.test_log
+        return {
+            'charge_setpoint' : self.charge_setpoint,
+            'charge_test_level' : self.charge_test_level,
+            'test_pass' : self.test_pass,
+            'done' : self.done,
+            'abort_reason' : self.abort_reason,
+            'log_fname' : None,
+            **(test_log.checkpoint() if test_log else {}),
+        }
+
+    def finish_log(self):
+        '''Keep the log of a finished test for its results only, so idle
+        checkpoints do not reopen it
+        '''
+        if self.test_log:
+            self.test_log.flush()
+            self.last_log = self.test_log
+            self.test_log = None
+
+    def restore(self, checkpoint: dict):
+        self.charge_setpoint = checkpoint['charge_setpoint']
+        self.charge_test_level = checkpoint['charge_test_level']
+        self.test_pass = checkpoint['test_pass']
+        self.done = checkpoint['done']
+        self.abort_reason = checkpoint.get('abort_reason')
+        if checkpoint['log_fname']:
+            calibration = checkpoint.get('log_calibration')
+            self.test_log = TestLog.resume(checkpoint['log_fname'],
+                checkpoint['log_offset'], clock=self.clock,
+                limit_persistence=self.limit_persistence,
+                box_id=checkpoint.get('log_box_id', ''),
+                calibration=GasGaugeCalibration(**calibration) \
+                    if calibration else None,
+                monitor=checkpoint.get('log_monitor'))
+        else:
+            self.test_log = None
+
+class MeasurementFrame(NamedTuple):
+    """Measurements taken once per tick, shared by State.do and State.next
 
-test_time = 0
-test_pass = False
-done = False
+    sample is None if the gas gauge could not be read this tick.
+    """
+    timestamp: datetime
+    sample: GasGaugeSample
+    error: Exception = None
 
 class FSM(object):
     """docstring for FSM"""
+    # checkpoints are saved on every state change and at least this often
+    CHECKPOINT_PERIOD_TD = timedelta(seconds=60)
+
     def __init__(
         self,
         test_box_half: TestBoxHalf = None,
-        box_id: str = ''
+        box_id: str = '',
+        clock = None,
+        checkpoint_fname: str = None,
+        limit_persistence: int = LIMIT_PERSISTENCE,
+        binary_log: bool = False
     ):
 
         self.logger = logging.getLogger('batman.BatTest.FSM.FSM')
         self.logger.info('FSM init')
 
         self._test_box_half = test_box_half
-        global test_log
-        self._test_log = test_log 
+        self._context = TestContext(clock, limit_persistence, binary_log)
 
         # state machine
-        self._state = IdleState(self._test_box_half)
+        self._state = IdleState(self._test_box_half, self._context)
 
         # initialize results log
         self._start_datetime = 0
@@ -46,6 +116,13 @@ class FSM(object):
         self._quickcharge = False
         self._flag = None
 
+        # bus transactions used by the last process() call
+        self._tick_transactions = 0
+
+        # crash recovery
+        self._checkpoint_fname = checkpoint_fname
+        self._checkpoint_at = None
+
     # API
     @property
     def state_name(self):
@@ -53,18 +130,36 @@ class FSM(object):
 
     @property
     def test_time(self):
-        return str(datetime.now() - self._start_datetime).split('.')[0]
+        return str(self._context.clock.now() - self._start_datetime).split('.')[0]
 
 
+    @property
+    def context(self) -> TestContext:
+        return self._context
+
+    @property
+    def test_log(self) -> TestLog:
+        '''log of the running test, or of the last finished one'''
+        if self._context.test_log:
+            return self._context.test_log
+        return self._context.last_log
+
     @property
     def test_pass(self):
-        global test_pass
-        return test_pass
+        return self._context.test_pass
 
     @property
     def done(self):
-        global done
-        return done
+        return self._context.done
+
+    @property
+    def abort_reason(self) -> str:
+        '''live limit violation the last test was aborted for'''
+        return self._context.abort_reason
+
+    @property
+    def tick_transactions(self) -> int:
+        return self._tick_transactions
 
     def start(
         self, 
@@ -73,35 +168,92 @@ class FSM(object):
         short_test: bool = False,
         resume_test: bool = False
     ):
-        global charge_setpoint
-
-        self._start_datetime = datetime.now()
+        context = self._context
+        self._start_datetime = context.clock.now()
 
-        charge_setpoint = charge_sp
+        context.charge_setpoint = charge_sp
 
         if quickcharge:
-            global charge_test_level
-            charge_test_level = charge_sp
+            context.charge_test_level = charge_sp
             self._flag = Flags.START_QUICKCHARGE
         else:
             if short_test:
-                charge_test_level = 10.5
+                context.charge_test_level = 10.5
                 self._flag = Flags.START_SHORT_TEST
             elif resume_test:
-                charge_test_level = 100
+                context.charge_test_level = 100
                 self._flag  = Flags.RESUME_TEST
             else:
-                charge_test_level = 100
+                context.charge_test_level = 100
                 self._flag = Flags.START_TEST
 
     def stop(self):
         self._flag = Flags.STOP
 
     def process(self):
-        self._state.do()
-        self._state = self._state.next(self._flag)
+        i2c = self._test_box_half.i2c
+        start_count = i2c.transaction_count
+
+        frame = self.measure()
+        self._state.do(frame)
+        state = self._state
+        self._state = self._state.next(self._flag, frame)
         self._flag = None
 
+        self._tick_transactions = i2c.transaction_count - start_count
+
+        test_log = self._context.test_log
+        if test_log and self._state is not state:
+            test_log.flush()
+
+        if self._checkpoint_fname and (self._state is not state
+                or self._checkpoint_at is None
+                or frame.timestamp - self._checkpoint_at >= self.CHECKPOINT_PERIOD_TD):
+            self.save_checkpoint()
+
+    def checkpoint(self) -> dict:
+        '''State name, timing, counters and setpoints needed to resume'''
+        start = self._start_datetime
+        return {
+            'saved_at' : self._context.clock.now().isoformat(),
+            'start_time' : start.isoformat() if start else None,
+            'context' : self._context.checkpoint(),
+            'state' : self._state.checkpoint(),
+        }
+
+    def save_checkpoint(self):
+        self._checkpoint_at = self._context.clock.now()
+        try:
+            save_checkpoint(self._checkpoint_fname, self.checkpoint())
+        except OSError as e:
+            self.logger.warning(f'checkpoint not saved: {e!r}')
+
+    def restore(self, checkpoint: dict):
+        '''Resume the test a checkpoint was taken of
+
+        The box outputs stay latched while the host is down, so state and
+        test times keep running from their original start times.
+        '''
+        start = checkpoint['start_time']
+        self._start_datetime = datetime.fromisoformat(start) if start else 0
+        self._context.restore(checkpoint['context'])
+
+        state_checkpoint = checkpoint['state']
+        state_class = STATE_CLASSES[state_checkpoint['name']]
+        self._state = state_class.from_checkpoint(
+            self._test_box_half, self._context, state_checkpoint)
+        self._flag = None
+        self.logger.info(f'resumed in {self._state}')
+
+    def measure(self) -> MeasurementFrame:
+        '''One gas gauge burst for the whole tick'''
+        timestamp = self._context.clock.now()
+        try:
+            sample = self._test_box_half.gas_gauge.snapshot()
+            return MeasurementFrame(timestamp, sample)
+        except I2CError as e:
+            return MeasurementFrame(timestamp, None, e)
+
 class States(Enum):
     ERROR = 'sERROR'
     IDLE = 'sIDLE'
@@ -126,16 +278,20 @@ class Flags(Enum):
 class State(object):
     STATE_TIMEOUT_TD = timedelta.max
     READ_TIMEOUT_TD = timedelta(seconds=5)
+    # both outputs off between charging and discharging
+    SWITCH_DELAY_TD = timedelta(seconds=1)
     NAME = 'state'
 
     def __init__(
         self,
         test_box_half: TestBoxHalf = None,
+        context: TestContext = None,
     ):
         self.logger = logging.getLogger(f'batman.BatTest.FSM.{self.__class__.__name__}')
 
         self._test_box_half = test_box_half
-        self._start_time = datetime.now()
+        self._context = context if context else TestContext()
+        self._start_time = self._context.clock.now()
         self._last_read_time = self._start_time
 
         self.logger.info(f'entered {self.__class__.__name__}')
@@ -154,56 +310,96 @@ class State(object):
     def result(self):
         return None    
 
+    @classmethod
+    def from_checkpoint(
+        cls,
+        test_box_half: TestBoxHalf,
+        context: TestContext,
+        checkpoint: dict
+    ):
+        '''Rebuild a state without repeating its entry actions'''
+        state = cls.__new__(cls)
+        State.__init__(state, test_box_half, context)
+        state.restore(checkpoint)
+        return state
+
+    def checkpoint(self) -> dict:
+        return {
+            'name' : self.NAME,
+            'start_time' : self._start_time.isoformat(),
+        }
+
+    def restore(self, checkpoint: dict):
+        self._start_time = datetime.fromisoformat(checkpoint['start_time'])
+        self._elapsed_time = self._context.clock.now() - self._start_time
+
     # do state actions
-    def do(self):
-        self._elapsed_time = datetime.now() - self._start_time
+    def do(self, frame: MeasurementFrame):
+        self._elapsed_time = self._context.clock.now() - self._start_time
 
     # get next state
-    def next(self, flag):
+    def next(self, flag, frame: MeasurementFrame):
         state_timeout = self._elapsed_time > self.STATE_TIMEOUT_TD
 
         if flag == Flags.STOP:
             self.logger.info('test stopped')
             self.teardown()
-            return IdleState(self._test_box_half)
+            return IdleState(self._test_box_half, self._context)
         elif state_timeout:
             self.logger.warning(f'test state timeout {self._elapsed_time}')
-            self.teardown()
-            self._test_box_half.gpio.led_error_enable = True
-            return IdleState(self._test_box_half)    
+            with self._test_box_half.gpio.batch():
+                self.teardown()
+                self._test_box_half.gpio.led_error_enable = True
+            return IdleState(self._test_box_half, self._context)    
 
     def teardown(self):
-        self._test_box_half.gpio.charge_enable = False
-        self._test_box_half.gpio.discharge_enable = False
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.charge_enable = False
+            self._test_box_half.gpio.discharge_enable = False
 
 class LogState(State):
-    def __init__(self, test_box_half: TestBoxHalf = None):
-        super().__init__(test_box_half)
+    def __init__(
+        self,
+        test_box_half: TestBoxHalf = None,
+        context: TestContext = None
+    ):
+        super().__init__(test_box_half, context)
+
+    def next(self, flag, frame: MeasurementFrame):
+        default_next = super().next(flag, frame)
+        if default_next is not None:
+            return default_next
 
-    def do(self):
-        super().do()
-        global test_log
+        # a clearly failing battery does not have to finish the cycle
+        test_log = self._context.test_log
+        if test_log and test_log.limit_violation:
+            self.logger.warning(f'test aborted, {test_log.limit_violation}')
+            self.teardown()
+            self._context.abort_reason = test_log.limit_violation
+            return ErrorState(self._test_box_half, self._context)
+
+    def do(self, frame: MeasurementFrame):
+        super().do(frame)
+        test_log = self._context.test_log
         # self._test_box_half.gas_gauge.control_init()
 
-        # sample and record data
-        try:
-            gas_gauge_data = self._test_box_half.gas_gauge.get_all()
-            result_datetime = gas_gauge_data['bat_timestamp']
-            td = result_datetime - self._start_time
-            gas_gauge_data['bat_timestamp'] = td
-            gas_gauge_data['bat_timestamp_ms'] = td.seconds * 1000 + td.microseconds / 1000
-            if test_log:
-                test_log.add_result(gas_gauge_data)
-            self._last_read_time = datetime.now()
-        except I2CError as e:
-            self.logger.exception(e)
-        except Exception as e:
-            self.logger.exception(e)
-            raise e
+        # record the tick's sample, next() checks the same sample
+        sample = frame.sample
+        if sample is None:
+            self.logger.warning(f'gas gauge read failed: {frame.error!r}')
+            return
+
+        gas_gauge_data = sample.as_dict()
+        td = frame.timestamp - self._start_time
+        gas_gauge_data['bat_timestamp'] = td
+        gas_gauge_data['bat_timestamp_ms'] = td.seconds * 1000 + td.microseconds / 1000
+        if test_log:
+            test_log.add_result(gas_gauge_data)
+        self._last_read_time = self._context.clock.now()
 
         # charges overflow
-        if self._test_box_half.gas_gauge.overflow:
-            if gas_gauge_data['bat_charge_level'] < 50:     # overflow
+        if sample.overflow:
+            if sample.charge_level < 50:     # overflow
                 self._test_box_half.gas_gauge.charge = 0xFFFF - 100
                 self.logger.info('charge accum overflow')
             else:   # underflow
@@ -231,57 +427,100 @@ class LogState(State):
 
 class IdleState(State):
     NAME = States.IDLE.value
-    def __init__(self, test_box_half: TestBoxHalf = None):
-        super().__init__(test_box_half)
-        self._test_box_half.gpio.charge_enable = False
-        self._test_box_half.gpio.discharge_enable = False
+    def __init__(
+        self,
+        test_box_half: TestBoxHalf = None,
+        context: TestContext = None
+    ):
+        super().__init__(test_box_half, context)
+        self._context.finish_log()
+        self._setup()
+
+    def restore(self, checkpoint: dict):
+        super().restore(checkpoint)
+        self._setup()
 
-    def do(self):
+    def _setup(self):
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.charge_enable = False
+            self._test_box_half.gpio.discharge_enable = False
+
+    def do(self, frame: MeasurementFrame):
         # check for drained battery
         try:
-            gas_gauge_config = hex(self._test_box_half.gas_gauge.config_reg)
-            if gas_gauge_config == '0x3c':
+            if frame.sample and frame.sample.discharged:
                 self._test_box_half.gas_gauge.control_init()
                 self._test_box_half.gas_gauge.charge_init()
         except I2CError:
             pass
 
-    def next(self, flag):
+    def next(self, flag, frame: MeasurementFrame):
         if (flag == Flags.START_TEST) or (flag == Flags.START_SHORT_TEST):
             self.logger.info('starting test')
             self.teardown()
-            return PretestState(self._test_box_half)
+            return PretestState(self._test_box_half, self._context)
             
         elif flag == Flags.START_QUICKCHARGE:
             self.logger.info('starting quick(dis)charge')
 
-            global test_log
-            test_log = None
-
-            global charge_setpoint
+            self._context.test_log = None
+            self._context.last_log = None
             self.teardown()
 
-            if self._test_box_half.gas_gauge.charge_level < charge_setpoint:
-                return ChargeTestState(self._test_box_half,quickcharge=True)
+            if frame.sample:
+                charge_level = frame.sample.charge_level
+            else:
+                charge_level = self._test_box_half.gas_gauge.charge_level
+
+            if charge_level < self._context.charge_setpoint:
+                return ChargeTestState(self._test_box_half, self._context,quickcharge=True)
             else:
-                return DischargeTestState(self._test_box_half,quickcharge=True)
+                return DischargeTestState(self._test_box_half, self._context,quickcharge=True)
 
         elif flag == Flags.RESUME_TEST:
             self.logger.info('resuming test')
             self.teardown()
-            return ChargeTestState(self._test_box_half,quickcharge=True)
+            return ChargeTestState(self._test_box_half, self._context,quickcharge=True)
         # stay in state
         return self
 
     def teardown(self):
-        global done
-        global test_pass
-        done = False
-        test_pass = False
-        self._test_box_half.gpio.led_done_enable = False
-        self._test_box_half.gpio.led_error_enable = False
+        self._context.done = False
+        self._context.test_pass = False
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.led_done_enable = False
+            self._test_box_half.gpio.led_error_enable = False
         self._test_box_half.gas_gauge.control_auto()
 
+class ErrorState(IdleState):
+    """Idle after an aborted test, the error led stays on until cleared or
+    the next test is started
+    """
+    NAME = States.ERROR.value
+
+    def __init__(
+        self,
+        test_box_half: TestBoxHalf = None,
+        context: TestContext = None
+    ):
+        super().__init__(test_box_half, context)
+        self._context.test_pass = False
+
+    def _setup(self):
+        with self._test_box_half.gpio.batch():
+            super()._setup()
+            self._test_box_half.gpio.led_run_enable = False
+            self._test_box_half.gpio.led_error_enable = True
+
+    def next(self, flag, frame: MeasurementFrame):
+        if flag in (Flags.STOP, Flags.CLEAR):
+            self.logger.info('error cleared')
+            self.teardown()
+            return IdleState(self._test_box_half, self._context)
+        if flag is not None:
+            self._context.abort_reason = None
+        return super().next(flag, frame)
+
 class WaitState(State):
     NAME = States.WAIT.value
     STATE_TIMEOUT_TD = timedelta(seconds=10)
@@ -289,21 +528,63 @@ class WaitState(State):
     def __init__(
         self,
         test_box_half: TestBoxHalf = None,
+        context: TestContext = None,
         next_state: State = IdleState,
         charge_en = False,
-        discharge_en = False
+        discharge_en = False,
+        enable_delay_td: timedelta = timedelta(0)
     ):
-        super().__init__(test_box_half)
+        '''enable_delay_td keeps both outputs off for a while before
+        charge_en/discharge_en are applied, without blocking the tick
+        '''
+        super().__init__(test_box_half, context)
         self._next_state = next_state
-        self._test_box_half.gpio.charge_enable = charge_en
-        self._test_box_half.gpio.discharge_enable = discharge_en
+        self._charge_en = charge_en
+        self._discharge_en = discharge_en
+        self._enable_delay_td = enable_delay_td
+        self._outputs_set = False
+
+        if not enable_delay_td:
+            self._set_outputs()
+
+    def checkpoint(self) -> dict:
+        checkpoint = super().checkpoint()
+        checkpoint.update({
+            'next_state' : self._next_state.NAME,
+            'charge_en' : self._charge_en,
+            'discharge_en' : self._discharge_en,
+            'enable_delay_s' : self._enable_delay_td.total_seconds(),
+            'outputs_set' : self._outputs_set,
+        })
+        return checkpoint
+
+    def restore(self, checkpoint: dict):
+        super().restore(checkpoint)
+        self._next_state = STATE_CLASSES[checkpoint['next_state']]
+        self._charge_en = checkpoint['charge_en']
+        self._discharge_en = checkpoint['discharge_en']
+        self._enable_delay_td = timedelta(seconds=checkpoint['enable_delay_s'])
+        self._outputs_set = False
+        if checkpoint['outputs_set']:
+            self._set_outputs()
+
+    def do(self, frame: MeasurementFrame):
+        super().do(frame)
+        if not self._outputs_set and self._elapsed_time >= self._enable_delay_td:
+            self._set_outputs()
+
+    def _set_outputs(self):
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.charge_enable = self._charge_en
+            self._test_box_half.gpio.discharge_enable = self._discharge_en
+        self._outputs_set = True
     
-    def next(self, flag):
+    def next(self, flag, frame: MeasurementFrame):
         if self._elapsed_time > self.STATE_TIMEOUT_TD:
             self.logger.info('wait over')
-            return self._next_state(self._test_box_half)
+            return self._next_state(self._test_box_half, self._context)
 
-        default_next = super().next(flag)
+        default_next = super().next(flag, frame)
         if default_next is not None:
             return default_next
 
@@ -317,14 +598,27 @@ class PretestState(State):
     def __init__(
         self,
         test_box_half: TestBoxHalf = None,
+        context: TestContext = None,
     ):
-        super().__init__(test_box_half)
+        super().__init__(test_box_half, context)
+        self._setup()
+        self._delay_count = 0   
 
-        self._test_box_half.gas_gauge.control_auto()
-        self._test_box_half.gpio.discharge_enable = True
-        self._test_box_half.gpio.led_run_enable = True
+    def checkpoint(self) -> dict:
+        checkpoint = super().checkpoint()
+        checkpoint['delay_count'] = self._delay_count
+        return checkpoint
 
-        self._delay_count = 0   
+    def restore(self, checkpoint: dict):
+        super().restore(checkpoint)
+        self._setup()
+        self._delay_count = checkpoint['delay_count']
+
+    def _setup(self):
+        self._test_box_half.gas_gauge.control_auto()
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.discharge_enable = True
+            self._test_box_half.gpio.led_run_enable = True
 
     # def do(self):
     #     super().do()
@@ -334,8 +628,8 @@ class PretestState(State):
     #         self._last_read_time = time.time()
     #     except I2CError:
     #         pass
-    def do(self):
-        super().do()
+    def do(self, frame: MeasurementFrame):
+        super().do(frame)
         if self._delay_count >= self.DELAY:
             self._test_box_half.gpio.led_run_enable ^= 1
             self._delay_count = 0;
@@ -344,37 +638,38 @@ class PretestState(State):
 
         
 
-    def next(self, flag):
-        # read from gas gauge
-        try:
-            gas_gauge_config = self._test_box_half.gas_gauge.config_reg
-            voltage = self._test_box_half.gas_gauge.voltage_mV
-            voltage_lim = voltage < 5000
+    def next(self, flag, frame: MeasurementFrame):
+        sample = frame.sample
+        if sample is not None:
+            discharged = sample.discharged
+            voltage_lim = sample.voltage_mV < 5000
             read_timeout = False
-            self._last_read_time = datetime.now()
-        except I2CError:
-            gas_gauge_config = None
+            self._last_read_time = self._context.clock.now()
+        else:
+            discharged = False
             voltage_lim = False
-            delta_t = datetime.now() - self._last_read_time
+            delta_t = self._context.clock.now() - self._last_read_time
             read_timeout = delta_t > self.READ_TIMEOUT_TD
     
         
-        default_next = super().next(flag)
+        default_next = super().next(flag, frame)
 
         if default_next is not None:
             return default_next
         elif read_timeout:
             self.logger.warning('i2c read timeout')
             super().teardown()
-            return IdleState(self._test_box_half)
-        elif gas_gauge_config == '0x3c' or voltage_lim:
+            return IdleState(self._test_box_half, self._context)
+        elif discharged or voltage_lim:
             self.logger.info('battery discharged')    
-            self._test_box_half.gpio.discharge_enable = False
-            self._test_box_half.gpio.charge_enable = True
+            with self._test_box_half.gpio.batch():
+                self._test_box_half.gpio.discharge_enable = False
+                self._test_box_half.gpio.charge_enable = True
             self._test_box_half.gas_gauge.control_auto()
             self._test_box_half.gas_gauge.charge_init()
             return WaitState(
                 self._test_box_half,
+                self._context,
                 ChargeTestState,
                 charge_en = True)
 
@@ -387,145 +682,223 @@ class ChargeTestState(LogState):
     def __init__(
         self,
         test_box_half: TestBoxHalf = None,
+        context: TestContext = None,
         quickcharge = False
     ):
-        super().__init__(test_box_half)
-        self._test_box_half.gpio.charge_enable = True
-        self._test_box_half.gpio.led_run_enable = True
+        super().__init__(test_box_half, context)
         self._quickcharge = quickcharge
+        self._setup()
 
         if not quickcharge:
-            global test_log
-            test_log = TestLog()
-
-
-    def do(self):
-        # sample and record data
-        super().do()
-
-    def next(self, flag):
-        global charge_test_level
+            self._context.abort_reason = None
+            self._context.test_log = TestLog(
+                box_id=self._test_box_half.box_id,
+                clock=self._context.clock,
+                limit_persistence=self._context.limit_persistence,
+                binary=self._context.binary_log,
+                calibration=self._test_box_half.gas_gauge.calibration)
+
+    def checkpoint(self) -> dict:
+        checkpoint = super().checkpoint()
+        checkpoint['quickcharge'] = self._quickcharge
+        return checkpoint
+
+    def restore(self, checkpoint: dict):
+        super().restore(checkpoint)
+        self._quickcharge = checkpoint['quickcharge']
+        self._setup()
+
+    def _setup(self):
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.charge_enable = True
+            self._test_box_half.gpio.led_run_enable = True
 
+        # end of charge is signalled by the gauge charge high alert, polled
+        # from the charge level if the threshold could not be programmed
+        gas_gauge = self._test_box_half.gas_gauge
         try:
-            level_limit = self._test_box_half.gas_gauge.charge_level >= charge_test_level
+            gas_gauge.set_charge_thresholds(
+                high_level=self._context.charge_test_level)
+            gas_gauge.clear_alerts()
+            self._thresholds_set = True
+        except I2CError as e:
+            self.logger.warning(f'unable to set charge threshold: {e!r}')
+            self._thresholds_set = False
+
+    def do(self, frame: MeasurementFrame):
+        # record data
+        super().do(frame)
+
+    def next(self, flag, frame: MeasurementFrame):
+        sample = frame.sample
+        if sample is not None:
+            if self._thresholds_set:
+                level_limit = Alert.CHARGE_HIGH in sample.alerts
+            else:
+                level_limit = \
+                    sample.charge_level >= self._context.charge_test_level
             read_timeout = False
-            self._last_read_time = datetime.now()
-            # current_limit = abs(self._test_box_half.gas_gauge.current_mA) < 25
-        except I2CError:
+            # current_limit = abs(sample.current_mA) < 25
+        else:
             level_limit = False
-            delta_t = datetime.now() - self._last_read_time
+            delta_t = self._context.clock.now() - self._last_read_time
             read_timeout = delta_t > self.STATE_TIMEOUT_TD
 
-        default_next = super().next(flag)
+        default_next = super().next(flag, frame)
         if default_next is not None:
             return default_next
         elif read_timeout:
             self.logger.warning('test timeout')
             self.teardown()
-            return IdleState(self._test_box_half)
+            return IdleState(self._test_box_half, self._context)
         elif level_limit:
             if self._quickcharge:
                 self.logger.info('quickcharge done')
                 self.teardown()
-                return IdleState(self._test_box_half)
+                return IdleState(self._test_box_half, self._context)
             else:
                 self.logger.info('wait before discharge test')
                 self.teardown()
-                sleep(1)
                 return WaitState(
                     self._test_box_half,
+                    self._context,
                     DischargeTestState,
-                    discharge_en = True)
+                    discharge_en = True,
+                    enable_delay_td = self.SWITCH_DELAY_TD)
 
         return self
 
     def teardown(self):
-        self._test_box_half.gpio.charge_enable = False
-        self._test_box_half.gpio.led_run_enable = False
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.charge_enable = False
+            self._test_box_half.gpio.led_run_enable = False
 
 class DischargeTestState(LogState):
     STATE_TIMEOUT_TD = timedelta(hours=1)
     NAME = States.DISCHARGE_TEST.value
+    VOLTAGE_LIMIT_mV = 10000
 
     def __init__(
         self,
         test_box_half: TestBoxHalf = None,
+        context: TestContext = None,
         quickcharge = False
     ):
-        super().__init__(test_box_half)
-        self._test_box_half.gpio.discharge_enable = True
+        super().__init__(test_box_half, context)
         self._voltage_lim_debounce = 0
         self._current_lim_debounce = 0
         self._quickcharge = quickcharge
-        self._state_start_time = datetime.now()
+        self._state_start_time = self._context.clock.now()
+        self._setup()
+
+    def checkpoint(self) -> dict:
+        checkpoint = super().checkpoint()
+        checkpoint.update({
+            'quickcharge' : self._quickcharge,
+            'voltage_lim_debounce' : self._voltage_lim_debounce,
+            'current_lim_debounce' : self._current_lim_debounce,
+        })
+        return checkpoint
+
+    def restore(self, checkpoint: dict):
+        super().restore(checkpoint)
+        self._quickcharge = checkpoint['quickcharge']
+        self._voltage_lim_debounce = checkpoint['voltage_lim_debounce']
+        self._current_lim_debounce = checkpoint['current_lim_debounce']
+        self._state_start_time = self._start_time
+        self._setup()
+
+    def _setup(self):
+        self._test_box_half.gpio.discharge_enable = True
 
-    def do(self):
-        super().do()
-        self._test_box_half.gpio.led_run_enable ^= 1  
+        # low voltage (and the quick discharge level) are signalled by gauge
+        # alerts, polled from the sample if the thresholds could not be
+        # programmed.  Idle current is a window the gauge can only alert
+        # outside of so it stays a software check
+        charge_test_level = self._context.charge_test_level
+        gas_gauge = self._test_box_half.gas_gauge
+        try:
+            gas_gauge.set_voltage_thresholds(low_mV=self.VOLTAGE_LIMIT_mV)
+            gas_gauge.set_charge_thresholds(
+                low_level=charge_test_level if self._quickcharge else None)
+            gas_gauge.clear_alerts()
+            self._thresholds_set = True
+        except I2CError as e:
+            self.logger.warning(f'unable to set discharge thresholds: {e!r}')
+            self._thresholds_set = False
 
-    def next(self, flag):
-        global charge_test_level
+    def do(self, frame: MeasurementFrame):
+        super().do(frame)
+        self._test_box_half.gpio.led_run_enable ^= 1  
 
-        try:
+    def next(self, flag, frame: MeasurementFrame):
+        sample = frame.sample
+        if sample is not None:
             # low voltage
-            if abs(self._test_box_half.gas_gauge.voltage_mV) < 10000:
+            if self._thresholds_set:
+                low_voltage = Alert.VOLTAGE in sample.alerts
+            else:
+                low_voltage = abs(sample.voltage_mV) < self.VOLTAGE_LIMIT_mV
+            if low_voltage:
                 self._voltage_lim_debounce += 1
             else:
                 self._voltage_lim_debounce = 0
             voltage_limit = self._voltage_lim_debounce > 10
 
             # idle current (fully discharged)
-            if abs(self._test_box_half.gas_gauge.current_mA) < 25:
+            if abs(sample.current_mA) < 25:
                 self._current_lim_debounce += 1
             else:
                 self._current_lim_debounce = 0
             current_limit = self._current_lim_debounce > 10
 
-            if self._quickcharge:
-                level_limit = self._test_box_half.gas_gauge.charge_level <= charge_test_level
+            if self._quickcharge and self._thresholds_set:
+                level_limit = Alert.CHARGE_LOW in sample.alerts
+            elif self._quickcharge:
+                level_limit = \
+                    sample.charge_level <= self._context.charge_test_level
             else:
                 level_limit = False
 
-            discharged = self._test_box_half.gas_gauge.config_reg == 0x3C
+            discharged = sample.discharged
             read_timeout = False
-
-            self._last_read_time = datetime.now()
-        except I2CError:
-            self.logger.warning(I2CError)
+        else:
             self._current_lim_debounce = 0
-            voltage_lim = False
+            voltage_limit = False
             current_limit = False
             level_limit = False
             discharged = False
-            delta_t = datetime.now() - self._last_read_time
+            delta_t = self._context.clock.now() - self._last_read_time
             read_timeout = delta_t > self.READ_TIMEOUT_TD
 
-        default_next = super().next(flag)
+        default_next = super().next(flag, frame)
         if default_next is not None:
             return default_next
         elif read_timeout:
             self.logger.warning('test timeout')
             self.teardown()
-            return IdleState(self._test_box_half)
+            return IdleState(self._test_box_half, self._context)
         elif voltage_limit or current_limit or discharged or level_limit:
             if self._quickcharge:
                 self.logger.info('quickcharge complete')
                 self.teardown()
-                return IdleState(self._test_box_half)
+                return IdleState(self._test_box_half, self._context)
             else:
                 self.logger.info('battery discharged')
                 self.teardown()
-                sleep(1)
                 return WaitState(
                     self._test_box_half,
+                    self._context,
                     PostTestState,
-                    charge_en = True)
+                    charge_en = True,
+                    enable_delay_td = self.SWITCH_DELAY_TD)
 
         return self
 
     def teardown(self):
-        self._test_box_half.gpio.discharge_enable = False
-        self._test_box_half.gpio.led_run_enable = False
+        with self._test_box_half.gpio.batch():
+            self._test_box_half.gpio.discharge_enable = False
+            self._test_box_half.gpio.led_run_enable = False
 
 # class QuickchargeState(LogState):
 #     STATE_TIMEOUT_TD = 4 * 60 * 60    # 4 hours
@@ -622,48 +995,60 @@ class PostTestState(State):
     def __init__(
         self,
         test_box_half: TestBoxHalf = None,
+        context: TestContext = None,
         quickcharge = False
     ):
-        super().__init__(test_box_half)
+        super().__init__(test_box_half, context)
         self._test_box_half.gas_gauge.control_init()
         self._test_box_half.gas_gauge.charge_init()
         self._test_box_half.gpio.charge_enable = True
 
-        global test_log
-        global test_pass
         self.logger.info('test pass fail check')
-        test_pass = test_log.test_pass()
+        self._context.test_pass = self._context.test_log.test_pass()
+        self._context.finish_log()
+
+    def restore(self, checkpoint: dict):
+        # charge level and verdict carry over, only the charger is restored
+        super().restore(checkpoint)
+        self._test_box_half.gpio.charge_enable = True
 
-    def do(self):
+    def do(self, frame: MeasurementFrame):
         # gas_gauge = self._test_box_half.gas_gauge.get_all()
         # print(gas_gauge)
-        global test_pass
-        if test_pass:
+        if self._context.test_pass:
             self._test_box_half.gpio.led_done_enable ^= 1
         else:
             self._test_box_half.gpio.led_error_enable ^= 1
 
-    def next(self, flag):
-        global charge_setpoint
-
+    def next(self, flag, frame: MeasurementFrame):
         if flag == Flags.STOP:
             # print('CHARGE_TEST stopped')
             self.logger.info('test stopped')
             self._test_box_half.gpio.charge_enable = False
-            return IdleState(self._test_box_half)
-        if self._test_box_half.gas_gauge.charge_level > charge_setpoint:
+            return IdleState(self._test_box_half, self._context)
+        if frame.sample and frame.sample.charge_level > self._context.charge_setpoint:
             # print('TEST DONE')
             self._test_box_half.gas_gauge.control_init()
-            self._test_box_half.gpio.charge_enable = False
             self.logger.info('storage charge level reached')
-            global test_pass
-            if test_pass:
-                self._test_box_half.gpio.led_done_enable = True
-            else:
-                self._test_box_half.gpio.led_error_enable = True
-
-            return IdleState(self._test_box_half)
+            with self._test_box_half.gpio.batch():
+                self._test_box_half.gpio.charge_enable = False
+                if self._context.test_pass:
+                    self._test_box_half.gpio.led_done_enable = True
+                else:
+                    self._test_box_half.gpio.led_error_enable = True
+
+            return IdleState(self._test_box_half, self._context)
         return self
 
+# checkpointed states by name
+STATE_CLASSES = {state.NAME : state for state in (
+    IdleState,
+    ErrorState,
+    WaitState,
+    PretestState,
+    ChargeTestState,
+    DischargeTestState,
+    PostTestState)}
+
 # class State(State):
 #     name = States.PRECHARGE.value
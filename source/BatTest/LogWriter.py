@@ -0,0 +1,230 @@
+'''
+Background writer for csv and binary test logs.
+
+The sampling loop only queues rows, one writer thread keeps the log files
+open and writes them, so disk latency never holds up the I2C loop.  Files
+are flushed every flush_rows rows, every flush_period_s seconds or when a
+flush is requested, e.g. on a state transition, and optionally fsynced.
+'''
+
+# standard library
+import os
+import csv
+import time
+import queue
+import atexit
+import logging
+import threading
+
+# external packages
+
+# internal packages
+
+class LogWriter(object):
+    """Writer thread shared by any number of test logs
+
+    :param flush_rows: rows written to a file before it is flushed
+    :param flush_period_s: longest time a written row stays unflushed
+    :param fsync: fsync files on every flush, for durability over speed
+    :param max_queued: queue length, writers block when it is full
+    :param idle_close_s: files without rows for this long are closed
+    """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(
+        self,
+        flush_rows: int = 60,
+        flush_period_s: float = 5.0,
+        fsync: bool = False,
+        max_queued: int = 10000,
+        idle_close_s: float = 300.0):
+
+        self.logger = logging.getLogger('batman.BatTest.LogWriter.LogWriter')
+        self.flush_rows = flush_rows
+        self.flush_period_s = flush_period_s
+        self.fsync = fsync
+        self.idle_close_s = idle_close_s
+
+        self._queue = queue.Queue(max_queued)
+        self._files = {}        # fname : _OpenFile, writer thread only
+        self._offsets = {}      # fname : bytes flushed
+        self._num_errors = 0
+        self._num_blocked = 0
+        self._checked_at = time.monotonic()
+
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name='log_writer')
+        self._thread.start()
+
+    @classmethod
+    def default(cls) -> 'LogWriter':
+        '''Writer shared by all logs not given their own, stopped at exit'''
+        with cls._default_lock:     # logs are built on per box threads
+            if cls._default is None:
+                cls._default = cls()
+                atexit.register(cls._default.stop)
+        return cls._default
+
+    # API
+    @property
+    def num_errors(self) -> int:
+        return self._num_errors
+
+    @property
+    def num_blocked(self) -> int:
+        '''rows that had to wait for room in a full queue'''
+        return self._num_blocked
+
+    def offset(self, fname: str) -> int:
+        '''bytes of fname known to be flushed'''
+        return self._offsets.get(fname, 0)
+
+    def write_rows(self, fname: str, rows: list, truncate: bool = False):
+        self._put(('rows', fname, rows, truncate))
+
+    def write_row(self, fname: str, row: list):
+        self._put(('rows', fname, [row], False))
+
+    def write_bytes(
+        self,
+        fname: str,
+        data: bytes,
+        rows: int = 1,
+        truncate: bool = False):
+        '''write data to binary file fname, counted as rows towards flushes'''
+        self._put(('bytes', fname, data, rows, truncate))
+
+    def flush(self, fname: str = None):
+        '''request a flush of fname, or of every file'''
+        self._put(('flush', fname))
+
+    def close(self, fname: str):
+        self._put(('close', fname))
+
+    def sync(self, flush: bool = True):
+        '''wait until all queued rows are written, and flushed if flush'''
+        if flush:
+            self.flush()
+        self._queue.join()
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._put(None)
+            self._thread.join()
+
+    # helper methods
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._num_blocked += 1
+            self.logger.warning('log queue full, sampling waits for the disk')
+            self._queue.put(item)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._timeout())
+            except queue.Empty:
+                self._periodic()
+                continue
+
+            try:
+                if item is None:
+                    for fname in list(self._files):
+                        self._close(fname)
+                    return
+                self._handle(item)
+                if time.monotonic() - self._checked_at >= 1.0:
+                    self._periodic()
+            except OSError as e:
+                self._num_errors += 1
+                self.logger.error(f'log write failed: {e!r}')
+            finally:
+                self._queue.task_done()
+
+    def _handle(self, item: tuple):
+        command, fname = item[:2]
+        if command == 'rows':
+            _, _, rows, truncate = item
+            if truncate:
+                self._close(fname)
+            log_file = self._open(fname, 'w' if truncate else 'a')
+            log_file.writer.writerows(rows)
+            self._written(fname, log_file, len(rows))
+        elif command == 'bytes':
+            _, _, data, rows, truncate = item
+            if truncate:
+                self._close(fname)
+            log_file = self._open(fname, 'wb' if truncate else 'ab')
+            log_file.file.write(data)
+            self._written(fname, log_file, rows)
+        elif command == 'flush':
+            for fname in [fname] if fname else list(self._files):
+                self._flush(fname)
+        elif command == 'close':
+            self._close(fname)
+
+    def _open(self, fname: str, mode: str) -> '_OpenFile':
+        log_file = self._files.get(fname)
+        if log_file is None:
+            if 'b' in mode:
+                log_file = _OpenFile(open(fname, mode), binary=True)
+            else:
+                log_file = _OpenFile(open(fname, mode, newline=''))
+            self._files[fname] = log_file
+            self._offsets[fname] = log_file.file.tell()
+        return log_file
+
+    def _written(self, fname: str, log_file: '_OpenFile', rows: int):
+        log_file.rows += rows
+        log_file.written_at = time.monotonic()
+        if log_file.rows >= self.flush_rows:
+            self._flush(fname)
+
+    def _flush(self, fname: str):
+        log_file = self._files.get(fname)
+        if log_file is None or not log_file.rows:
+            return
+        log_file.file.flush()
+        if self.fsync:
+            os.fsync(log_file.file.fileno())
+        log_file.rows = 0
+        log_file.flushed_at = time.monotonic()
+        self._offsets[fname] = log_file.file.tell()
+
+    def _close(self, fname: str):
+        log_file = self._files.get(fname)
+        if log_file is None:
+            return
+        try:
+            self._flush(fname)
+        finally:
+            del self._files[fname]
+            log_file.file.close()
+
+    def _periodic(self):
+        now = time.monotonic()
+        self._checked_at = now
+        for fname, log_file in list(self._files.items()):
+            if log_file.rows and now - log_file.flushed_at >= self.flush_period_s:
+                self._flush(fname)
+            elif now - log_file.written_at >= self.idle_close_s:
+                self._close(fname)
+
+    def _timeout(self) -> float:
+        return self.flush_period_s if self._files else None
+
+class _OpenFile(object):
+    """Open log file with its csv writer and unflushed row count
+
+    Binary files have no csv writer.
+    """
+    __slots__ = ('file', 'writer', 'rows', 'flushed_at', 'written_at')
+
+    def __init__(self, file, binary: bool = False):
+        self.file = file
+        self.writer = None if binary else csv.writer(file)
+        self.rows = 0
+        self.flushed_at = self.written_at = time.monotonic()
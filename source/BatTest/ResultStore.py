@@ -0,0 +1,151 @@
+'''
+Columnar in-memory store of logged test results.
+
+Every result key gets one typed array of doubles instead of one dict per
+sample.  Columns grow a chunk of rows at a time and can be viewed without
+copying, as memoryviews or, with numpy installed, as arrays.
+'''
+
+# standard library
+from __future__ import annotations
+from array import array
+from datetime import timedelta
+import math
+
+# external packages
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# internal packages
+
+class ResultStore(object):
+    """Typed column per result key, rows are read back as dicts
+
+    Values that are not numbers (missing or unparsable cells) are stored as
+    NaN, timedeltas and 'H:MM:SS' strings as seconds.
+
+    :param keys: result keys, one column each
+    :param timedelta_keys: columns read back as timedelta in row views
+    :param chunk_rows: rows added to every column when it is full
+    """
+    CHUNK_ROWS = 3600   # an hour at 1 Hz
+
+    def __init__(
+        self,
+        keys: list,
+        timedelta_keys: tuple = (),
+        chunk_rows: int = CHUNK_ROWS):
+
+        self._keys = list(keys)
+        self._timedelta_keys = set(timedelta_keys)
+        self._chunk_rows = chunk_rows
+        self._columns = {key : array('d') for key in self._keys}
+        self._len = 0
+        self._capacity = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self.row(i)
+
+    def __getitem__(self, i: int) -> dict:
+        return self.row(i)
+
+    # API
+    @property
+    def keys(self) -> list:
+        return list(self._keys)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def nbytes(self) -> int:
+        '''memory held by the column buffers'''
+        return sum(column.itemsize * len(column)
+            for column in self._columns.values())
+
+    def append(self, result: dict):
+        if self._len == self._capacity:
+            self._grow()
+
+        i = self._len
+        for key, column in self._columns.items():
+            column[i] = self._to_float(result.get(key))
+        self._len += 1
+
+    def extend(self, columns: dict):
+        '''append rows given as one sequence of floats per key'''
+        num_rows = len(next(iter(columns.values()), []))
+        while self._capacity < self._len + num_rows:
+            self._grow()
+
+        end = self._len + num_rows
+        for key, column in self._columns.items():
+            values = columns.get(key)
+            if values is None:
+                values = [math.nan] * num_rows
+            column[self._len:end] = array('d', values)
+        self._len = end
+
+    def values(self, i: int) -> list:
+        '''row i as floats in key order'''
+        i = self._index(i)
+        return [column[i] for column in self._columns.values()]
+
+    def row(self, i: int) -> dict:
+        i = self._index(i)
+        row = {}
+        for key, column in self._columns.items():
+            value = column[i]
+            if key in self._timedelta_keys and not math.isnan(value):
+                value = timedelta(seconds=value)
+            row[key] = value
+        return row
+
+    def column(self, key: str) -> memoryview:
+        '''zero copy view of a column, it does not see rows added later'''
+        return memoryview(self._columns[key])[:self._len]
+
+    def ndarray(self, key: str):
+        '''zero copy numpy view of a column'''
+        if np is None:
+            raise ImportError('numpy is needed for ndarray column views')
+        return np.frombuffer(self.column(key), dtype=np.float64)
+
+    # helper methods
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('result index out of range')
+        return i
+
+    def _grow(self):
+        # a new buffer per chunk instead of resizing in place, so column
+        # views handed out earlier stay valid
+        capacity = self._capacity + self._chunk_rows
+        for key, column in self._columns.items():
+            grown = array('d', bytes(capacity * column.itemsize))
+            grown[:self._len] = column[:self._len]
+            self._columns[key] = grown
+        self._capacity = capacity
+
+    @staticmethod
+    def _to_float(value) -> float:
+        if isinstance(value, timedelta):
+            return value.total_seconds()
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            pass
+        try:
+            h, m, s = str(value).split(':')
+            return 3600 * int(h) + 60 * int(m) + float(s)
+        except ValueError:
+            return math.nan
@@ -3,13 +3,21 @@ from __future__ import annotations
 from enum import Enum
 import time
 from datetime import datetime, timedelta
+import os
 import csv
 import sys
+import logging
 from collections import deque
+from dataclasses import asdict
 
 # external packages
 
 # internal packages
+from source.BatTest.Clock import SystemClock
+from source.BatTest.LogWriter import LogWriter
+from source.BatTest.ResultStore import ResultStore
+from source.BatTest import BinaryLog
+from source.BatTest.BinaryLog import BINLOG_EXT
 
 # constants
 csv_headers = [
@@ -61,43 +69,327 @@ dischrg_lims = {
 }
 
 test_lims = [prechrg_lims, const_i_lims, const_v_lims, dischrg_lims]
+phase_names = ['precharge', 'const_i', 'const_v', 'discharge']
+
+# samples left out at the start of each phase and at the end of the log
+PHASE_START_MARGINS = [10, 10, 10, 50]
+PHASE_END_MARGIN = 10
+LOG_END_MARGIN = 3
+
+# consecutive out of limit samples that abort a test, 0 disables the check
+LIMIT_PERSISTENCE = 30
 
 PRECHRG_END_VFB_THRESH_mV = 1550*235/30  # VFB = Vbat(mV) * 30k/(205k + 30k)
 DISCHRG_I_THRESH_mA = -50
 
 
+class PhaseStats(object):
+    """Running min/max/avg of current and voltage over one test phase"""
+    __slots__ = ('count', 'i_min', 'i_max', 'i_sum', 'v_min', 'v_max', 'v_sum',
+        'invalid')
+
+    def __init__(self):
+        self.count = 0
+        self.i_min = self.v_min = float('inf')
+        self.i_max = self.v_max = float('-inf')
+        self.i_sum = self.v_sum = 0.0
+        self.invalid = False    # a sample had a missing value
+
+    def add(self, current, voltage):
+        try:
+            self.i_min = min(self.i_min, current)
+            self.i_max = max(self.i_max, current)
+            self.i_sum += current
+            self.v_min = min(self.v_min, voltage)
+            self.v_max = max(self.v_max, voltage)
+            self.v_sum += voltage
+        except TypeError:
+            self.invalid = True
+        self.count += 1
+
+    def merged(self, samples) -> PhaseStats:
+        '''copy with (current, voltage) samples added'''
+        stats = PhaseStats()
+        for name in self.__slots__:
+            setattr(stats, name, getattr(self, name))
+        for current, voltage in samples:
+            stats.add(current, voltage)
+        return stats
+
+    @property
+    def i_stats(self) -> dict:
+        if self.count and not self.invalid:
+            return {'min' : self.i_min, 'max' : self.i_max,
+                'avg' : self.i_sum / self.count}
+
+    @property
+    def v_stats(self) -> dict:
+        if self.count and not self.invalid:
+            return {'min' : self.v_min, 'max' : self.v_max,
+                'avg' : self.v_sum / self.count}
+
+class PhaseTracker(object):
+    """Streaming test phase detection and per phase limit statistics
+
+    Samples are fed one at a time as they are logged.  Phase boundaries are
+    detected like the original batch pass over the whole log, and a sample
+    is only added to its phase's statistics once PHASE_END_MARGIN newer
+    samples have arrived, so the samples just before a boundary are left
+    out as before.  The verdict is the batch verdict for any log in which
+    all four boundaries are found.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger('batman.BatTest.TestLog.PhaseTracker')
+        self._index = -1
+
+        # phase start markers, -1 until found
+        self._starts = [-1, -1, -1, -1]
+        self._stats = [PhaseStats() for _ in test_lims]
+
+        # samples not yet old enough to be assigned to a phase
+        self._pending = deque()
+
+        # boundary detection
+        self._current_prev = 0
+        self._i_avg = 0
+        self._i_avg_samples = 0
+        self._i_rolling = deque([None] * 10, maxlen=10)
+        self._i_discharge = deque([0] * 5, maxlen=5)
+
+    # API
+    @property
+    def phase(self) -> int:
+        '''index into phase_names of the phase the last sample is in'''
+        started = [i for i, start in enumerate(self._starts[1:], 1) if start >= 0]
+        return started[-1] if started else 0
+
+    @property
+    def phase_starts(self) -> list:
+        return list(self._starts)
+
+    @property
+    def index(self) -> int:
+        '''index of the last sample'''
+        return self._index
+
+    def add(self, result: dict):
+        self._index += 1
+        index = self._index
+        current = result.get('bat_current_mA', None)
+        voltage = result.get('bat_voltage_mV', None)
+
+        if '' not in result.values() and index >= len(csv_headers) \
+                and self._starts[3] < 0:
+            self._detect(index, result.get('bat_current_mA', 0),
+                result.get('bat_voltage_mV', 0))
+
+        self._pending.append((index, current, voltage))
+        while self._pending and self._pending[0][0] <= index - PHASE_END_MARGIN:
+            self._assign(*self._pending.popleft())
+
+    def stats(self, final: bool = False) -> list:
+        '''PhaseStats of every phase
+
+        :param final: the log is complete, the discharge phase also gets
+            the pending samples up to LOG_END_MARGIN from the end
+        '''
+        stats = list(self._stats)
+        start = self._starts[3]
+        if final and start >= 0:
+            last = self._index - LOG_END_MARGIN
+            stats[3] = stats[3].merged((current, voltage) \
+                for index, current, voltage in self._pending \
+                if start + PHASE_START_MARGINS[3] <= index <= last)
+        return stats
+
+    def violations(self, final: bool = False) -> list[str]:
+        '''Limit violations, a partial verdict unless final
+
+        A final verdict also fails phases without samples, a partial one
+        only checks the phases that have samples so far.
+        '''
+        violations = []
+        for i, (stats, limit) in enumerate(zip(self.stats(final), test_lims)):
+            if not stats.count and not final:
+                continue
+            i_stats = stats.i_stats
+            v_stats = stats.v_stats
+            if i_stats is None or v_stats is None:
+                violations.append(f'no valid samples {i}')
+                continue
+            if i_stats['min'] < limit['i_min']:
+                violations.append(f'i_lim min {i} {i_stats}')
+            if i_stats['max'] > limit['i_max']:
+                violations.append(f'i_lim max {i} {i_stats}')
+            if v_stats['min'] < limit['v_min']:
+                violations.append(f'v_lim min {i} {v_stats}')
+            if v_stats['max'] > limit['v_max']:
+                violations.append(f'v_lim max {i} {v_stats}')
+        return violations
+
+    # helper methods
+    def _detect(self, index: int, current: float, voltage: float):
+        starts = self._starts
+
+        # start of precharge, samples before it leave the precharge phase
+        if starts[0] < 0:
+            if current > 0 and self._current_prev < 0:
+                self._start_phase(0, index)
+                self._stats[0] = PhaseStats()
+            self._current_prev = current
+
+        # start of constant current
+        if voltage > PRECHRG_END_VFB_THRESH_mV and starts[1] < 0:
+            self._start_phase(1, index)
+
+        # start of constant voltage, current falls below its average
+        if starts[1] > 0 and starts[2] < 0:
+            self._i_avg = (self._i_avg_samples * self._i_avg + current) \
+                / (self._i_avg_samples + 1)
+            self._i_avg_samples += 1
+
+            self._i_rolling.append(current)
+            try:
+                i_rolling_avg = sum(self._i_rolling) / len(self._i_rolling)
+            except TypeError:
+                i_rolling_avg = self._i_avg
+
+            if self._i_avg - i_rolling_avg > 10:
+                self._start_phase(2, index)
+
+        # start of discharge
+        if starts[2] > 0 and starts[3] < 0:
+            if all(current < 0 for current in self._i_discharge):
+                self._start_phase(3, index)
+            else:
+                self._i_discharge.append(current)
+
+    def _start_phase(self, phase: int, index: int):
+        self._starts[phase] = index
+        self.logger.info(f'{phase_names[phase]} start {index}')
+
+    def _assign(self, index: int, current: float, voltage: float):
+        '''add a sample to the phase it is in, if not in a margin'''
+        starts = self._starts
+        for phase in range(len(starts) - 1, -1, -1):
+            start = starts[phase]
+            if phase == 0 and start < 0:
+                start = -1  # precharge without a sign change starts the log
+            elif start < 0:
+                continue
+
+            if index < start + PHASE_START_MARGINS[phase]:
+                return
+            ended = phase + 1 < len(starts) and starts[phase + 1] >= 0
+            if not ended:
+                self._stats[phase].add(current, voltage)
+            return
+
+class LimitMonitor(object):
+    """Live check of every sample against the limits of its phase
+
+    Samples in the start margin of a phase are not checked, and a limit has
+    to be violated by `persistence` consecutive samples, which rides out
+    the few samples of a new phase seen before its boundary is detected.
+    """
+    def __init__(self, persistence: int = LIMIT_PERSISTENCE):
+        self.persistence = persistence
+        self._count = 0
+        self._violation = None
+
+    @property
+    def violation(self) -> str:
+        '''first persistent violation, None while within limits'''
+        return self._violation
+
+    def checkpoint(self) -> dict:
+        return {'count' : self._count, 'violation' : self._violation}
+
+    def restore(self, checkpoint: dict):
+        self._count = checkpoint['count']
+        self._violation = checkpoint['violation']
+
+    def check(self, tracker: PhaseTracker, current, voltage):
+        if self._violation or not self.persistence:
+            return
+
+        phase = tracker.phase
+        start = tracker.phase_starts[phase]
+        if tracker.index - start < PHASE_START_MARGINS[phase]:
+            self._count = 0
+            return
+
+        limit = test_lims[phase]
+        try:
+            if current < limit['i_min']:
+                violation = f'current {current:.0f} mA below {limit["i_min"]}'
+            elif current > limit['i_max']:
+                violation = f'current {current:.0f} mA above {limit["i_max"]}'
+            elif voltage < limit['v_min']:
+                violation = f'voltage {voltage:.0f} mV below {limit["v_min"]}'
+            elif voltage > limit['v_max']:
+                violation = f'voltage {voltage:.0f} mV above {limit["v_max"]}'
+            else:
+                violation = None
+        except TypeError:   # missing value
+            return
+
+        if violation is None:
+            self._count = 0
+            return
+        self._count += 1
+        if self._count >= self.persistence:
+            self._violation = f'{phase_names[phase]}: {violation} ' \
+                f'for {self._count} samples'
+
 class TestLog(object):
     def __init__(
         self,
         fname: str = None,
         load: bool = False,
-        box_id: str = ''):
-
-        self._results = []
+        box_id: str = '',
+        clock = None,
+        limit_persistence: int = LIMIT_PERSISTENCE,
+        writer: LogWriter = None,
+        binary: bool = False,
+        calibration = None):
+        '''binary logs use BinaryLog, a given fname selects by its extension'''
+
+        self._clock = clock if clock else SystemClock()
+        self._writer = writer if writer else LogWriter.default()
+        self._results = self._new_store()
         self._t_elapsed_ms = 0
 
         self._box_id = box_id
+        self._calibration = calibration
+        self._header = None     # binary log header
+        self._record = BinaryLog.record_struct(result_keys)
 
-        # test phase markers
-        self._prechrg_start_idx = -1
-        self._const_i_start_idx = -1
-        self._const_v_start_idx = -1
-        self._dischrg_start_idx = -1
-
+        # test phases, updated with every result
+        self._tracker = PhaseTracker()
+        self._monitor = LimitMonitor(limit_persistence)
 
         if fname:
             self._fname = fname
         else:
             self._fname = f'test_results\\battery_test_' \
                 f'box_{self._box_id}_'\
-                f'{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.csv'
+                f'{self._clock.now().strftime("%Y-%m-%d_%H-%M-%S")}' \
+                f'{BINLOG_EXT if binary else ".csv"}'
+        self._binary = self._fname.endswith(BINLOG_EXT)
 
         if load:
             # load from existing file
-            self.csv_read_all()
+            if self._binary:
+                self.bin_read_all()
+            else:
+                self.csv_read_all()
         else:
             # start log file
-            self.csv_header_write()
+            if self._binary:
+                self.bin_header_write()
+            else:
+                self.csv_header_write()
 
         
 
@@ -106,21 +398,143 @@ class TestLog(object):
         result_row = [*result_dict.values()]
 
         self._results.append(result_dict)
-        with open(self._fname, 'a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(result_row)
+        self._tracker.add(result_dict)
+        self._monitor.check(self._tracker, result_dict.get('bat_current_mA'),
+            result_dict.get('bat_voltage_mV'))
+        if self._binary:
+            self._writer.write_bytes(self._fname,
+                self._record.pack(*self._results.values(-1)))
+        else:
+            self._writer.write_row(self._fname, result_row)
+
+    def flush(self, wait: bool = False):
+        '''Flush the rows written so far, e.g. on a state transition
+
+        :param wait: block until the rows are on disk
+        '''
+        self._writer.flush(self._fname)
+        if wait:
+            self._writer.sync()
+
+    @classmethod
+    def resume(
+        cls,
+        fname: str,
+        offset: int,
+        clock = None,
+        limit_persistence: int = LIMIT_PERSISTENCE,
+        writer: LogWriter = None,
+        box_id: str = '',
+        calibration = None,
+        monitor: dict = None
+    ) -> TestLog:
+        '''Reopen a log after a restart and keep appending to it
+
+        Rows written after the checkpoint at offset are kept, a row torn
+        by the crash is cut off.  monitor is the live limit check state
+        from checkpoint().
+        '''
+        writer = writer if writer else LogWriter.default()
+        writer.close(fname)     # only open when the crash was a stopped FSM
+        writer.sync()
+
+        if os.path.getsize(fname) < offset:
+            logging.getLogger('batman.BatTest.TestLog.TestLog').warning(
+                f'{fname} is shorter than its checkpoint offset {offset}')
+        if fname.endswith(BINLOG_EXT):
+            BinaryLog.truncate_torn(fname)
+        else:
+            with open(fname, 'rb+') as file:
+                file.truncate(file.read().rfind(b'\n') + 1)
+
+        test_log = cls(fname, load=True, box_id=box_id, clock=clock,
+            limit_persistence=limit_persistence, writer=writer,
+            calibration=calibration)
+        if monitor:
+            test_log._monitor.restore(monitor)
+        return test_log
+
+    def checkpoint(self) -> dict:
+        '''What resume() needs besides the file itself'''
+        calibration = self._calibration
+        return {
+            'log_fname' : self._fname,
+            'log_offset' : self.offset,
+            'log_box_id' : self._box_id,
+            'log_calibration' : asdict(calibration) if calibration else None,
+            'log_monitor' : self._monitor.checkpoint(),
+        }
+
+    @property
+    def fname(self) -> str:
+        return self._fname
+
+    @property
+    def box_id(self) -> str:
+        return self._box_id
+
+    @property
+    def calibration(self):
+        return self._calibration
+
+    @property
+    def binary(self) -> bool:
+        return self._binary
+
+    @property
+    def header(self) -> dict:
+        '''box id, start time, limits and calibration of a binary log'''
+        return self._header
+
+    @property
+    def offset(self) -> int:
+        '''bytes of the log file flushed to disk'''
+        return self._writer.offset(self._fname)
 
     def csv_header_write(self):
-        with open(self._fname, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([self._fname])
-            writer.writerow(['BatMan test results'])
-            writer.writerow(csv_headers)  
+        header = [[self._fname], ['BatMan test results'], csv_headers]
+        self._writer.write_rows(self._fname, header, truncate=True)
+        self._writer.flush(self._fname)
+
+    def bin_header_write(self):
+        calibration = self._calibration
+        self._header = {
+            'box_id' : self._box_id,
+            'start_time' : self._clock.now().isoformat(),
+            'keys' : result_keys,
+            'timedelta_keys' : ['bat_timestamp'],
+            'limits' : dict(zip(phase_names, test_lims)),
+            'calibration' : asdict(calibration) if calibration else None
+        }
+        self._writer.write_bytes(self._fname,
+            BinaryLog.encode_header(self._header), truncate=True)
+        self._writer.flush(self._fname)
+
+    def bin_read_all(self):
+        with BinaryLog.BinaryLogReader(self._fname) as reader:
+            self._header = reader.header
+            columns = {key : reader.column(key) for key in reader.keys}
+            self._results = self._new_store()
+            self._results.extend(columns)
+
+            self._tracker = PhaseTracker()
+            for current, voltage in zip(columns['bat_current_mA'].tolist(),
+                    columns['bat_voltage_mV'].tolist()):
+                self._tracker.add(
+                    {'bat_current_mA' : current, 'bat_voltage_mV' : voltage})
+            for column in columns.values():
+                column.release()
+
+    def export_csv(self, csv_fname: str = None) -> str:
+        '''Write a binary log in the csv layout, returns the csv file name'''
+        self.flush(wait=True)
+        return BinaryLog.export_csv(self._fname, csv_fname, csv_headers)
 
     def csv_read_all(self):
         with open(self._fname, 'r', newline='') as file:
-            # clear result list
-            self._results = []
+            # clear results
+            self._results = self._new_store()
+            self._tracker = PhaseTracker()
 
             # number of data columns
             num_cols = len(csv_headers)
@@ -141,105 +555,33 @@ class TestLog(object):
                     row.append(val)
                 result = dict(zip(result_keys, row))
                 self._results.append(result)
+                self._tracker.add(result)
 
     def test_pass(self):
-        # find phase boundries
-        current_prev = 0
-
-        i_avg = 0
-        i_avg_samples = 0
-        i_rolling_avg_deque = deque([None] * 10, maxlen=10)
-        const_i_currents_mA = []
+        '''Final verdict over the complete log'''
+        violations = self._tracker.violations(final=True)
+        for violation in violations:
+            print(violation)
+        return not violations
 
-        i_discharge_deque = deque([0] * 5, maxlen=5)
-
-        for i, result in enumerate(self._results):
-            if '' in result.values():
-                continue
+    @property
+    def partial_pass(self) -> bool:
+        '''Verdict of the samples logged so far, for a running test'''
+        return not self._tracker.violations()
 
-            global csv_headers
-            if i < len(csv_headers):
-                continue
+    @property
+    def limit_violation(self) -> str:
+        '''persistent live limit violation, None while within limits'''
+        return self._monitor.violation
 
-            current = result.get('bat_current_mA', 0)
-            voltage = result.get('bat_voltage_mV', 0)
-            charge  = result.get('charge_level', 0)
-
-            if self._prechrg_start_idx < 0:
-                if current > 0 and current_prev < 0:
-                    self._prechrg_start_idx = i
-                    print(f'prechrg start {i}')
-                current_prev = current
-
-            # start of constant current
-            if voltage > PRECHRG_END_VFB_THRESH_mV and self._const_i_start_idx < 0:
-                self._const_i_start_idx = i
-                print(f'const i start {i}')
-
-            # start of constant voltage
-            if self._const_i_start_idx > 0 and self._const_v_start_idx < 0:
-                # find average current
-                i_avg = (i_avg_samples * i_avg + current)/(i_avg_samples + 1)                
-                i_avg_samples += 1
-
-                # rolling average current
-                try:
-                    i_rolling_avg_deque.append(current)
-                    i_rolling_avg = sum(i_rolling_avg_deque)/len(i_rolling_avg_deque)
-                except TypeError:
-                    i_rolling_avg = i_avg
-
-                if i_avg - i_rolling_avg > 10:
-                    self._const_v_start_idx = i
-                    print(f'const v start {i}')
-            # start of discharge
-            if self._const_v_start_idx > 0 and self._dischrg_start_idx < 0:
-                if all([current < 0 for current in i_discharge_deque]):
-                    self._dischrg_start_idx = i
-                    print(f'dischrg start {i}')
-                    break
-                i_discharge_deque.append(current)
-
-        # split result into charge phases
-        try:
-            test_phases = [
-                self._results[self._prechrg_start_idx+10:self._const_i_start_idx-10],
-                self._results[self._const_i_start_idx+10:self._const_v_start_idx-10],
-                self._results[self._const_v_start_idx+10:self._dischrg_start_idx-10],
-                self._results[self._dischrg_start_idx+50:-3]
-            ]
-        except IndexError:
-            print('unable to split into phases')
-            return False
-
-        global test_lims
-        errors = 0
-
-        for i, (phase, limit) in enumerate(zip(test_phases, test_lims)):
-            # print(phase)
-            i_results = [result.get('bat_current_mA',None) for result in phase]
-            v_results = [result.get('bat_voltage_mV',None) for result in phase]
-
-            i_stats = self.calc_stats(i_results)
-            v_stats = self.calc_stats(v_results)
-            
-            try:
-                if i_stats['min'] < limit['i_min']:
-                    print(f'i_lim min {i} {i_stats}')
-                    errors += 1
-                if i_stats['max'] > limit['i_max']:
-                    print(f'i_lim max {i} {i_stats}')
-                    errors += 1
-                if v_stats['min'] < limit['v_min']:
-                    print(f'v_lim min {i} {v_stats}')
-                    errors += 1
-                if v_stats['max'] > limit['v_max']:
-                    print(f'v_lim max {i} {v_stats}')
-                    errors += 1
-            except TypeError:
-                errors += 1
+    @property
+    def phase(self) -> str:
+        return phase_names[self._tracker.phase]
 
-        return errors == 0
+    @property
+    def phase_stats(self) -> list:
+        '''running PhaseStats of every phase'''
+        return self._tracker.stats()
 
     def calc_stats(self,measurement_list):
         stats = {}
@@ -263,6 +605,16 @@ class TestLog(object):
     # def test_time_h(self):
     #     return self._t_elapsed_ms/(1000 * 60 * 60)   
 
+    @property
+    def results(self) -> ResultStore:
+        '''columnar results, iterating gives one dict per row'''
+        return self._results
+
+    @property
+    def memory_bytes(self) -> int:
+        '''memory held by the in-memory results'''
+        return self._results.nbytes
+
     @property
     def last(self):
         if self._results:
@@ -270,6 +622,10 @@ class TestLog(object):
         else:
             return None
 
+    @staticmethod
+    def _new_store() -> ResultStore:
+        return ResultStore(result_keys, timedelta_keys=('bat_timestamp',))
+
 def result_str(**kwargs):
     result_string = ''
 
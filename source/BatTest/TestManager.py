@@ -1,25 +1,64 @@
 # standard library
+import logging
+import asyncio
 from cmd import Cmd
 import threading
-from time import sleep
+import time
 
 # external packages
 
 # internal packages
 from source.BatTest.BatteryTest import BatteryTest
-from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.I2C import I2C, I2CError
 from source.TestBoxIF.ConnectionManager import ConnectionManager 
 from source.TestBoxIF.TestBoxHalf import TestBoxHalf
+from source.TestBoxIF.AsyncIF import AsyncI2C
+from source.BatTest.Clock import SystemClock, VirtualClock
+from source.BatTest.Checkpoint import checkpoint_fname, load_checkpoint
+from source.BatTest.BinaryLog import BinaryLogError
 
 class TestManager(object):
     """docstring for TestManager"""
-    def __init__(self, threaded = False):
+    # sampling period of the step thread
+    STEP_PERIOD_S = 1.0
+
+    def __init__(
+        self,
+        threaded = False,
+        simulated = False,
+        num_sim_boxes = 10,
+        sim_options = None,
+        concurrent = False,
+        step_budget_s = 0.5,
+        clock = None,
+        checkpoint_dir = None):
+        self.logger = logging.getLogger('batman.BatTest.TestManager')
         self._bat_tests = []
-        self._conn_man = ConnectionManager()
+
+        # time source of the tests, a VirtualClock is advanced by run_virtual()
+        self._clock = clock if clock else SystemClock()
+        sim_options = self._sim_clock(sim_options)
+
+        self._conn_man = ConnectionManager(
+            simulated, num_sim_boxes, sim_options)
         self._device_locations = []
         self._device_names = []
         self._threaded = threaded
 
+        # boxes resume from their checkpoint when reopened, e.g. from
+        # CHECKPOINT_DIR, None disables
+        self._checkpoint_dir = checkpoint_dir
+
+        # concurrent stepping, one executor thread per box bus
+        self._concurrent = concurrent
+        self._async_i2c = {}
+
+        # step duration budget, a step over budget delays every box
+        self._step_budget_s = step_budget_s
+        self._last_step_s = 0.0
+        self._box_step_s = {}
+        self._num_overruns = 0
+
         # start IO loop thread
         if self._threaded:
             self._event = threading.Event()
@@ -36,11 +75,26 @@ class TestManager(object):
         self._device_names = self._conn_man.device_names
         return self._device_names
 
-    def open_connection(self, location_str = None):
-        i2c = self._conn_man.open_connection(location_str)
+    def open_connection(self, location_str = None, calibrate = False):
+        i2c = self._conn_man.open_connection(location_str, calibrate)
         if i2c:
-            bat_test = BatteryTest(i2c)
+            fname = checkpoint_fname(i2c.name, self._checkpoint_dir) \
+                if self._checkpoint_dir else None
+            bat_test = BatteryTest(
+                i2c, self._conn_man.load_calibration(i2c.name), self._clock,
+                checkpoint_fname=fname)
+            if isinstance(self._clock, VirtualClock):
+                # register cache ages in wall clock time, ticks run back to back
+                clock = self._clock
+                gas_gauge = bat_test.if_board.gas_gauge
+                gas_gauge.reg_map.cache_ttl_s = 0
+                gas_gauge.clock = lambda: clock.now().timestamp()
+                gas_gauge.sleep = clock.sleep
+                bat_test.if_board.gpio.reg_map.cache_ttl_s = 0
+            if fname:
+                self._resume(bat_test, fname)
             self._bat_tests.append(bat_test)
+            self._async_i2c[bat_test] = AsyncI2C(i2c)
             return True
         else:
             return False
@@ -48,8 +102,37 @@ class TestManager(object):
     def close_connection(self):
         if self._bat_tests:
             self._bat_tests[0].stop()
+            self._box_step_s.pop(self._bat_tests[0].box_id, None)
+            async_i2c = self._async_i2c.pop(self._bat_tests[0], None)
+            if async_i2c:
+                async_i2c.close()
             del self._bat_tests[0]
 
+    @property
+    def clock(self):
+        return self._clock
+
+    @property
+    def step_budget_s(self) -> float:
+        return self._step_budget_s
+
+    @step_budget_s.setter
+    def step_budget_s(self, budget_s: float):
+        self._step_budget_s = budget_s
+
+    @property
+    def last_step_s(self) -> float:
+        return self._last_step_s
+
+    @property
+    def box_step_s(self) -> dict:
+        '''duration of the last process() call per box id'''
+        return dict(self._box_step_s)
+
+    @property
+    def num_overruns(self) -> int:
+        return self._num_overruns
+
     def bat_test(self, test_num: int = 0):
         try:
             return self._bat_tests[test_num]
@@ -57,18 +140,103 @@ class TestManager(object):
             print('Invalid box index')
 
     def step(self):
-        for test in self._bat_tests:
-            try:
-                test.process()
-            except Exception as e:
-                raise e
+        start = time.perf_counter()
+        try:
+            if self._concurrent:
+                asyncio.run(self.step_async())
+                return
+
+            for test in self._bat_tests:
+                try:
+                    self._process(test)
+                except I2CError as e:   # one bad box must not stall the rest
+                    self.logger.warning(f'box {test.box_id}: {e!r}')
+                except Exception as e:
+                    raise e
+        finally:
+            self._check_budget(time.perf_counter() - start)
+
+    async def step_async(self):
+        '''Process every box concurrently, each on its own bus thread, so
+        the step takes about as long as the slowest box
+        '''
+        tests = list(self._bat_tests)
+        results = await asyncio.gather(
+            *(self._async_i2c[test].run(self._process, test) for test in tests),
+            return_exceptions=True)
+
+        for test, result in zip(tests, results):
+            if isinstance(result, I2CError):
+                self.logger.warning(f'box {test.box_id}: {result!r}')
+            elif isinstance(result, Exception):
+                raise result
+
+    def run_virtual(self, duration_s: float, tick_s: float = None):
+        '''Step every box through duration_s of virtual time as fast as
+        the boxes can be processed, advancing the clock tick_s per step
+        '''
+        if not isinstance(self._clock, VirtualClock):
+            raise TypeError('run_virtual needs a VirtualClock')
+        tick_s = tick_s if tick_s else self.STEP_PERIOD_S
+
+        num_steps = int(duration_s / tick_s)
+        for _ in range(num_steps):
+            self.step()
+            self._clock.advance(tick_s)
+        return num_steps
 
     def step_thread(self):
-        while not self._event.isSet():
+        # fixed rate: the time a step took is taken off the wait
+        next_step = time.monotonic()
+        while not self._event.is_set():
             self.step()
 
+            next_step += self.STEP_PERIOD_S
+            delay = next_step - time.monotonic()
+            if delay < 0:   # overran the period, do not try to catch up
+                next_step = time.monotonic()
+                delay = 0
             try:
-                self._event.wait(1)
+                self._event.wait(delay)
             except KeyboardInterrupt:
                 self._event.set()
                 break
+
+    # helper methods
+    def _process(self, test: BatteryTest):
+        start = time.perf_counter()
+        try:
+            test.process()
+        finally:
+            self._box_step_s[test.box_id] = time.perf_counter() - start
+
+    def _resume(self, test: BatteryTest, fname: str):
+        checkpoint = load_checkpoint(fname)
+        if not checkpoint:
+            return
+        try:
+            test.restore(checkpoint)
+            self.logger.info(f'box {test.box_id} resumed in {test.state_name}')
+        except (KeyError, ValueError, OSError, I2CError, BinaryLogError) as e:
+            self.logger.warning(f'box {test.box_id}: unable to resume: {e!r}')
+
+    def _sim_clock(self, sim_options: dict) -> dict:
+        '''Simulated batteries follow the virtual clock'''
+        if not sim_options or sim_options.get('battery') is None \
+                or not isinstance(self._clock, VirtualClock):
+            return sim_options
+
+        clock = self._clock
+        battery = dict(sim_options['battery'])
+        battery.setdefault('time_fn', lambda: clock.now().timestamp())
+        return {**sim_options, 'battery' : battery}
+
+    def _check_budget(self, step_s: float):
+        self._last_step_s = step_s
+        if self._step_budget_s and step_s > self._step_budget_s:
+            self._num_overruns += 1
+            slowest = max(self._box_step_s.items(),
+                key=lambda item: item[1], default=(None, 0.0))
+            self.logger.warning(
+                f'step took {step_s:.3f} s (budget {self._step_budget_s:.3f} s), '
+                f'slowest box {slowest[0]}: {slowest[1]:.3f} s')
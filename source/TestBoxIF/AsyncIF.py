@@ -0,0 +1,142 @@
+'''
+asyncio interface layered over the blocking TestBoxIF drivers.
+
+Every FT4222 handle is single threaded, so each box half gets one executor
+thread and all of its blocking calls are dispatched there.  Coroutines for
+different boxes can then have bus transactions in flight at the same time
+from a single event loop.
+'''
+
+# standard library
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# external packages
+
+# internal packages
+from .I2C import I2C
+from .I2C import RegisterMap
+from .GPIO import GPIO
+from .LTC2943 import LTC2943
+from .LTC2943 import GasGaugeSample
+
+class AsyncI2C(object):
+    """Async wrapper of :class:`I2C` owning the per-device executor"""
+    def __init__(self, i2c: I2C, executor: ThreadPoolExecutor = None):
+        self._i2c = i2c
+        self._executor = executor if executor else ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f'i2c_{i2c.name}')
+
+    # API
+    @property
+    def i2c(self) -> I2C:
+        return self._i2c
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        '''Run a blocking call on this device's executor thread'''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def read(self, addr: int, data: int, num_bytes: int, **kwargs):
+        return await self.run(self._i2c.read, addr, data, num_bytes, **kwargs)
+
+    async def write(self, addr: int, data: bytearray, **kwargs):
+        return await self.run(self._i2c.write, addr, data, **kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+class AsyncRegisterMap(object):
+    """Async wrapper of :class:`RegisterMap`"""
+    def __init__(self, reg_map: RegisterMap, async_i2c: AsyncI2C):
+        self._reg_map = reg_map
+        self._async_i2c = async_i2c
+
+    async def read_reg(self, reg_addr: int, **kwargs) -> int:
+        return await self._async_i2c.run(self._reg_map.read_reg, reg_addr, **kwargs)
+
+    async def write_reg(self, reg_addr: int, value: int = None, **kwargs):
+        return await self._async_i2c.run(
+            self._reg_map.write_reg, reg_addr, value, **kwargs)
+
+    async def read_bit(self, reg_addr: int, bit_num: int, **kwargs) -> bool:
+        return await self._async_i2c.run(
+            self._reg_map.read_bit, reg_addr, bit_num, **kwargs)
+
+    async def write_bit(self, reg_addr: int, bit_num: int, value: int, **kwargs):
+        return await self._async_i2c.run(
+            self._reg_map.write_bit, reg_addr, bit_num, value, **kwargs)
+
+    async def read_block(self, start_addr: int, end_addr: int, **kwargs) -> bytes:
+        return await self._async_i2c.run(
+            self._reg_map.read_block, start_addr, end_addr, **kwargs)
+
+    async def read_word(self, msb_addr: int, **kwargs) -> int:
+        return await self._async_i2c.run(self._reg_map.read_word, msb_addr, **kwargs)
+
+class AsyncLTC2943(object):
+    """Async wrapper of :class:`LTC2943`"""
+    def __init__(self, gas_gauge: LTC2943, async_i2c: AsyncI2C):
+        self._gas_gauge = gas_gauge
+        self._async_i2c = async_i2c
+        self.reg_map = AsyncRegisterMap(gas_gauge.reg_map, async_i2c)
+
+    async def _get(self, name: str):
+        return await self._async_i2c.run(getattr, self._gas_gauge, name)
+
+    async def snapshot(self) -> GasGaugeSample:
+        return await self._async_i2c.run(self._gas_gauge.snapshot)
+
+    async def get_all(self) -> dict:
+        return await self._async_i2c.run(self._gas_gauge.get_all)
+
+    async def status_reg(self) -> int:
+        return await self._get('status_reg')
+
+    async def config_reg(self) -> int:
+        return await self._get('config_reg')
+
+    async def set_config_reg(self, word: int):
+        await self._async_i2c.run(setattr, self._gas_gauge, 'config_reg', word)
+
+    async def charge(self) -> dict:
+        return await self._get('charge')
+
+    async def voltage_mV(self) -> float:
+        return await self._get('voltage_mV')
+
+    async def current_mA(self) -> float:
+        return await self._get('current_mA')
+
+    async def temp_C(self) -> float:
+        return await self._get('temp_C')
+
+class AsyncGPIO(object):
+    """Async wrapper of :class:`GPIO`"""
+    def __init__(self, gpio: GPIO, async_i2c: AsyncI2C):
+        self._gpio = gpio
+        self._async_i2c = async_i2c
+        self.reg_map = AsyncRegisterMap(gpio.reg_map, async_i2c)
+
+    async def get(self, name: str):
+        '''Read a GPIO property, e.g. 'battery_present' or 'charge_enable\''''
+        return await self._async_i2c.run(getattr, self._gpio, name)
+
+    async def set(self, **outputs):
+        '''Set outputs in one batch, e.g. set(charge_enable=True)'''
+        await self._async_i2c.run(self._set_batch, outputs)
+
+    async def battery_present(self) -> bool:
+        return await self.get('battery_present')
+
+    # helper methods
+    def _set_batch(self, outputs: dict):
+        with self._gpio.batch():
+            for name, value in outputs.items():
+                setattr(self._gpio, name, value)
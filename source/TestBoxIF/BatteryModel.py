@@ -0,0 +1,240 @@
+'''
+Battery pack model driving the simulated LTC2943 of a test box half.
+
+The model follows the box outputs on the simulated TCA9555: with charge
+enabled a CC/CV charger with precharge feeds the pack, with discharge
+enabled a resistive load drains it.  The state of charge is integrated
+over the time passed since the last gauge read, and the gauge voltage,
+current and accumulated charge registers are set from the result, so the
+FSM sees the same phase shapes as on a real box.
+'''
+
+# standard library
+import bisect
+import random
+import time
+from typing import Callable
+
+# external packages
+
+# internal packages
+
+class BatteryModel(object):
+    """4S li-ion pack with charger and discharge load
+
+    :param gauge: SimLTC2943 whose registers are driven
+    :param gpio: SimTCA9555 whose outputs switch charger and load
+    :param capacity_mAh: pack capacity
+    :param load_ohm: discharge load resistance
+    :param r_internal_ohm: pack internal resistance
+    :param r_sense_mohm: gauge sense resistor
+    :param soc: initial state of charge, 0..1
+    :param time_fn: time source in seconds, e.g. a virtual clock
+    :param noise_mA: standard deviation of the measured current noise
+    :param seed: seed for the noise random generator
+    """
+    # open circuit cell voltage (mV) by state of charge
+    OCV_CURVE = [
+        (0.00, 2500),
+        (0.03, 3200),
+        (0.10, 3450),
+        (0.20, 3550),
+        (0.50, 3700),
+        (0.80, 3950),
+        (0.90, 4050),
+        (1.00, 4200)
+    ]
+    NUM_CELLS = 4
+
+    # charger, precharge ends at the VFB threshold of the charger IC
+    PRECHARGE_mA = 300
+    PRECHARGE_END_mV = 1550 * 235 / 30
+    CONST_I_mA = 1050
+    CONST_V_mV = 16400
+    TERMINATION_mA = 100
+
+    # pack protection opens below this terminal voltage, which powers
+    # the gauge down
+    CUTOFF_mV = 9600
+
+    # gauge front end
+    V_BAT_FS_mV = 23600
+    V_SENSE_FS_mV = 60.0
+    Q_SCALE = 0.340 * 50.0 / 4096.0
+
+    # longest integration step, larger time steps are split
+    MAX_STEP_S = 1.0
+
+    # gpio outputs, (port register, bit)
+    CHARGE_EN = (0x03, 0)
+    DISCHARGE_EN = (0x02, 0)
+
+    def __init__(
+        self,
+        gauge,
+        gpio,
+        capacity_mAh: float = 3500,
+        load_ohm: float = 3.3,
+        r_internal_ohm: float = 0.4,
+        r_sense_mohm: float = 5.0,
+        soc: float = 0.5,
+        time_fn: Callable[[], float] = time.monotonic,
+        noise_mA: float = 2.0,
+        seed: int = None):
+
+        self._gauge = gauge
+        self._gpio = gpio
+        self.capacity_mAh = capacity_mAh
+        self.load_ohm = load_ohm
+        self.r_internal_ohm = r_internal_ohm
+        self.r_sense_mohm = r_sense_mohm
+        self.noise_mA = noise_mA
+
+        self._socs = [soc for soc, _ in self.OCV_CURVE]
+        self._soc = min(max(soc, 0.0), 1.0)
+        self._time_fn = time_fn
+        self._last_update = time_fn()
+        self._random = random.Random(seed)
+
+        self._current_mA = 0.0
+        self._voltage_mV = self.ocv_mV
+        self._charge_lsbs = 0.0     # accumulator fraction not yet counted
+        self._precharge = True
+        self._terminated = False
+        self._tripped = False
+
+    # API
+    @property
+    def soc(self) -> float:
+        return self._soc
+
+    @property
+    def ocv_mV(self) -> float:
+        '''open circuit pack voltage at the present state of charge'''
+        idx = bisect.bisect_right(self._socs, self._soc)
+        idx = min(max(idx, 1), len(self.OCV_CURVE) - 1)
+        (soc_0, v_0), (soc_1, v_1) = self.OCV_CURVE[idx - 1], self.OCV_CURVE[idx]
+        cell_mV = v_0 + (v_1 - v_0) * (self._soc - soc_0) / (soc_1 - soc_0)
+        return self.NUM_CELLS * cell_mV
+
+    @property
+    def voltage_mV(self) -> float:
+        return self._voltage_mV
+
+    @property
+    def current_mA(self) -> float:
+        return self._current_mA
+
+    @property
+    def tripped(self) -> bool:
+        '''pack protection open, battery disconnected until charged'''
+        return self._tripped
+
+    def update(self):
+        '''Integrate up to now and update the gauge registers'''
+        now = self._time_fn()
+        dt = now - self._last_update
+        self._last_update = now
+
+        while dt > 0:
+            step = min(dt, self.MAX_STEP_S)
+            self._step(step)
+            dt -= step
+
+        self._write_gauge()
+
+    # helper methods
+    def _output(self, port_bit: tuple) -> bool:
+        port, bit = port_bit
+        config = self._gpio.get_reg(port + 4)
+        output = self._gpio.get_reg(port)
+        return not (config >> bit) & 1 and bool((output >> bit) & 1)
+
+    def _step(self, dt_s: float):
+        charge_en = self._output(self.CHARGE_EN)
+        discharge_en = self._output(self.DISCHARGE_EN)
+
+        if charge_en:
+            self._tripped = False
+            current_mA, voltage_mV = self._charger()
+        else:
+            self._precharge = True
+            self._terminated = False
+            if discharge_en and not self._tripped:
+                current_mA, voltage_mV = self._load()
+                if voltage_mV < self.CUTOFF_mV:
+                    self._trip()
+                    current_mA, voltage_mV = 0.0, 0.0
+            elif self._tripped:
+                current_mA, voltage_mV = 0.0, 0.0
+            else:
+                current_mA, voltage_mV = 0.0, self.ocv_mV
+
+        self._current_mA = current_mA
+        self._voltage_mV = voltage_mV
+
+        delta_mAh = current_mA * dt_s / 3600
+        self._soc = min(max(self._soc + delta_mAh / self.capacity_mAh, 0.0), 1.0)
+        self._count(current_mA, dt_s)
+
+    def _charger(self) -> tuple:
+        '''charge current and terminal voltage of the CC/CV charger'''
+        ocv_mV = self.ocv_mV
+        r_ohm = self.r_internal_ohm
+
+        if self._terminated:
+            return 0.0, ocv_mV
+
+        if self._precharge:
+            voltage_mV = ocv_mV + self.PRECHARGE_mA * r_ohm
+            if voltage_mV < self.PRECHARGE_END_mV:
+                return self.PRECHARGE_mA, voltage_mV
+            self._precharge = False
+
+        current_mA = min(self.CONST_I_mA, (self.CONST_V_mV - ocv_mV) / r_ohm)
+        if current_mA < self.TERMINATION_mA:
+            self._terminated = True
+            return 0.0, ocv_mV
+        return current_mA, ocv_mV + current_mA * r_ohm
+
+    def _load(self) -> tuple:
+        '''discharge current (negative) and terminal voltage of the load'''
+        current_mA = self.ocv_mV / (self.load_ohm + self.r_internal_ohm)
+        return -current_mA, current_mA * self.load_ohm
+
+    def _trip(self):
+        self._tripped = True
+        self._charge_lsbs = 0.0
+        self._gauge.reset()     # gauge loses power with the pack
+
+    def _count(self, current_mA: float, dt_s: float):
+        '''coulomb counter, wraps around at 0xFFFF and flags the overflow'''
+        control = self._gauge.get_reg(0x01)
+        if control & 0x01:      # shutdown
+            return
+
+        prescaler = min(4 ** ((control >> 3) & 0x07), 4096)
+        q_lsb_mAh = self.Q_SCALE * prescaler / self.r_sense_mohm
+        self._charge_lsbs += current_mA * dt_s / 3600 / q_lsb_mAh
+
+        lsbs = int(self._charge_lsbs)
+        if lsbs:
+            self._charge_lsbs -= lsbs
+            charge = self._gauge.get_word(0x02) + lsbs
+            if charge > 0xFFFF or charge < 0:
+                self._gauge.latch_status(0x20)
+            self._gauge.set_word(0x02, charge % 0x10000)
+
+    def _write_gauge(self):
+        if not self._gauge.get_reg(0x01) >> 6:     # ADC asleep
+            return
+
+        current_mA = self._current_mA
+        if current_mA and self.noise_mA:
+            current_mA += self._random.gauss(0, self.noise_mA)
+
+        voltage_reg = round(0xFFFF * self._voltage_mV / self.V_BAT_FS_mV)
+        sense_mV = current_mA * self.r_sense_mohm / 1000
+        current_reg = round(0x7FFF * (1 + sense_mV / self.V_SENSE_FS_mV))
+        self._gauge.set_word(0x08, min(max(voltage_reg, 0), 0xFFFF))
+        self._gauge.set_word(0x0E, min(max(current_reg, 0), 0xFFFF))
@@ -0,0 +1,56 @@
+'''
+Per box gas gauge calibration records, persisted in an ini file with one
+section per box.
+'''
+
+# standard library
+import configparser
+from dataclasses import dataclass, asdict, fields
+
+# external packages
+
+# internal packages
+
+CALIBRATION_FNAME = 'calibration.ini'
+
+@dataclass(frozen=True)
+class GasGaugeCalibration:
+    """Sense resistor, prescaler and trims of one box's LTC2943
+
+    Trims are applied after the datasheet conversion:
+    value = gain * nominal + offset
+    """
+    r_sense_mohm: float = 5.0
+    prescaler: int = 64
+    voltage_gain: float = 1.0
+    voltage_offset_mV: float = 0.0
+    current_gain: float = 1.0
+    current_offset_mA: float = 0.0
+    charge_gain: float = 1.0
+
+def load_calibration(
+    box_name: str,
+    fname: str = CALIBRATION_FNAME
+) -> GasGaugeCalibration:
+    '''Calibration of box_name, defaults for boxes without a section'''
+    config = configparser.ConfigParser()
+    config.read(fname)
+    if not config.has_section(box_name):
+        return GasGaugeCalibration()
+
+    section = config[box_name]
+    values = {field.name : type(field.default)(section[field.name]) \
+        for field in fields(GasGaugeCalibration) if field.name in section}
+    return GasGaugeCalibration(**values)
+
+def save_calibration(
+    box_name: str,
+    calibration: GasGaugeCalibration,
+    fname: str = CALIBRATION_FNAME):
+
+    config = configparser.ConfigParser()
+    config.read(fname)
+    config[box_name] = {key : str(value) \
+        for key, value in asdict(calibration).items()}
+    with open(fname, 'w') as file:
+        config.write(file)
@@ -1,4 +1,6 @@
 # standard library
+import logging
+import configparser
 from cmd import Cmd
 from enum import Enum
 
@@ -6,7 +8,11 @@ from enum import Enum
 import ft4222
 
 # internal packages
-from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.I2C import I2C, I2CError
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.Calibration import GasGaugeCalibration
+from source.TestBoxIF.Calibration import CALIBRATION_FNAME
+from source.TestBoxIF.Calibration import load_calibration
 
 # Box name mapping
 box_names = {
@@ -24,11 +30,43 @@ box_names = {
 
 box_names_inv = {v: k for k, v in box_names.items()}
 
+# calibrated bus speeds, one entry per box
+BUS_SPEED_FNAME = 'bus_speeds.ini'
+BUS_SPEED_SECTION = 'bus_speed_kbps'
+DEFAULT_SPEED_KBPS = 100
+
+# (device address, register) pairs that are safe to overwrite during bus
+# speed calibration: LTC2943 charge threshold high msb and TCA9555 port 0
+# polarity inversion
+SPEED_PROBES = [(0x64, 0x04), (0x27, 0x04)]
+
 class ConnectionManager(object):
     """docstring for ConnectionManager"""
-    def __init__(self):
+    def __init__(
+        self,
+        simulated: bool = False,
+        num_sim_boxes: int = len(box_names),
+        sim_options: dict = None,
+        bus_speed_fname: str = BUS_SPEED_FNAME,
+        calibration_fname: str = CALIBRATION_FNAME):
+        self.logger = logging.getLogger(
+            'batman.TestBoxIF.ConnectionManager.ConnectionManager')
         self._devices = []
         self._device_locations = []
+
+        # simulated boxes, sim_options are passed to each FT4222Sim
+        self._simulated = simulated
+        self._sim_options = sim_options if sim_options else {}
+        self._sim_devices = [
+            {'serial' : f'SimBox{i:03d}A'.encode(), 'location' : i} \
+                for i in range(num_sim_boxes)]
+
+        self._bus_speed_fname = bus_speed_fname
+        self._calibration_fname = calibration_fname
+
+    @property
+    def simulated(self) -> bool:
+        return self._simulated
     
     @property
     def test_box_ids(self):
@@ -40,6 +78,10 @@ class ConnectionManager(object):
 
     @property
     def devices(self) -> dict:
+        if self._simulated:
+            self._devices = self._sim_devices
+            return self._devices
+
         devices = []
         all_devices = [ft4222.getDeviceInfoDetail(i,False) \
             for i in range(ft4222.createDeviceInfoList())]
@@ -66,12 +108,63 @@ class ConnectionManager(object):
 
     @property
     def device_names(self) -> int:
+        if self._simulated:
+            return [device['serial'].decode() for device in self.devices]
+
         self._device_locations = [box_names_inv[device['serial'].decode()] \
             for device in self.devices]
         return self._device_locations
 
 
-    def open_connection(self, location_str: None) -> I2C:
+    def open_connection(
+        self,
+        location_str: None,
+        calibrate: bool = False
+    ) -> I2C:
+        '''Open a box by index or name
+
+        :param calibrate: find the fastest reliable bus speed and persist
+            it, otherwise the last calibrated speed for the box is used
+        '''
+        if self._simulated:
+            i2c = self.open_simulated(location_str)
+        else:
+            i2c = self.open_hardware(location_str)
+
+        if i2c:
+            try:
+                if calibrate:
+                    speed = i2c.calibrate_speed(SPEED_PROBES)
+                    self.save_bus_speed(i2c.name, speed)
+                else:
+                    i2c.speed_kbps = self.load_bus_speed(i2c.name)
+            except I2CError as e:
+                self.logger.warning(f'bus speed setup failed: {e!r}')
+
+        return i2c
+
+    def load_bus_speed(self, box_name: str) -> int:
+        config = configparser.ConfigParser()
+        config.read(self._bus_speed_fname)
+        try:
+            return config.getint(BUS_SPEED_SECTION, box_name,
+                fallback=DEFAULT_SPEED_KBPS)
+        except ValueError:
+            return DEFAULT_SPEED_KBPS
+
+    def save_bus_speed(self, box_name: str, speed_kbps: int):
+        config = configparser.ConfigParser()
+        config.read(self._bus_speed_fname)
+        if not config.has_section(BUS_SPEED_SECTION):
+            config.add_section(BUS_SPEED_SECTION)
+        config.set(BUS_SPEED_SECTION, box_name, str(speed_kbps))
+        with open(self._bus_speed_fname, 'w') as file:
+            config.write(file)
+
+    def load_calibration(self, box_name: str) -> GasGaugeCalibration:
+        return load_calibration(box_name, self._calibration_fname)
+
+    def open_hardware(self, location_str: None) -> I2C:
         try:
             if location_str.isnumeric():
                 idx = int(location_str)
@@ -91,6 +184,22 @@ class ConnectionManager(object):
         except ft4222.FT2XXDeviceError as e:
             print(f'Unable to open device {location_str}')
 
+    def open_simulated(self, location_str: None) -> I2C:
+        '''Open a simulated box by index or name'''
+        names = self.device_names
+        try:
+            if location_str.isnumeric():
+                box_name = names[int(location_str)]
+            elif location_str in names:
+                box_name = location_str
+            else:
+                raise KeyError(location_str)
+            return I2C(FT4222Sim(**self._sim_options), box_name)
+        except KeyError:
+            print('invalid box name')
+        except IndexError as e:
+            print(f'Invalid device location index')
+
 class DemoApp(Cmd):
     """docstring for DemoApp"""
     # shell settings
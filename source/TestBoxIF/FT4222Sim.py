@@ -0,0 +1,337 @@
+'''
+In-memory stand in for an ft4222.FT4222 handle in I2C master mode.
+
+Emulates the i2cMaster_* calls used by :class:`TestBoxIF.I2C` with register
+models of the LTC2943 gas gauge and TCA9555 gpio expander on a test box
+half, so the driver stack, FSM and TestManager can run without hardware.
+'''
+
+# standard library
+import random
+import time
+from cmd import Cmd
+
+# external packages
+from ft4222.I2CMaster import Flag
+from ft4222.I2CMaster import ControllerStatus as I2CStat
+
+# internal packages
+from .BatteryModel import BatteryModel
+
+class SimDevice(object):
+    """Register file of a simulated I2C slave
+
+    The first byte of a write sets the register pointer, following bytes
+    are stored from the pointer on.  Reads return bytes from the pointer,
+    which auto-increments after every byte.
+    """
+    def __init__(
+        self,
+        address: int,
+        size: int,
+        defaults: dict = {},
+        read_only: set = set()):
+
+        self.address = address
+        self._memory = bytearray(size)
+        self._defaults = dict(defaults)
+        self._read_only = set(read_only)
+        self.reset()
+
+    # API
+    def write(self, data: bytes):
+        if not data:
+            return
+
+        self._ptr = data[0] % len(self._memory)
+        for byte in data[1:]:
+            if self._ptr not in self._read_only:
+                self._memory[self._ptr] = byte
+                self.on_write(self._ptr)
+            self._ptr = self._next_ptr(self._ptr)
+
+    def read(self, num_bytes: int) -> bytes:
+        data = bytearray()
+        for _ in range(num_bytes):
+            data.append(self.on_read(self._ptr))
+            self._ptr = self._next_ptr(self._ptr)
+        return bytes(data)
+
+    def reset(self):
+        '''Power on reset, all registers back to their defaults'''
+        self._memory[:] = bytes(len(self._memory))
+        for reg_addr, value in self._defaults.items():
+            self._memory[reg_addr] = value
+        self._ptr = 0
+
+    def get_reg(self, reg_addr: int) -> int:
+        return self._memory[reg_addr]
+
+    def set_reg(self, reg_addr: int, value: int):
+        '''Set a register from the device side (ignores read only)'''
+        self._memory[reg_addr] = value & 0xFF
+
+    def get_word(self, msb_addr: int) -> int:
+        return (self._memory[msb_addr] << 8) + self._memory[msb_addr + 1]
+
+    def set_word(self, msb_addr: int, value: int):
+        self.set_reg(msb_addr, value >> 8)
+        self.set_reg(msb_addr + 1, value)
+
+    # hooks for device models
+    def on_write(self, reg_addr: int):
+        pass
+
+    def on_read(self, reg_addr: int) -> int:
+        return self._memory[reg_addr]
+
+    # helper methods
+    def _next_ptr(self, reg_addr: int) -> int:
+        return (reg_addr + 1) % len(self._memory)
+
+class SimLTC2943(SimDevice):
+    """LTC2943 gas gauge register model with settable readings
+
+    A manual conversion (ADC mode 01) completes conversion_time_s after
+    the control write, the ADC mode then reads back as sleep.  Charge,
+    voltage and current alerts are raised in the status register while
+    the reading is outside its threshold registers.
+
+    With a battery model attached, the readings follow the model, which is
+    brought up to date at the start of every read.
+    """
+    def __init__(self, address: int = 0x64, conversion_time_s: float = 0.0):
+        defaults = {
+            0x01 : 0x3C,                # control
+            0x02 : 0x7F, 0x03 : 0xFF,   # accumulated charge
+            0x04 : 0xFF, 0x05 : 0xFF,   # charge threshold high
+            0x0A : 0xFF, 0x0B : 0xFF,   # voltage threshold high
+            0x10 : 0xFF, 0x11 : 0xFF,   # current threshold high
+            0x0E : 0x7F, 0x0F : 0xFF,   # current (zero)
+            0x14 : 0x95, 0x15 : 0xA8,   # temperature (25 C)
+            0x16 : 0xFF,                # temperature threshold high
+        }
+        read_only = {0x00, 0x08, 0x09, 0x0E, 0x0F, 0x14, 0x15}
+
+        super().__init__(address, 0x18, defaults, read_only)
+        self.conversion_time_s = conversion_time_s
+        self._conversion_started_at = None
+        self.battery = None
+
+    def reset(self):
+        super().reset()
+        self._conversion_started_at = None
+
+    def latch_status(self, bits: int):
+        '''Set status bits that stay set until the status is read'''
+        self._memory[0x00] |= bits
+
+    def read(self, num_bytes: int) -> bytes:
+        if self.battery:
+            self.battery.update()
+        return super().read(num_bytes)
+
+    def on_write(self, reg_addr: int):
+        if reg_addr == 0x01 and self._memory[0x01] >> 6 == 0b01:
+            self._conversion_started_at = time.monotonic()
+
+    def on_read(self, reg_addr: int) -> int:
+        if reg_addr == 0x00:
+            status = self._memory[0x00] | self._threshold_alerts()
+            self._memory[0x00] = 0      # latched alerts clear on read
+            return status
+        if reg_addr == 0x01 and self._conversion_started_at is not None \
+                and time.monotonic() - self._conversion_started_at \
+                    >= self.conversion_time_s:
+            self._memory[0x01] &= 0x3F     # conversion done, back to sleep
+            self._conversion_started_at = None
+        return self._memory[reg_addr]
+
+    def _threshold_alerts(self) -> int:
+        alerts = 0
+        charge = self.get_word(0x02)
+        if charge >= self.get_word(0x04):
+            alerts |= 0x08
+        if charge <= self.get_word(0x06):
+            alerts |= 0x04
+        # voltage and current alert when outside [low, high]
+        for reg_addr, bit in ((0x08, 0x02), (0x0E, 0x40)):
+            word = self.get_word(reg_addr)
+            if word > self.get_word(reg_addr + 2) \
+                    or word < self.get_word(reg_addr + 4):
+                alerts |= bit
+        return alerts
+
+class SimTCA9555(SimDevice):
+    """TCA9555 gpio expander register model
+
+    Register pointer auto-increments within each register pair.
+    """
+    def __init__(self, address: int = 0x27):
+        defaults = {
+            0x02 : 0xFF, 0x03 : 0xFF,   # output ports
+            0x06 : 0xFF, 0x07 : 0xFF,   # config (all inputs)
+        }
+        read_only = {0x00, 0x01}
+
+        super().__init__(address, 0x08, defaults, read_only)
+
+    def _next_ptr(self, reg_addr: int) -> int:
+        return reg_addr ^ 0x01
+
+class FT4222Sim(object):
+    """Simulated FT4222 I2C master
+
+    :param devices: simulated slaves, defaults to one LTC2943 and TCA9555
+    :param latency_s: delay added to each bus transfer (USB round trip)
+    :param busy_polls: status polls reporting BUSY after each transfer
+    :param nack_rate: probability of a transfer being NACKed
+    :param seed: seed for the NACK injection random generator
+    :param max_speed_kbps: fastest clock the box wiring supports, reads
+        above it return corrupted data
+    :param battery: BatteryModel keyword arguments, attaches a battery
+        model to the default devices
+    """
+    def __init__(
+        self,
+        devices: list[SimDevice] = None,
+        latency_s: float = 0.0,
+        busy_polls: int = 0,
+        nack_rate: float = 0.0,
+        seed: int = None,
+        max_speed_kbps: int = 1000,
+        battery: dict = None):
+
+        if devices is None:
+            devices = [SimLTC2943(), SimTCA9555()]
+            if battery is not None:
+                devices[0].battery = BatteryModel(*devices, **battery)
+
+        self._devices = {device.address:device for device in devices}
+        self.latency_s = latency_s
+        self.busy_polls = busy_polls
+        self.nack_rate = nack_rate
+        self.nack_addresses = set()     # persistent NACK, e.g. unplugged IC
+        self.max_speed_kbps = max_speed_kbps
+
+        self._random = random.Random(seed)
+        self._status = I2CStat.IDLE
+        self._busy_count = 0
+        self._speed_kbps = None
+        self._open = True
+
+        # transfer statistics
+        self.num_writes = 0
+        self.num_reads = 0
+        self.num_nacks = 0
+
+    # API
+    @property
+    def speed_kbps(self):
+        return self._speed_kbps
+
+    def device(self, address: int) -> SimDevice:
+        return self._devices.get(address)
+
+    def close(self):
+        self._open = False
+
+    # ft4222.FT4222 I2C master interface
+    def i2cMaster_Init(self, kbps: int):
+        self._speed_kbps = kbps
+
+    def i2cMaster_Write(self, addr: int, data) -> int:
+        return self.i2cMaster_WriteEx(addr, Flag.START_AND_STOP, data)
+
+    def i2cMaster_WriteEx(self, addr: int, flag: Flag, data) -> int:
+        self.num_writes += 1
+        data = self._to_bytes(data)
+        device = self._transfer(addr)
+
+        if device is None:
+            return 0
+
+        device.write(data)
+        self._end_transfer(flag)
+        return len(data)
+
+    def i2cMaster_Read(self, addr: int, bytesToRead: int) -> bytes:
+        return self.i2cMaster_ReadEx(addr, Flag.START_AND_STOP, bytesToRead)
+
+    def i2cMaster_ReadEx(self, addr: int, flag: Flag, bytesToRead: int) -> bytes:
+        self.num_reads += 1
+        device = self._transfer(addr)
+
+        if device is None:
+            return bytes(bytesToRead)
+
+        data = device.read(bytesToRead)
+        self._end_transfer(flag)
+
+        if self._speed_kbps and self._speed_kbps > self.max_speed_kbps:
+            data = bytes(byte ^ 0x01 for byte in data)  # marginal signal
+        return data
+
+    def i2cMaster_GetStatus(self) -> int:
+        if self._busy_count:
+            self._busy_count -= 1
+            return I2CStat.BUSY
+        return self._status
+
+    # helper methods
+    def _transfer(self, addr: int) -> SimDevice:
+        '''Start a transfer, returns None (and sets NACK status) on NACK'''
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        self._busy_count = self.busy_polls
+
+        device = self._devices.get(addr)
+        nack = device is None \
+            or addr in self.nack_addresses \
+            or (self.nack_rate and self._random.random() < self.nack_rate)
+
+        if nack:
+            self.num_nacks += 1
+            self._status = I2CStat.IDLE | I2CStat.ERROR | I2CStat.ADDRESS_NACK
+            return None
+
+        return device
+
+    def _end_transfer(self, flag: Flag):
+        if flag & Flag.STOP:
+            self._status = I2CStat.IDLE
+        else:   # bus held for repeated start
+            self._status = I2CStat.BUS_BUSY
+
+    @staticmethod
+    def _to_bytes(data) -> bytes:
+        if isinstance(data, int):
+            return bytes((data,))
+        return bytes(data)
+
+# demo command line app
+class DemoApp(Cmd):
+    intro = 'FT4222 simulator demo app.  Type help or ? to list commands.\n'
+    prompt = '(FT4222Sim) '
+
+    def do_read(self,args):
+        addr, reg, num_bytes = map(lambda arg: int(arg,0), args.split())
+        self.sim.i2cMaster_WriteEx(addr, Flag.START, reg)
+        print(self.sim.i2cMaster_ReadEx(addr, Flag.REPEATED_START | Flag.STOP, num_bytes).hex())
+
+    def do_write(self,args):
+        args_list = args.split()
+        addr = int(args_list[0],0)
+        data = bytearray([int(arg,0) for arg in args_list[1:]])
+        self.sim.i2cMaster_Write(addr, data)
+
+    def do_exit(self,args):
+        return True
+
+    def __init__(self):
+        super(DemoApp, self).__init__()
+        self.sim = FT4222Sim()
+
+# cli app for testing
+if __name__ == '__main__':
+    DemoApp().cmdloop()
@@ -3,25 +3,39 @@
 
 # standard library
 import logging
+from contextlib import contextmanager
 
 # external pakcages
 
 # internal
-from .I2C import I2C
+from .I2C import I2C, I2CError
 from .I2C import RegisterMap
 from .I2C import Register
+from .I2C import Field
 from .I2C import uint8_to_uint
+from .Retry import RetryPolicy
 # from .TCA9555 import TCA9555
 
 
 reg_init_dict = {}
 
+# TCA9555 port bits
+BATTERY_PRESENT_N = Field(0x0, 7)   # input, low when a battery is inserted
+DISCHARGE_EN = Field(0x2, 0)
+CHARGE_EN = Field(0x3, 0)
+LED_ERROR = Field(0x3, 1)
+LED_RUN = Field(0x3, 2)
+LED_DONE = Field(0x3, 3)
+
 class GPIO(object):
     """docstring for GPIO"""
     def __init__(
         self,
         i2c: I2C = None,
-        address: int = 0x27
+        address: int = 0x27,
+        cache: bool = True,
+        cache_ttl_s: float = 0.1,
+        retry_policy: RetryPolicy = None
     ):
         self.logger = logging.getLogger('batman.TestBoxIF.GPIO.GPIO')
 
@@ -29,6 +43,9 @@ class GPIO(object):
         self._i2c = i2c
         self._address = address
 
+        # every register is volatile: the inputs change on their own and a
+        # brown-out resets outputs and config to their power-on 0xFF, which
+        # is only noticed if they are read again once the cache ttl expires
         registers = [
             Register(0x00, 'r',  1, 0x00),
             Register(0x01, 'r',  1, 0x00),
@@ -43,7 +60,12 @@ class GPIO(object):
         self._reg_map = RegisterMap(
             i2c = self._i2c,
             address = self._address,
-            registers = registers)
+            registers = registers,
+            cache = cache,
+            cache_ttl_s = cache_ttl_s,
+            retry_policy = retry_policy if retry_policy \
+                else RetryPolicy(retries=3))
+        self._batch_depth = 0
         try:
             self._reg_map.write_all()
         except:
@@ -70,21 +92,62 @@ class GPIO(object):
     def address(self):
         return self._address
 
+    @property
+    def reg_map(self) -> RegisterMap:
+        return self._reg_map
+
+    @contextmanager
+    def batch(self):
+        '''Collect output changes and write each port word once on exit
+
+        The charge/discharge interlock is checked against the final port
+        values, and a port that switches an enable off is written before
+        one that switches an enable on.  Batches may be nested, only the
+        outermost one writes.
+        '''
+        if self._batch_depth:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            return
+
+        self._batch_depth = 1
+        self._reg_map.begin_batch()
+        try:
+            yield self
+        except BaseException as e:
+            self._reg_map.rollback()
+            raise e
+        else:
+            charge = self._reg_map.read_field(CHARGE_EN)
+            discharge = self._reg_map.read_field(DISCHARGE_EN)
+            if charge and discharge:
+                self._reg_map.rollback()
+                raise GPIOError('cannot enable charge and discharge together')
+
+            order = [field.reg_addr for field in (CHARGE_EN, DISCHARGE_EN) \
+                if self._field_cleared(field)]
+            self._reg_map.flush(order)
+        finally:
+            self._batch_depth = 0
+
     @property
     def input_port_word(self, port_num: int):
         if port_num == 0:
-            return self._reg_map.read_reg(reg_addr=0x0, retries=3)
+            return self._reg_map.read_reg(reg_addr=0x0)
         elif port_num == 1:
-            return self._reg_map.read_reg(reg_addr=0x1, retries=3)
+            return self._reg_map.read_reg(reg_addr=0x1)
         else:
             raise GPIOError('invalid input port')
 
     @property
     def output_port_word(self, port_num: int):
         if port_num == 0:
-            return self._reg_map.read_reg(reg_addr=0x2, retries=3)
+            return self._reg_map.read_reg(reg_addr=0x2)
         elif port_num == 1:
-            return self._reg_map.read_reg(reg_addr=0x3, retries=3)
+            return self._reg_map.read_reg(reg_addr=0x3)
         else:
             raise GPIOError('invalid output port')
 
@@ -92,7 +155,7 @@ class GPIO(object):
     def battery_present(self):
         '''input for detecting inserted battery
         '''
-        bat = not self._reg_map.read_bit(reg_addr=0x0, bit_num=7, retries=3)
+        bat = not self._reg_map.read_field(BATTERY_PRESENT_N)
         self.logger.info(f'get battery_present: {bat}')
         return bat
 
@@ -100,21 +163,17 @@ class GPIO(object):
     def charge_enable(self):
         '''output for enabling battery charging
         '''
-        ce = self._reg_map.read_bit(reg_addr=0x3, bit_num=0, retries=3)
+        ce = bool(self._reg_map.read_field(CHARGE_EN))
         self.logger.info(f'get charge_enable: {ce}')
         return ce
 
 
     @charge_enable.setter
     def charge_enable(self,enable):
-        if self.discharge_enable and enable:
+        if enable and not self._batch_depth and self.discharge_enable:
             raise GPIOError('cannot enable charge during discharge')
         else:
-            self._reg_map.write_bit(
-                reg_addr=0x3,
-                bit_num=0,
-                value=enable,
-                retries=3)
+            self._reg_map.write_field(CHARGE_EN, int(bool(enable)))
             self.logger.info(f'set charge_enable: {enable}')
 
     # TODO
@@ -148,16 +207,16 @@ class GPIO(object):
     def discharge_enable(self):
         '''output for enabling battery discharge
         '''
-        de = self._reg_map.read_bit(reg_addr=0x2,bit_num=0,retries=3)
+        de = bool(self._reg_map.read_field(DISCHARGE_EN))
         self.logger.info(f'get discharge_enable: {de}')
         return de
 
     @discharge_enable.setter
     def discharge_enable(self, enable: bool):
-        if self.charge_enable and enable:
+        if enable and not self._batch_depth and self.charge_enable:
             raise GPIOError('cannot enable discharge during charge')
         else:
-            self._reg_map.write_bit(reg_addr=0x2,bit_num=0,value=enable,retries=3)
+            self._reg_map.write_field(DISCHARGE_EN, int(bool(enable)))
             self.logger.info(f'set discharge_enable: {enable}')
 
     # TODO
@@ -190,29 +249,36 @@ class GPIO(object):
     def led_run_enable(self):
         '''output for enabling run indication led
         '''
-        return self._reg_map.read_bit(reg_addr=0x3,bit_num=2,retries=3)
+        return bool(self._reg_map.read_field(LED_RUN))
 
     @led_run_enable.setter
     def led_run_enable(self, enable: int):
-        self._reg_map.write_bit(reg_addr=0x3,bit_num=2,value=enable,retries=3) 
+        self._reg_map.write_field(LED_RUN, int(bool(enable)))
 
     @property
     def led_done_enable(self) -> int:
         '''output for enabling run indication led
         '''
-        return self._reg_map.read_bit(reg_addr=0x3,bit_num=3,retries=3)
+        return bool(self._reg_map.read_field(LED_DONE))
 
     @led_done_enable.setter
     def led_done_enable(self,enable: int):
-        self._reg_map.write_bit(reg_addr=0x3,bit_num=3,value=enable,retries=3) 
+        self._reg_map.write_field(LED_DONE, int(bool(enable)))
 
     @property
     def led_error_enable(self):
-        return self._reg_map.read_bit(reg_addr=0x3,bit_num=1,retries=3)
+        return bool(self._reg_map.read_field(LED_ERROR))
 
     @led_error_enable.setter
     def led_error_enable(self,enable):
-        self._reg_map.write_bit(reg_addr=0x3,bit_num=1,value=enable,retries=3)
+        self._reg_map.write_field(LED_ERROR, int(bool(enable)))
+
+    # helper methods
+    def _field_cleared(self, field: Field) -> bool:
+        '''True if the current batch switches a single bit field off'''
+        start = self._reg_map.batch_start_value(field.reg_addr)
+        return bool(start & field.mask) and \
+            not self._reg_map.read_field(field, transaction=False)
 
 
 class GPIOError(Exception):
@@ -1,7 +1,9 @@
 # standard library
 from __future__ import annotations
 import logging
+import time
 from enum import Enum
+from contextlib import contextmanager
 from cmd import Cmd
 import traceback
 
@@ -13,6 +15,10 @@ from ft4222 import I2CMaster
 from ft4222.I2CMaster import Flag
 from ft4222.I2CMaster import ControllerStatus as I2CStat
 
+# internal packages
+from .I2CMetrics import I2CMetrics
+from .Retry import RetryPolicy, CircuitBreaker
+
 # internal packages for command line tool
 # from .ConnectionManager import ConnectionManager
 
@@ -22,12 +28,27 @@ class RegisterMap(object):
         self,
         i2c: I2C = None,
         address: int = 0,
-        registers: list[Register] = []):
+        registers: list[Register] = [],
+        cache: bool = False,
+        cache_ttl_s: float = 0.0,
+        retry_policy: RetryPolicy = None):
 
         self._i2c = i2c
+        self._retry_policy = retry_policy   # None uses the bus policy
         self._address = address
         self._registers = {reg.address:reg for reg in registers}
 
+        # shadow cache, stable registers are served from the shadow value
+        # once synced, volatile registers are reused for cache_ttl_s
+        self._cache = cache
+        self._cache_ttl_s = cache_ttl_s
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        # deferred (batched) writes
+        self._deferred = False
+        self._batch_values = {}
+
     # def __getitem__(self, key: str):
     #     return self._registers.get(key, None)
 
@@ -47,11 +68,51 @@ class RegisterMap(object):
         for reg in self._registers:
             print(reg)
 
+    @property
+    def cache(self) -> bool:
+        return self._cache
+
+    @cache.setter
+    def cache(self, enable: bool):
+        self._cache = enable
+
+    @property
+    def cache_ttl_s(self) -> float:
+        return self._cache_ttl_s
+
+    @cache_ttl_s.setter
+    def cache_ttl_s(self, ttl_s: float):
+        self._cache_ttl_s = ttl_s
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        return self._retry_policy
+
+    @retry_policy.setter
+    def retry_policy(self, policy: RetryPolicy):
+        self._retry_policy = policy
+
+    @property
+    def cache_stats(self) -> dict:
+        return {'hits' : self._cache_hits, 'misses' : self._cache_misses}
+
+    @property
+    def dirty_registers(self) -> list[int]:
+        return [addr for addr, reg in self._registers.items() if reg.dirty]
+
+    def invalidate(self, reg_addr: int = None):
+        '''Force the next read of reg_addr (or all registers) onto the bus'''
+        if reg_addr is None:
+            for reg in self._registers.values():
+                reg.invalidate()
+        else:
+            self._registers[reg_addr].invalidate()
+
     def write_reg(
         self,
         reg_addr: int,
         value: int=None,
-        retries: int=0
+        retries: int=None
     ):
 
         reg = self._registers.get(reg_addr, None)
@@ -65,20 +126,28 @@ class RegisterMap(object):
         if value is not None:
             reg.value = value
 
+        if self._deferred:  # written on flush
+            return
+
         if self._i2c:
             addr = self._address
             reg_value = reg.value
             # print(reg_addr,reg_value)
             data = bytearray((reg_addr,reg_value))
 
-            self._i2c.write(addr,data,retries)
+            try:
+                self._i2c.write(addr,data,retries,self._retry_policy)
+            except I2CError as e:
+                reg.invalidate()
+                raise e
+            reg.sync(time.monotonic())
 
     def write_bit(
         self,
         reg_addr: int,
         bit_num: int,
         value: int,
-        retries: int=0
+        retries: int=None
     ):
 
         reg = self._registers.get(reg_addr, None)
@@ -102,7 +171,7 @@ class RegisterMap(object):
         self,
         reg_addr: int,
         transaction=True,
-        retries: int=0
+        retries: int=None
     ) -> int:
 
         reg = self._registers.get(reg_addr, None)
@@ -110,13 +179,22 @@ class RegisterMap(object):
             raise I2CError('invalid register address')
             return
 
+        if self._deferred and reg.dirty:   # pending write wins
+            return reg.value
+
         if self._i2c and transaction:
+            now = time.monotonic()
+            if self._cache_lookup(reg, now):
+                return reg.value
+
             # transaction
             addr = self._address
             data = reg_addr
-            word = self._i2c.read(addr,data,reg.num_bytes,retries)
+            word = self._i2c.read(
+                addr,data,reg.num_bytes,retries,self._retry_policy)
 
             reg.value = int.from_bytes(word,'big')
+            reg.sync(now)
 
 
         return reg.value
@@ -126,7 +204,7 @@ class RegisterMap(object):
         reg_addr: int,
         bit_num,
         transaction=True,
-        retries: int=0
+        retries: int=None
     ):
         reg = self._registers.get(reg_addr, None)
         if not reg:
@@ -137,25 +215,220 @@ class RegisterMap(object):
             self.read_reg(reg_addr,retries=retries)
         return reg.get_bit(bit_num)
 
+    def read_field(
+        self,
+        field: Field,
+        transaction=True,
+        retries: int=None
+    ) -> int:
+        reg = self._registers.get(field.reg_addr, None)
+        if not reg:
+            raise I2CError('invalid register address')
+
+        if transaction:
+            self.read_reg(field.reg_addr,retries=retries)
+        return reg.get_field(field)
+
+    def write_field(
+        self,
+        field: Field,
+        value: int,
+        retries: int=None
+    ):
+        reg = self._registers.get(field.reg_addr, None)
+        if not reg:
+            raise I2CError('invalid register address')
+        elif reg.read_write == 'r':
+            raise I2CError('register is read only')
+
+        reg.set_field(field, value)
+        self.write_reg(field.reg_addr,None,retries)
+
+    def read_block(
+        self,
+        start_addr: int,
+        end_addr: int,
+        retries: int=None
+    ) -> bytes:
+        '''Read a contiguous register range in a single transaction
+
+        The device auto-increments its register pointer, so one pointer
+        write + repeated start read returns every byte from start_addr to
+        end_addr (inclusive).  Shadow values of all mapped registers in the
+        range are updated from the returned buffer; unmapped addresses in
+        the range are read but discarded.
+        '''
+        if end_addr < start_addr:
+            raise I2CError('invalid register range')
+
+        num_bytes = end_addr - start_addr + 1
+
+        if not self._i2c:
+            return None
+
+        block_regs = [reg for reg_addr, reg in self._registers.items() \
+            if reg_addr >= start_addr \
+                and reg_addr + reg.num_bytes - 1 <= end_addr]
+
+        now = time.monotonic()
+        if self._cache and block_regs \
+                and all(reg.fresh(now, self._cache_ttl_s) for reg in block_regs):
+            self._cache_hits += 1
+            block = bytearray(num_bytes)
+            for reg in block_regs:
+                offset = reg.address - start_addr
+                block[offset:offset + reg.num_bytes] = \
+                    reg.value.to_bytes(reg.num_bytes,'big')
+            return bytes(block)
+        elif self._cache:
+            self._cache_misses += 1
+
+        block = self._i2c.read(
+            self._address,start_addr,num_bytes,retries,self._retry_policy)
+
+        for reg in block_regs:
+            offset = reg.address - start_addr
+            word = block[offset:offset + reg.num_bytes]
+            reg.value = int.from_bytes(word,'big')
+            reg.sync(now)
+
+        return block
+
+    def read_word(
+        self,
+        msb_addr: int,
+        retries: int=None
+    ) -> int:
+        '''Read a 16 bit value split across msb_addr and msb_addr + 1'''
+        self.read_block(msb_addr, msb_addr + 1, retries)
+        return uint8_to_uint(
+            self.read_reg(msb_addr, transaction=False),
+            self.read_reg(msb_addr + 1, transaction=False))
+
+    def write_word(
+        self,
+        msb_addr: int,
+        value: int,
+        retries: int=None
+    ):
+        '''Write a 16 bit value to msb_addr and msb_addr + 1 in a single
+        transaction, so the device never holds a half written word
+        '''
+        regs = [self._registers.get(reg_addr, None) \
+            for reg_addr in (msb_addr, msb_addr + 1)]
+        if not all(regs):
+            raise I2CError('invalid register address')
+        elif any(reg.read_write == 'r' for reg in regs):
+            raise I2CError('register is read only')
+
+        for reg, byte in zip(regs, uint_to_uint8(value)):
+            reg.value = byte
+
+        if self._deferred:  # written on flush
+            return
+
+        if self._i2c:
+            data = bytearray((msb_addr, regs[0].value, regs[1].value))
+            try:
+                self._i2c.write(self._address,data,retries,self._retry_policy)
+            except I2CError as e:
+                for reg in regs:
+                    reg.invalidate()
+                raise e
+
+            now = time.monotonic()
+            for reg in regs:
+                reg.sync(now)
+
                      
 
 
+    def begin_batch(self):
+        '''Defer register writes until flush, each dirty register is then
+        written once with its final value
+        '''
+        self._deferred = True
+        self._batch_values = {addr:reg.value \
+            for addr, reg in self._registers.items()}
+
+    def batch_start_value(self, reg_addr: int) -> int:
+        '''shadow value of reg_addr when the current batch began'''
+        return self._batch_values.get(reg_addr)
+
+    def flush(self, order: list[int] = None, retries: int=None):
+        '''End a batch and write every dirty register
+
+        :param order: register addresses to write first, in order
+        '''
+        batch_values = self._batch_values
+        self._deferred = False
+        self._batch_values = {}
+
+        dirty = self.dirty_registers
+        if order:
+            first = [addr for addr in order if addr in dirty]
+            dirty = first + [addr for addr in dirty if addr not in first]
+
+        try:
+            for reg_addr in dirty:
+                self.write_reg(reg_addr, retries=retries)
+        except BaseException as e:
+            # drop the writes that did not go through and read the device
+            # again, rather than report values it may not hold
+            for reg_addr in self.dirty_registers:
+                reg = self._registers[reg_addr]
+                reg.revert(batch_values.get(reg_addr, reg.value))
+                reg.invalidate()
+            raise e
+
+    def rollback(self):
+        '''End a batch and discard its pending writes'''
+        for reg_addr, value in self._batch_values.items():
+            self._registers[reg_addr].revert(value)
+
+        self._deferred = False
+        self._batch_values = {}
+
+    # helper methods
+    def _cache_lookup(self, reg: Register, now: float) -> bool:
+        if not self._cache:
+            return False
+
+        if reg.fresh(now, self._cache_ttl_s):
+            self._cache_hits += 1
+            return True
+        else:
+            self._cache_misses += 1
+            return False
+
     # def write_all(self):
     #     for reg
         
+# single bit masks, indexed by bit number
+BIT_MASKS = tuple(1 << bit_num for bit_num in range(32))
+
 class Register(object):
     """docstring for I2CRegister"""
+    __slots__ = ('_address', '_read_write', '_num_bytes', '_value',
+        '_volatile', '_synced_at', '_dirty')
+
     def __init__(
         self,
         address:    int,
         read_write: str,
         num_bytes:  int,
-        default:    int):
+        default:    int,
+        volatile:   bool = True):
 
         self._address       = address
         self._read_write    = read_write
         self._num_bytes     = num_bytes
         self._value         = default
+        self._volatile      = volatile
+
+        # shadow state
+        self._synced_at     = None  # monotonic time of last bus read/write
+        self._dirty         = False # shadow changed but not yet written
 
     # API
     @property
@@ -177,26 +450,69 @@ class Register(object):
     @value.setter
     def value(self, value: int):
         self._value = value
+        self._dirty = True
+
+    @property
+    def volatile(self) -> bool:
+        return self._volatile
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
 
     @property
     def value_hex(self) -> str:
         return ('0x'+self._value.hex)   
 
     def set_bit(self, bit_num: int, value: int) -> int:
-        word = self.value
-        mask = 2 ** bit_num
         if value:
-            word |= mask
+            word = self._value | BIT_MASKS[bit_num]
         else:
-            word &= ~mask
+            word = self._value & ~BIT_MASKS[bit_num]
         self._value = word
+        self._dirty = True
 
         return word
 
     def get_bit(self, bit_num) -> bool:
-        word = self.value
-        mask = 2 ** bit_num
-        return bool(word & mask)
+        return bool(self._value & BIT_MASKS[bit_num])
+
+    def get_field(self, field: Field) -> int:
+        return (self._value & field.mask) >> field.shift
+
+    def set_field(self, field: Field, value: int) -> int:
+        if value < 0 or value > field.max_value:
+            raise I2CError(f'invalid field value: {value}')
+        self._value = (self._value & field.clear_mask) | (value << field.shift)
+        self._dirty = True
+
+        return self._value
+
+    def sync(self, timestamp: float):
+        '''Mark shadow value as matching the device'''
+        self._synced_at = timestamp
+        self._dirty = False
+
+    def invalidate(self):
+        self._synced_at = None
+
+    def revert(self, value: int):
+        '''Drop a pending local change'''
+        self._value = value
+        self._dirty = False
+
+    def fresh(self, now: float, ttl_s: float) -> bool:
+        '''True if the shadow value can stand in for a bus read
+
+        A dirty shadow holds a value never written to the device, pending
+        batch writes are served by RegisterMap.read_reg instead.
+        '''
+        if self._synced_at is None or self._dirty:
+            return False
+        elif not self._volatile:
+            return True
+        else:
+            return now - self._synced_at <= ttl_s
     
 
     ## TODO indexing
@@ -233,6 +549,27 @@ class Register(object):
     #     return 8 * self._num_bytes - 1 - bit
 
 
+class Field(object):
+    """Named bitfield of a register with precomputed mask and shift
+
+    :param reg_addr: register holding the field
+    :param shift: bit number of the field lsb
+    :param width: field width in bits
+    """
+    __slots__ = ('reg_addr', 'shift', 'width', 'mask', 'clear_mask',
+        'max_value')
+
+    def __init__(self, reg_addr: int, shift: int, width: int = 1):
+        self.reg_addr = reg_addr
+        self.shift = shift
+        self.width = width
+        self.max_value = (1 << width) - 1
+        self.mask = self.max_value << shift
+        self.clear_mask = ~self.mask
+
+    def __repr__(self):
+        return f'Field(reg: {hex(self.reg_addr)} mask: {hex(self.mask)})'
+
 class RegType(str,Enum):
     READ        = 'r'
     WRITE       = 'w'
@@ -241,15 +578,86 @@ class RegType(str,Enum):
     def __str__(self) -> str:
         return str.__str__(self)
 
+class BusWait(object):
+    """Bounded adaptive wait for the I2C controller to leave BUSY
+
+    Polls back-to-back for the first spin_polls reads (most transactions
+    finish within a few USB round trips), then sleeps between polls with
+    exponential backoff from sleep_min_s up to sleep_max_s.  Raises
+    I2CTimeoutError once timeout_s has elapsed.
+    """
+    def __init__(
+        self,
+        spin_polls: int = 10,
+        sleep_min_s: float = 0.0001,
+        sleep_max_s: float = 0.005,
+        backoff: float = 2.0,
+        timeout_s: float = 0.5):
+
+        self.spin_polls = spin_polls
+        self.sleep_min_s = sleep_min_s
+        self.sleep_max_s = sleep_max_s
+        self.backoff = backoff
+        self.timeout_s = timeout_s
+
+    def wait(self, get_status, busy_mask: int) -> tuple[int, int]:
+        '''Poll get_status until none of busy_mask is set
+
+        :return: final controller status and number of polls used
+        '''
+        deadline = time.monotonic() + self.timeout_s
+        delay = self.sleep_min_s
+        polls = 0
+
+        while True:
+            stat = get_status()
+            polls += 1
+            if not (stat & busy_mask):
+                return stat, polls
+
+            if polls >= self.spin_polls:
+                if time.monotonic() > deadline:
+                    raise I2CTimeoutError(
+                        f'controller busy after {polls} polls ({hex(stat)})')
+                time.sleep(delay)
+                delay = min(delay * self.backoff, self.sleep_max_s)
+
 class I2C(object):
     FLAG_REPEATED_START = 3
     FLAG_STOP = 4
+    SUPPORTED_SPEEDS_KBPS = (100, 400, 1000)
+    CALIBRATION_PATTERNS = (0x55, 0xAA, 0x00, 0xFF)
 
-    def __init__(self, ic: FT4222, name: str = None, speed_kbps: int = 100):
+    def __init__(
+        self,
+        ic: FT4222,
+        name: str = None,
+        speed_kbps: int = 100,
+        bus_wait: BusWait = None,
+        retry_policy: RetryPolicy = None,
+        breaker_options: dict = None):
         self.logger = logging.getLogger('batman.TestBoxIF.I2C.I2C')
 
         self._ic = ic
         self._name = name
+        self._speed_kbps = None
+        self._bus_wait = bus_wait if bus_wait else BusWait()
+
+        # status poll bookkeeping
+        self._polls = 0
+        self._last_poll_count = 0
+        self._poll_total = 0
+        self._transaction_count = 0
+        self._nack_count = 0
+
+        # opt-in transaction metrics
+        self._metrics = None
+
+        # retries and per device address circuit breakers
+        self._retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self._breaker_options = breaker_options if breaker_options else {}
+        self._breakers = {}
+
         self.hw_init(speed_kbps)
 
         self.logger.info('I2C init')
@@ -262,35 +670,124 @@ class I2C(object):
         return 'I2C object'
 
     def hw_init(self, speed_kbps: int):
-        stat = self._ic.i2cMaster_Init(100)    # speed in kbps
-        self.logger.info('i2c hw init')
+        if speed_kbps not in self.SUPPORTED_SPEEDS_KBPS:
+            raise I2CError(f'unsupported bus speed {speed_kbps} kbps')
+
+        stat = self._ic.i2cMaster_Init(speed_kbps)    # speed in kbps
+        self._speed_kbps = speed_kbps
+        self.logger.info(f'i2c hw init {speed_kbps} kbps')
+
+    def calibrate_speed(
+        self,
+        probes: list[tuple[int, int]],
+        speeds: tuple[int] = SUPPORTED_SPEEDS_KBPS
+    ) -> int:
+        '''Find the fastest bus speed with error free register read-back
+
+        Steps up through speeds, at each one writing test patterns to every
+        (device address, register) probe and reading them back.  Probe
+        registers must be harmless to change, the original values are
+        restored.  Settles on the last speed that passed.
+
+        :param probes: read/write registers to verify
+        :return: selected speed in kbps
+        '''
+        best = None
+        originals = {}
+        for speed in sorted(speeds):
+            self.hw_init(speed)
+            if not self._verify_probes(probes, originals):
+                break
+            best = speed
+
+        if best is None:
+            self.logger.warning('bus speed calibration failed at all speeds')
+            best = min(speeds)
+
+        # failures while probing are not a sign of a bad device
+        for breaker in self._breakers.values():
+            breaker.reset()
+
+        self.hw_init(best)
+        for (addr, reg_addr), value in originals.items():
+            try:
+                self.write(addr, bytearray((reg_addr, value)))
+            except I2CError as e:
+                self.logger.warning(f'unable to restore {hex(addr)} {hex(reg_addr)}')
+
+        self.logger.info(f'bus speed calibrated to {best} kbps')
+        return best
 
     def write(
         self,
         addr: int,
         data: bytearray,
-        retries: int=0):
+        retries: int=None,
+        policy: RetryPolicy=None):
+        '''Write data to device addr
+
+        :param retries: overrides the retry count of the policy
+        :param policy: retry policy, defaults to the bus policy
+        '''
+        policy = policy if policy else self._retry_policy
+        retries = policy.retries if retries is None else retries
+
+        if self._metrics is None:
+            return self._guarded(addr, self._write, addr, data, retries, policy)
+
+        with self._measure(addr, data[0], 'write'):
+            return self._guarded(addr, self._write, addr, data, retries, policy)
+
+    def read(
+        self,
+        addr: int,
+        data: int,
+        num_bytes: int,
+        retries: int=None,
+        policy: RetryPolicy=None
+    ) -> bytearray:
+        '''Read num_bytes from device addr starting at register data
+
+        :param retries: overrides the retry count of the policy
+        :param policy: retry policy, defaults to the bus policy
+        '''
+        policy = policy if policy else self._retry_policy
+        retries = policy.retries if retries is None else retries
+
+        if self._metrics is None:
+            return self._guarded(
+                addr, self._read, addr, data, num_bytes, retries, policy)
+
+        with self._measure(addr, data, 'read'):
+            return self._guarded(
+                addr, self._read, addr, data, num_bytes, retries, policy)
+
+    def _write(
+        self,
+        addr: int,
+        data: bytearray,
+        retries: int,
+        policy: RetryPolicy):
         # print(f'write - addr: {addr} data: {data}')
         # traceback.print_stack()
 
+        retry_num = 0
         while retries >= 0:
             # print(f'{hex(addr)} - {data}')
             try:
                 retries -= 1
-                self.logger.debug(f'write - addr: {hex(addr)}\tdata: {data}')
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug('write - addr: %s\tdata: %s', hex(addr), data)
+                self._polls = 0
                 self._ic.i2cMaster_Write(addr, data)
 
                 # wait until not busy
-                while True:
-                    stat = self.i2c_status
-                    if not (stat & (I2CStat.BUSY | I2CStat.BUS_BUSY)):
-                        break
+                stat = self._wait_status(I2CStat.BUSY | I2CStat.BUS_BUSY)
 
-                # stat = self.i2c_status
-                
                 if stat == I2CStat.IDLE:  # ok
                     return True
-                elif stat in (I2CStat.ADDRESS_NACK, I2CStat.DATA_NACK):
+                elif stat & (I2CStat.ADDRESS_NACK | I2CStat.DATA_NACK):
+                    self._nack_count += 1
                     raise I2CNoDeviceError
                 else:
                     raise I2CWriteError(stat)
@@ -298,37 +795,43 @@ class I2C(object):
             except I2CError as e:
                 if retries < 0:
                     raise e
+                time.sleep(policy.delay(retry_num))
+                retry_num += 1
             except ft4222.FT4222DeviceError as e:
                 raise e
                 break
             except Exception as e:
                 self.logger.exception(e)
+            finally:
+                self._end_transaction()
 
 
-    def read(
+    def _read(
         self,
         addr: int,
         data: int,
         num_bytes: int,
-        retries: int=0
+        retries: int,
+        policy: RetryPolicy
     ) -> bytearray:
+        retry_num = 0
         while retries >= 0:
             try:
                 retries -= 1
                 # address pointer write
                 wr_flags = Flag.START
-                self.logger.debug(f'write ptr - addr: {hex(addr)}\treg: {data}')
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug('write ptr - addr: %s\treg: %s', hex(addr), data)
+                self._polls = 0
                 self._ic.i2cMaster_WriteEx(addr, wr_flags, data)
 
                 # wait until not busy
-                while True:
-                    stat = self.i2c_status
-                    if not (stat & I2CStat.BUSY):
-                        break
-                
+                stat = self._wait_status(I2CStat.BUSY)
+
                 if stat == I2CStat.BUS_BUSY:  # for combined write read
                     pass
-                elif stat in (I2CStat.ADDRESS_NACK, I2CStat.DATA_NACK):
+                elif stat & (I2CStat.ADDRESS_NACK | I2CStat.DATA_NACK):
+                    self._nack_count += 1
                     raise I2CNoDeviceError
                 else:
                     raise I2CReadError('write')
@@ -338,17 +841,15 @@ class I2C(object):
                 rd_flags = Flag.REPEATED_START | Flag.STOP
                 data_rd = self._ic.i2cMaster_ReadEx(addr,rd_flags,num_bytes)
                 # print(data_rd)
-                self.logger.debug(f'read - addr: {hex(addr)}\tdata: {data_rd}')
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug('read - addr: %s\tdata: %s', hex(addr), data_rd)
 
-                data_no_device = b'\x00'
-                while self.i2c_status & (I2CStat.BUSY | I2CStat.BUS_BUSY):
-                    # print(self.i2c_status)
-                    pass
-                stat = self.i2c_status
+                stat = self._wait_status(I2CStat.BUSY | I2CStat.BUS_BUSY)
 
                 if stat == I2CStat.IDLE:  # ok
                     return data_rd
-                elif ord(data_rd) == 0:
+                elif not any(data_rd):
+                    self._nack_count += 1
                     raise I2CNoDeviceError
                 else:
                     raise I2CReadError('read')
@@ -356,17 +857,150 @@ class I2C(object):
             except I2CError as e:
                 if retries < 0:
                     raise e
+                time.sleep(policy.delay(retry_num))
+                retry_num += 1
             except ft4222.FT4222DeviceError as e:
                 raise e
                 break
+            finally:
+                self._end_transaction()
 
     @property
     def i2c_status(self):
         return self._ic.i2cMaster_GetStatus()
 
+    @property
+    def speed_kbps(self) -> int:
+        return self._speed_kbps
+
+    @speed_kbps.setter
+    def speed_kbps(self, speed_kbps: int):
+        self.hw_init(speed_kbps)
+
+    @property
+    def bus_wait(self) -> BusWait:
+        return self._bus_wait
+
+    @bus_wait.setter
+    def bus_wait(self, bus_wait: BusWait):
+        self._bus_wait = bus_wait
+
+    @property
+    def last_poll_count(self) -> int:
+        '''status polls used by the last completed transaction'''
+        return self._last_poll_count
+
+    @property
+    def poll_total(self) -> int:
+        return self._poll_total
+
+    @property
+    def transaction_count(self) -> int:
+        return self._transaction_count
+
+    @property
+    def nack_count(self) -> int:
+        return self._nack_count
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        return self._retry_policy
+
+    @retry_policy.setter
+    def retry_policy(self, policy: RetryPolicy):
+        self._retry_policy = policy
+
+    def breaker(self, addr: int) -> CircuitBreaker:
+        '''circuit breaker guarding device addr'''
+        breaker = self._breakers.get(addr)
+        if breaker is None:
+            breaker = self._breakers[addr] = \
+                CircuitBreaker(**self._breaker_options)
+        return breaker
+
+    @property
+    def metrics(self) -> I2CMetrics:
+        return self._metrics
+
+    def enable_metrics(self, metrics: I2CMetrics = None) -> I2CMetrics:
+        if metrics is not None:
+            self._metrics = metrics
+        elif self._metrics is None:
+            self._metrics = I2CMetrics()
+        return self._metrics
+
+    def disable_metrics(self):
+        self._metrics = None
+
     @property
     def name(self):
         return self._name
+
+    # helper methods
+    def _wait_status(self, busy_mask: int) -> int:
+        stat, polls = self._bus_wait.wait(
+            self._ic.i2cMaster_GetStatus, busy_mask)
+        self._polls += polls
+        return stat
+
+    def _verify_probes(
+        self,
+        probes: list[tuple[int, int]],
+        originals: dict
+    ) -> bool:
+        '''Pattern write/read-back on every probe, records original values'''
+        for addr, reg_addr in probes:
+            try:
+                original = self.read(addr, reg_addr, 1, retries=0)[0]
+                originals.setdefault((addr, reg_addr), original)
+                for pattern in self.CALIBRATION_PATTERNS:
+                    self.write(addr, bytearray((reg_addr, pattern)), retries=0)
+                    if self.read(addr, reg_addr, 1, retries=0)[0] != pattern:
+                        return False
+            except I2CError:
+                return False
+        return True
+
+    def _guarded(self, addr: int, transaction, *args):
+        '''Run transaction unless the breaker for addr is open'''
+        breaker = self.breaker(addr)
+        if not breaker.allow():
+            raise I2CCircuitOpenError(f'device {hex(addr)} circuit open')
+
+        try:
+            result = transaction(*args)
+        except (I2CError, ft4222.FT4222DeviceError) as e:
+            breaker.record_failure()
+            raise e
+
+        breaker.record_success()
+        return result
+
+    @contextmanager
+    def _measure(self, addr: int, reg_addr: int, op: str):
+        start = time.perf_counter()
+        polls = self._poll_total
+        attempts = self._transaction_count
+        nacks = self._nack_count
+        error = False
+        try:
+            yield
+        except (I2CError, ft4222.FT4222DeviceError) as e:
+            error = True
+            raise e
+        finally:
+            self._metrics.record(
+                addr, reg_addr, op,
+                latency_s = time.perf_counter() - start,
+                polls = self._poll_total - polls,
+                retries = max(self._transaction_count - attempts - 1, 0),
+                nacks = self._nack_count - nacks,
+                error = error)
+
+    def _end_transaction(self):
+        self._last_poll_count = self._polls
+        self._poll_total += self._polls
+        self._transaction_count += 1
     
 
 # helper functions
@@ -391,6 +1025,12 @@ class I2CWriteError(I2CError):
 class I2CNoDeviceError(I2CError):
     pass
 
+class I2CTimeoutError(I2CError):
+    pass
+
+class I2CCircuitOpenError(I2CError):
+    pass
+
 class DemoApp(Cmd):
     # shell settings
     intro = '\nI2C demo app.  Type help or ? to list commands.\n'
@@ -0,0 +1,124 @@
+'''
+Opt-in bus instrumentation for :class:`TestBoxIF.I2C`.
+
+Counts transactions and collects latency histograms per device address,
+register and operation, along with retries consumed, NACKs and status
+polls.
+'''
+
+# standard library
+import json
+import math
+
+# external packages
+
+# internal packages
+
+# latency histogram bucket upper bounds (us), last bucket catches the rest
+LATENCY_BUCKETS_US = (100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000,
+    100000, math.inf)
+
+class LatencyHistogram(object):
+    """Fixed bucket latency histogram"""
+    def __init__(self):
+        self._counts = [0] * len(LATENCY_BUCKETS_US)
+        self._total_s = 0.0
+        self._min_s = math.inf
+        self._max_s = 0.0
+
+    def record(self, latency_s: float):
+        latency_us = latency_s * 1e6
+        for i, upper in enumerate(LATENCY_BUCKETS_US):
+            if latency_us <= upper:
+                self._counts[i] += 1
+                break
+
+        self._total_s += latency_s
+        self._min_s = min(self._min_s, latency_s)
+        self._max_s = max(self._max_s, latency_s)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def to_dict(self) -> dict:
+        count = self.count
+        return {
+            'count'     : count,
+            'avg_us'    : 1e6 * self._total_s / count if count else None,
+            'min_us'    : 1e6 * self._min_s if count else None,
+            'max_us'    : 1e6 * self._max_s,
+            'buckets_us': {f'<={upper}' : n \
+                for upper, n in zip(LATENCY_BUCKETS_US, self._counts) if n}
+        }
+
+class OpStats(object):
+    """Counters for one (address, register, operation) key"""
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.nacks = 0
+        self.polls = 0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self) -> dict:
+        return {
+            'count'     : self.count,
+            'errors'    : self.errors,
+            'retries'   : self.retries,
+            'nacks'     : self.nacks,
+            'polls'     : self.polls,
+            'latency'   : self.latency.to_dict()
+        }
+
+class I2CMetrics(object):
+    """Per address/register/operation transaction metrics"""
+    def __init__(self):
+        self._ops = {}
+
+    def record(
+        self,
+        addr: int,
+        reg_addr: int,
+        op: str,
+        latency_s: float,
+        polls: int = 0,
+        retries: int = 0,
+        nacks: int = 0,
+        error: bool = False):
+
+        key = (addr, reg_addr, op)
+        stats = self._ops.get(key)
+        if stats is None:
+            stats = self._ops[key] = OpStats()
+
+        stats.count += 1
+        stats.errors += int(error)
+        stats.retries += retries
+        stats.nacks += nacks
+        stats.polls += polls
+        stats.latency.record(latency_s)
+
+    def reset(self):
+        self._ops = {}
+
+    @property
+    def totals(self) -> dict:
+        totals = dict.fromkeys(('count','errors','retries','nacks','polls'), 0)
+        for stats in self._ops.values():
+            for key in totals:
+                totals[key] += getattr(stats, key)
+        return totals
+
+    def to_dict(self) -> dict:
+        ops = {f'{hex(addr)}/{hex(reg_addr)}/{op}' : stats.to_dict() \
+            for (addr, reg_addr, op), stats in sorted(self._ops.items())}
+        return {'totals' : self.totals, 'ops' : ops}
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def dump(self, fname: str):
+        with open(fname, 'w') as file:
+            file.write(self.to_json())
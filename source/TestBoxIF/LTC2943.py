@@ -1,7 +1,10 @@
 # standard library
-from enum import IntEnum
+from __future__ import annotations
+from enum import IntEnum, IntFlag
+from typing import NamedTuple
 from cmd import Cmd
 from datetime import datetime
+import time
 
 # external packages
 
@@ -9,9 +12,112 @@ from datetime import datetime
 from .I2C import I2C, I2CError
 from .I2C import RegisterMap
 from .I2C import Register
+from .I2C import Field
 from .I2C import uint8_to_uint, uint_to_uint8
+from .Retry import RetryPolicy
+from .Calibration import GasGaugeCalibration
 from .ConnectionManager import ConnectionManager
 
+# status register (0x00) alert bits
+CURRENT_ALERT = Field(0x00, 6)
+CHARGE_OVERFLOW_ALERT = Field(0x00, 5)
+TEMP_ALERT = Field(0x00, 4)
+CHARGE_HIGH_ALERT = Field(0x00, 3)
+CHARGE_LOW_ALERT = Field(0x00, 2)
+VOLTAGE_ALERT = Field(0x00, 1)
+UVLO_ALERT = Field(0x00, 0)
+
+# control register (0x01) fields
+ADC_MODE = Field(0x01, 6, 2)
+PRESCALER = Field(0x01, 3, 3)
+ALCC = Field(0x01, 1, 2)
+SHUTDOWN = Field(0x01, 0)
+
+# fixed point scale factors: value = (reg * mul + offset) * FIXED_POINT_LSB
+FIXED_POINT_BITS = 32
+FIXED_POINT_ONE = 1 << FIXED_POINT_BITS
+FIXED_POINT_LSB = 1.0 / FIXED_POINT_ONE
+
+class ScaleFactors(NamedTuple):
+    """Calibration compiled to integer multipliers and offsets
+
+    Conversions accept a register value or a sequence of them.
+    """
+    voltage_mul: int
+    voltage_offset: int
+    current_mul: int
+    current_offset: int
+    charge_mul: int
+    level_mul: int
+    temp_mul: int
+    temp_offset: int
+
+    def voltage_mV(self, regs):
+        return _apply(regs, self.voltage_mul, self.voltage_offset)
+
+    def current_mA(self, regs):
+        return _apply(regs, self.current_mul, self.current_offset)
+
+    def charge_mAh(self, regs):
+        return _apply(regs, self.charge_mul, 0)
+
+    def charge_level(self, regs):
+        return _apply(regs, self.level_mul, 0)
+
+    def temp_C(self, regs):
+        return _apply(regs, self.temp_mul, self.temp_offset)
+
+    # inverse, for threshold registers
+    def voltage_reg(self, voltage_mV: float) -> float:
+        return (voltage_mV * FIXED_POINT_ONE - self.voltage_offset) / self.voltage_mul
+
+    def current_reg(self, current_mA: float) -> float:
+        return (current_mA * FIXED_POINT_ONE - self.current_offset) / self.current_mul
+
+    def level_reg(self, level: float) -> float:
+        return level * FIXED_POINT_ONE / self.level_mul
+
+def _apply(regs, mul: int, offset: int):
+    if isinstance(regs, int):
+        return (regs * mul + offset) * FIXED_POINT_LSB
+    return [(reg * mul + offset) * FIXED_POINT_LSB for reg in regs]
+
+class GasGaugeSample(NamedTuple):
+    """Immutable gas gauge reading taken from a single register burst"""
+    timestamp: datetime
+    status: int
+    control: int
+    charge_reg: int
+    charge_mAh: float
+    charge_level: float
+    voltage_mV: float
+    current_mA: float
+    temp_C: float
+
+    @property
+    def alerts(self) -> Alert:
+        return Alert(self.status)
+
+    @property
+    def overflow(self) -> bool:
+        return bool(self.status & CHARGE_OVERFLOW_ALERT.mask)
+
+    @property
+    def discharged(self) -> bool:
+        '''control register back at its power on default'''
+        return self.control == 0x3C
+
+    def as_dict(self) -> dict:
+        return {
+            'bat_timestamp'     : self.timestamp,
+            'bat_timestamp_ms'  : 0,
+            'bat_voltage_mV'    : self.voltage_mV,
+            'bat_current_mA'    : self.current_mA,
+            'bat_charge_mAh'    : self.charge_mAh,
+            'bat_charge_level'  : self.charge_level,
+            'bat_temp_C'        : self.temp_C
+        }
+
 class LTC2943(object):
     # constants
     # full scale register values from datasheet
@@ -21,38 +127,146 @@ class LTC2943(object):
     V_BAT_FS = 23.6
     V_SENSE_FS_mV = 60.0
 
+    T_FS_K = 510.0
+    KELVIN_OFFSET = 273.15
+
+    # prescaler M to control register code
+    PRESCALER_CODES = {1:0, 4:1, 16:2, 64:3, 256:4, 1024:5, 4096:6}
+
+    # manual mode converts voltage, current and temperature once
+    CONVERSION_TIME_S = 0.05
+    # scan mode converts voltage, current and temperature every 10 s
+    SCAN_PERIOD_S = 10.0
+
+    # the accumulator must not be left half written
+    CHARGE_WRITE_RETRIES = 5
+
     def __init__(
         self,
         i2c: I2C = None,
         address: int = 0x64,
         r_sense_mohm: float = 5.0,
-        prescaler: int = 64):
-        ''''''
+        prescaler: int = 64,
+        cache: bool = True,
+        cache_ttl_s: float = 0.25,
+        retry_policy: RetryPolicy = None,
+        calibration: GasGaugeCalibration = None,
+        clock = time.monotonic,
+        sleep = time.sleep):
+        '''calibration overrides r_sense_mohm and prescaler, clock times
+        conversions and scan periods in seconds and sleep waits on the
+        same time base, e.g. a virtual clock
+        '''
 
         self._i2c = i2c
+        self._clock = clock
+        self._sleep = sleep
         self._address = address
-        self._r_sense_mohm = 5.0
-        self._prescaler = prescaler
-
+        if calibration is None:
+            calibration = GasGaugeCalibration(
+                r_sense_mohm=r_sense_mohm, prescaler=prescaler)
+        self.calibration = calibration
+
+        # last full burst in scan mode, voltage/current/temperature words
+        self._scan_read_at = None
+        self._adc_words = None
+        self._conversion_started_at = None
+
+        # every register is volatile: status and ADC results update on
+        # their own, the accumulator counts and control resets to 0x3C if
+        # the gauge loses power
         registers = [
             Register(0x00, 'r',  1, 0x00), # status
             Register(0x01, 'rw', 1, 0x3C), # control
             Register(0x02, 'rw', 1, 0x7F), # charge msb
             Register(0x03, 'rw', 1, 0xFF), # charge lsb
+            Register(0x04, 'rw', 1, 0xFF), # charge threshold high msb
+            Register(0x05, 'rw', 1, 0xFF), # charge threshold high lsb
+            Register(0x06, 'rw', 1, 0x00), # charge threshold low msb
+            Register(0x07, 'rw', 1, 0x00), # charge threshold low lsb
             Register(0x08, 'r',  1, 0x00), # voltage msb
             Register(0x09, 'r',  1, 0x00), # voltage lsb
+            Register(0x0A, 'rw', 1, 0xFF), # voltage threshold high msb
+            Register(0x0B, 'rw', 1, 0xFF), # voltage threshold high lsb
+            Register(0x0C, 'rw', 1, 0x00), # voltage threshold low msb
+            Register(0x0D, 'rw', 1, 0x00), # voltage threshold low lsb
             Register(0x0E, 'r',  1, 0x00), # current msb
             Register(0x0F, 'r',  1, 0x00), # current lsb
+            Register(0x10, 'rw', 1, 0xFF), # current threshold high msb
+            Register(0x11, 'rw', 1, 0xFF), # current threshold high lsb
+            Register(0x12, 'rw', 1, 0x00), # current threshold low msb
+            Register(0x13, 'rw', 1, 0x00), # current threshold low lsb
             Register(0x14, 'r',  1, 0x00), # temperature msb
             Register(0x15, 'r',  1, 0x00)  # temperature lsb
         ]
         self._reg_map = RegisterMap(
             i2c = self._i2c,
             address = self._address,
-            registers=registers)
-        
+            registers=registers,
+            cache = cache,
+            cache_ttl_s = cache_ttl_s,
+            retry_policy = retry_policy)
+
 
     # API
+    @property
+    def reg_map(self) -> RegisterMap:
+        return self._reg_map
+
+    @property
+    def clock(self):
+        return self._clock
+
+    @clock.setter
+    def clock(self, clock):
+        self._clock = clock
+        self._scan_read_at = None
+
+    @property
+    def sleep(self):
+        return self._sleep
+
+    @sleep.setter
+    def sleep(self, sleep):
+        self._sleep = sleep
+
+    @property
+    def calibration(self) -> GasGaugeCalibration:
+        return self._calibration
+
+    @calibration.setter
+    def calibration(self, calibration: GasGaugeCalibration):
+        if calibration.prescaler not in self.PRESCALER_CODES:
+            raise GasGaugeError(f'invalid prescaler: {calibration.prescaler}')
+        self._calibration = calibration
+        self._r_sense_mohm = calibration.r_sense_mohm
+        self._prescaler = calibration.prescaler
+        self._scale = self.compile_calibration(calibration)
+
+    @property
+    def scale(self) -> ScaleFactors:
+        '''compiled calibration, for converting logged raw registers'''
+        return self._scale
+
+    @classmethod
+    def compile_calibration(cls, calibration: GasGaugeCalibration) -> ScaleFactors:
+        q_lsb_mAh = cls.Q_SCALE * calibration.prescaler / calibration.r_sense_mohm
+        v_lsb_mV = 1000 * cls.V_BAT_FS / 0xFFFF
+        i_lsb_mA = 1000 * cls.V_SENSE_FS_mV / calibration.r_sense_mohm / 0x7FFF
+        t_lsb_K = cls.T_FS_K / 0xFFFF
+
+        current_mul = round(FIXED_POINT_ONE * i_lsb_mA * calibration.current_gain)
+        return ScaleFactors(
+            voltage_mul = round(FIXED_POINT_ONE * v_lsb_mV * calibration.voltage_gain),
+            voltage_offset = round(FIXED_POINT_ONE * calibration.voltage_offset_mV),
+            current_mul = current_mul,
+            current_offset = round(FIXED_POINT_ONE * calibration.current_offset_mA) \
+                - 0x7FFF * current_mul,     # zero current at mid scale
+            charge_mul = round(FIXED_POINT_ONE * q_lsb_mAh * calibration.charge_gain),
+            level_mul = round(FIXED_POINT_ONE * 100 / 0xFFFF),
+            temp_mul = round(FIXED_POINT_ONE * t_lsb_K),
+            temp_offset = round(-FIXED_POINT_ONE * cls.KELVIN_OFFSET))
+
     # 0x00
     @property
     def status_reg(self):
@@ -60,36 +274,42 @@ class LTC2943(object):
 
     @property
     def overflow(self):
-        return self._reg_map.read_bit(0x00, 5)
+        return bool(self._reg_map.read_field(CHARGE_OVERFLOW_ALERT))
 
-    # TODO Register indexing
-    # @property
-    # def current_alert(self):
-    #     return self._reg_map['0x00'][6]
+    @property
+    def alerts(self) -> Alert:
+        return Alert(self._reg_map.read_reg(0x00))
 
-    # @property
-    # def charge_overflow_alert(self):
-    #     return self._reg_map['0x00'][5]
+    def clear_alerts(self) -> Alert:
+        '''Read the status register, which clears alerts whose condition
+        has gone away, and return the alerts that were latched
+        '''
+        self._reg_map.invalidate(0x00)
+        return self.alerts
 
-    # @property
-    # def temp_alert(self):
-    #     return self._reg_map['0x00'][4]
+    @property
+    def current_alert(self):
+        return bool(self._reg_map.read_field(CURRENT_ALERT))
 
-    # @property
-    # def charge_high_alert(self):
-    #     return self._reg_map['0x00'][3]
+    @property
+    def temp_alert(self):
+        return bool(self._reg_map.read_field(TEMP_ALERT))
 
-    # @property
-    # def charge_low_alert(self):
-    #     return self._reg_map['0x00'][2]
+    @property
+    def charge_high_alert(self):
+        return bool(self._reg_map.read_field(CHARGE_HIGH_ALERT))
 
-    # @property
-    # def voltage_alert(self):
-    #     return self._reg_map['0x00'][1]
+    @property
+    def charge_low_alert(self):
+        return bool(self._reg_map.read_field(CHARGE_LOW_ALERT))
 
-    # @property
-    # def uvlo_alert(self):
-    #     return self._reg_map['0x00'][3]
+    @property
+    def voltage_alert(self):
+        return bool(self._reg_map.read_field(VOLTAGE_ALERT))
+
+    @property
+    def uvlo_alert(self):
+        return bool(self._reg_map.read_field(UVLO_ALERT))
 
     # 0x01
     @property
@@ -100,15 +320,14 @@ class LTC2943(object):
     def config_reg(self, word: int):
         self._reg_map.write_reg(0x01, word)
 
-    # TODO Register indexing
-    # @property
-    # def adc_mode(self):
-    #     reg_val = int(self._reg_map['0x01'].value,0)
-    #     reg_val = (reg_val & 0xC0) >> 6
-    #     return reg_val
+    @property
+    def adc_mode(self):
+        return ADCMode(self._reg_map.read_field(ADC_MODE))
 
-    # @adc_mode.setter
-    # def adc_mode(self, mode: ADCMode):
+    @adc_mode.setter
+    def adc_mode(self, mode: ADCMode):
+        self._reg_map.write_field(ADC_MODE, ADCMode(mode))
+        self._scan_read_at = None
 
     # @property
     # def prescaler(self):
@@ -116,31 +335,16 @@ class LTC2943(object):
 
     @property
     def charge(self):
-        charge = {}
-        msb = self._reg_map.read_reg(0x02)
-        lsb = self._reg_map.read_reg(0x03)
-
-        try:
-            reg_value = uint8_to_uint(msb,lsb)
-            q_lsb =  self.Q_SCALE * self._prescaler / self._r_sense_mohm
-            battery_capacity = q_lsb * 0xFFFF
-            charge['reg'] = reg_value
-            charge['mAh'] = q_lsb * reg_value 
-            charge['level'] = 100 * reg_value / 0xFFFF
-        except TypeError as e:
-            # charge = None
-            print('comm err')
-        
-        return charge
+        reg_value = self._reg_map.read_word(0x02)
+        return self._reg_to_charge(reg_value)
 
     @charge.setter
     def charge(self, charge_lsbs):
         if charge_lsbs > 0xFFFF or charge_lsbs < 0:
             raise GasGaugeError(f'invalid charge value: {charge_lsbs} ({hex(charge_lsbs)}')
         else:
-            msb, lsb = uint_to_uint8(charge_lsbs)
-            self._reg_map.write_reg(0x02,msb,retries=5)
-            self._reg_map.write_reg(0x03,lsb,retries=5)
+            self._reg_map.write_word(
+                0x02,charge_lsbs,retries=self.CHARGE_WRITE_RETRIES)
 
     @property
     def charge_register(self):
@@ -166,64 +370,221 @@ class LTC2943(object):
     
     @property
     def voltage_mV(self):
-        try:
-            msb = self._reg_map.read_reg(0x08)
-            lsb = self._reg_map.read_reg(0x09)
-            reg_value = uint8_to_uint(msb,lsb)
-            voltage = 1000 * self.V_BAT_FS * reg_value / 0xFFFF # register to voltage 
-        except TypeError as e:
-            voltage = None 
-        
-        return voltage
+        reg_value = self._reg_map.read_word(0x08)
+        return self._reg_to_voltage_mV(reg_value)
 
     @property
     def current_mA(self):
-        msb = self._reg_map.read_reg(0x0E)
-        lsb = self._reg_map.read_reg(0x0F)
-        try:
-            reg_value = uint8_to_uint(msb,lsb)
-            i_bat_fs = self.V_SENSE_FS_mV / self._r_sense_mohm   # full scale current
-            current = 1000 * i_bat_fs * (reg_value - 0x7FFF) / 0x7FFF   # reg to current
-        except TypeError as e:
-            current = None
-        
-        return current
+        reg_value = self._reg_map.read_word(0x0E)
+        return self._reg_to_current_mA(reg_value)
+
+    @property
+    def temp_C(self):
+        reg_value = self._reg_map.read_word(0x14)
+        return self._reg_to_temp_C(reg_value)
+
+    def control_write(
+        self,
+        mode: ADCMode,
+        alcc: ALCCMode = None,
+        shutdown: bool = False):
+        '''Write the control register from its fields'''
+        if alcc is None:
+            alcc = ALCCMode.CHARGE_COMPLETE
+
+        word = (ADCMode(mode) << ADC_MODE.shift) \
+            | (self.PRESCALER_CODES[self._prescaler] << PRESCALER.shift) \
+            | (ALCCMode(alcc) << ALCC.shift) \
+            | (int(bool(shutdown)) << SHUTDOWN.shift)
+        self._reg_map.write_reg(0x01,word)
+        self._scan_read_at = None
+        if mode == ADCMode.MANUAL:
+            self._conversion_started_at = self._clock()
 
     def control_init(self):
-        self._reg_map.write_reg(0x01,0b10011010)
+        self.control_write(ADCMode.SCAN)
         _ = self.voltage_mV
 
     def control_auto(self):
-        self._reg_map.write_reg(0x01,0b11011010)
+        self.control_write(ADCMode.AUTOMATIC)
         _ = self.voltage_mV
 
+    def start_conversion(self):
+        '''Trigger a single voltage, current and temperature conversion
+
+        The gauge returns to sleep once the conversion is done, see
+        conversion_ready.
+        '''
+        self.adc_mode = ADCMode.MANUAL
+        self._conversion_started_at = self._clock()
+
+    @property
+    def conversion_ready(self) -> bool:
+        '''True once a manual conversion has completed'''
+        if self._conversion_started_at is None:
+            return False
+        self._reg_map.invalidate(0x01)  # the gauge clears the mode itself
+        return self._reg_map.read_field(ADC_MODE) == ADCMode.SLEEP
+
+    def measure(self, timeout_s: float = 0.5) -> GasGaugeSample:
+        '''Start a manual conversion and return the snapshot of its result'''
+        self.start_conversion()
+        self._sleep(self.CONVERSION_TIME_S)
+        deadline = self._clock() + timeout_s
+        while not self.conversion_ready:
+            if self._clock() > deadline:
+                raise GasGaugeError('conversion timeout')
+            self._sleep(self.CONVERSION_TIME_S / 10)
+
+        self._conversion_started_at = None
+        return self.snapshot()
+
+    # thresholds, None leaves the alert disabled (full scale)
+    def set_charge_thresholds(self, low_level: float = None, high_level: float = None):
+        '''Charge alert thresholds as charge level in %'''
+        low = self._level_to_reg(low_level) if low_level is not None else 0x0000
+        high = self._level_to_reg(high_level) if high_level is not None else 0xFFFF
+        self._reg_map.write_word(0x04, high)
+        self._reg_map.write_word(0x06, low)
+
+    def set_voltage_thresholds(self, low_mV: float = None, high_mV: float = None):
+        low = self._voltage_mV_to_reg(low_mV) if low_mV is not None else 0x0000
+        high = self._voltage_mV_to_reg(high_mV) if high_mV is not None else 0xFFFF
+        self._reg_map.write_word(0x0A, high)
+        self._reg_map.write_word(0x0C, low)
+
+    def set_current_thresholds(self, low_mA: float = None, high_mA: float = None):
+        '''Current window, the alert is raised outside low_mA..high_mA'''
+        low = self._current_mA_to_reg(low_mA) if low_mA is not None else 0x0000
+        high = self._current_mA_to_reg(high_mA) if high_mA is not None else 0xFFFF
+        self._reg_map.write_word(0x10, high)
+        self._reg_map.write_word(0x12, low)
+
+    def clear_thresholds(self):
+        self.set_charge_thresholds()
+        self.set_voltage_thresholds()
+        self.set_current_thresholds()
+        self.clear_alerts()
+
     def charge_init(self):
         self._reg_map.write_reg(0x02,0x19)  # the calibrated '0' point
         self._reg_map.write_reg(0x03,0x99)
 
+    def snapshot(self) -> GasGaugeSample:
+        '''Read status through temperature in one burst and convert it
+
+        Every value in the sample comes from the same bus transaction, so
+        charge, voltage and current belong to the same ADC moment.  In
+        scan mode voltage, current and temperature only change every
+        SCAN_PERIOD_S, in between only status, control and charge are read.
+        '''
+        now = self._clock()
+        block = None
+        if self._scan_read_at is not None \
+                and now - self._scan_read_at < self.SCAN_PERIOD_S:
+            block = self._reg_map.read_block(0x00, 0x03)
+            if block is not None \
+                    and self._control_to_adc_mode(block[0x01]) != ADCMode.SCAN:
+                block = None    # mode changed under us, e.g. power loss
+
+        if block is None:
+            block = self._reg_map.read_block(0x00, 0x15)
+            if block is None:
+                raise GasGaugeError('no i2c connection')
+            self._adc_words = (
+                uint8_to_uint(block[0x08], block[0x09]),
+                uint8_to_uint(block[0x0E], block[0x0F]),
+                uint8_to_uint(block[0x14], block[0x15]))
+            scan = self._control_to_adc_mode(block[0x01]) == ADCMode.SCAN
+            self._scan_read_at = now if scan else None
+        timestamp = datetime.now()
+
+        voltage_reg, current_reg, temp_reg = self._adc_words
+        charge_reg = uint8_to_uint(block[0x02], block[0x03])
+        charge = self._reg_to_charge(charge_reg)
+
+        return GasGaugeSample(
+            timestamp = timestamp,
+            status = block[0x00],
+            control = block[0x01],
+            charge_reg = charge_reg,
+            charge_mAh = charge['mAh'],
+            charge_level = charge['level'],
+            voltage_mV = self._reg_to_voltage_mV(voltage_reg),
+            current_mA = self._reg_to_current_mA(current_reg),
+            temp_C = self._reg_to_temp_C(temp_reg))
+
     def get_all(self) -> dict:
-        result = {
-            'bat_timestamp'     : datetime.now(),
-            'bat_timestamp_ms'  : 0,
-            'bat_voltage_mV'    : self.voltage_mV,
-            'bat_current_mA'    : self.current_mA,
-            'bat_charge_mAh'    : self.charge_mAh,
-            'bat_charge_level'  : self.charge_level,
-            'bat_temp_C'        : 0
-        }
+        return self.snapshot().as_dict()
+
+    # helper methods
+    def _reg_to_charge(self, reg_value: int) -> dict:
+        charge = {}
+        try:
+            charge['reg'] = reg_value
+            charge['mAh'] = self._scale.charge_mAh(reg_value)
+            charge['level'] = self._scale.charge_level(reg_value)
+        except TypeError as e:
+            # charge = None
+            print('comm err')
+
+        return charge
+
+    def _reg_to_voltage_mV(self, reg_value: int) -> float:
+        try:
+            voltage = self._scale.voltage_mV(reg_value)
+        except TypeError as e:
+            voltage = None 
+
+        return voltage
+
+    def _reg_to_current_mA(self, reg_value: int) -> float:
+        try:
+            current = self._scale.current_mA(reg_value)
+        except TypeError as e:
+            current = None
 
-        return result
+        return current
+
+    @staticmethod
+    def _clamp_reg(reg_value: float) -> int:
+        return min(max(round(reg_value), 0x0000), 0xFFFF)
+
+    def _level_to_reg(self, level: float) -> int:
+        # stay below full scale, the accumulator overflows rather than
+        # exceeding 0xFFFF
+        return min(self._clamp_reg(self._scale.level_reg(level)), 0xFFFE)
+
+    def _voltage_mV_to_reg(self, voltage_mV: float) -> int:
+        return self._clamp_reg(self._scale.voltage_reg(voltage_mV))
+
+    def _current_mA_to_reg(self, current_mA: float) -> int:
+        return self._clamp_reg(self._scale.current_reg(current_mA))
+
+    @staticmethod
+    def _control_to_adc_mode(control: int) -> ADCMode:
+        return ADCMode((control & ADC_MODE.mask) >> ADC_MODE.shift)
+
+    def _reg_to_temp_C(self, reg_value: int) -> float:
+        try:
+            temp = self._scale.temp_C(reg_value)
+        except TypeError as e:
+            temp = None
+
+        return temp
 
     def __str__(self):
-        if self.charge:
-            return f'{datetime.now().strftime("%H:%M:%S")}\n'\
-                f'charge: {self.charge["mAh"]:.0f} mAh '\
-                    f'({self.charge["level"]:.1f}%)\n'\
-                f'voltage: {self.voltage_mV:.0f} mV\n'\
-                f'current: {self.current_mA:.0f} mA'
-        else:
+        try:
+            sample = self.snapshot()
+        except (I2CError, GasGaugeError):
             return 'no battery connected'
 
+        return f'{sample.timestamp.strftime("%H:%M:%S")}\n'\
+            f'charge: {sample.charge_mAh:.0f} mAh '\
+                f'({sample.charge_level:.1f}%)\n'\
+            f'voltage: {sample.voltage_mV:.0f} mV\n'\
+            f'current: {sample.current_mA:.0f} mA'
+
 class GasGaugeError(Exception):
     pass
 
@@ -234,6 +595,22 @@ class ADCMode(IntEnum):
     SCAN = 2
     AUTOMATIC = 3
 
+class Alert(IntFlag):
+    """Status register (0x00) alert bits"""
+    NONE = 0
+    UVLO = 0x01
+    VOLTAGE = 0x02
+    CHARGE_LOW = 0x04
+    CHARGE_HIGH = 0x08
+    TEMP = 0x10
+    CHARGE_OVERFLOW = 0x20
+    CURRENT = 0x40
+
+class ALCCMode(IntEnum):
+    DISABLED = 0
+    CHARGE_COMPLETE = 1
+    ALERT = 2
+
 # demo command line app
 class DemoApp(Cmd):
     intro = 'LTC2943 demo app.  Type help or ? to list commands.\n'
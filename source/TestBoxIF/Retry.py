@@ -0,0 +1,113 @@
+'''
+Retry/backoff policy and per-device circuit breaker for I2C transactions.
+'''
+
+# standard library
+import random
+import time
+from enum import Enum
+
+# external packages
+
+# internal packages
+
+class RetryPolicy(object):
+    """Number of retries and jittered exponential backoff between them
+
+    The delay before retry n (0 based) is drawn uniformly from
+    [(1 - jitter) * d, d] with d = min(backoff_s * multiplier ** n,
+    backoff_max_s), so boxes sharing a host do not retry in lockstep.
+    """
+    def __init__(
+        self,
+        retries: int = 0,
+        backoff_s: float = 0.002,
+        backoff_max_s: float = 0.05,
+        multiplier: float = 2.0,
+        jitter: float = 0.5,
+        seed: int = None):
+
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.backoff_max_s = backoff_max_s
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def delay(self, retry_num: int) -> float:
+        delay = min(self.backoff_s * self.multiplier ** retry_num,
+            self.backoff_max_s)
+        return delay * (1 - self.jitter * self._random.random())
+
+    def __repr__(self):
+        return f'RetryPolicy(retries={self.retries}, backoff_s={self.backoff_s})'
+
+class BreakerState(Enum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+class CircuitBreaker(object):
+    """Fail fast while a device is known bad
+
+    Opens after failure_threshold consecutive failed transactions.  While
+    open every transaction is rejected; after reset_timeout_s one probe
+    transaction is let through (half open) and its outcome closes or
+    re-opens the breaker.
+    """
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout_s: float = 5.0,
+        clock = time.monotonic):
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._clock = clock
+
+        self._state = BreakerState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.num_rejected = 0
+
+    # API
+    @property
+    def state(self) -> BreakerState:
+        return self._state
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    def allow(self) -> bool:
+        if self._state == BreakerState.OPEN:
+            if self._clock() - self._opened_at >= self.reset_timeout_s:
+                self._state = BreakerState.HALF_OPEN
+            else:
+                self.num_rejected += 1
+                return False
+
+        if self._state == BreakerState.HALF_OPEN:
+            if self._probing:
+                self.num_rejected += 1
+                return False
+            self._probing = True
+
+        return True
+
+    def record_success(self):
+        self._state = BreakerState.CLOSED
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probing = False
+        if self._state == BreakerState.HALF_OPEN \
+                or self._failures >= self.failure_threshold:
+            self._state = BreakerState.OPEN
+            self._opened_at = self._clock()
+
+    def reset(self):
+        self.record_success()
@@ -6,6 +6,7 @@
 from .I2C import I2C
 from .GPIO import GPIO
 from .LTC2943 import LTC2943
+from .Calibration import GasGaugeCalibration
 
 class TestBoxHalf(object):
     """docstring for TestBoxHalf"""
@@ -13,10 +14,11 @@ class TestBoxHalf(object):
 
     def __init__(
         self,
-        i2c: I2C = None):
+        i2c: I2C = None,
+        calibration: GasGaugeCalibration = None):
 
         self._i2c = i2c
-        self._gas_gauge = LTC2943(i2c=i2c)
+        self._gas_gauge = LTC2943(i2c=i2c, calibration=calibration)
         self._gpio = GPIO(i2c=i2c)
         self._box_id = self._i2c.name
 
@@ -24,6 +26,10 @@ class TestBoxHalf(object):
     def box_id(self):
         return self._box_id
 
+    @property
+    def i2c(self):
+        return self._i2c
+
     @property
     def gas_gauge(self):
         return self._gas_gauge
@@ -1,4 +1,5 @@
 # standard library
+import sys
 import logging
 import curses
 import curses.textpad
@@ -10,6 +11,7 @@ import asyncio
 # internal packages
 from source import TestBoxIF
 from source.BatTest.TestManager import TestManager
+from source.BatTest.Checkpoint import CHECKPOINT_DIR
 
 from source.TestBoxIF.GPIO import GPIOError
 
@@ -41,7 +43,8 @@ class BatShell(Cmd):
         args_list = args.split()
         location_str = args_list[0]
 
-        opened = self._test_man.open_connection(location_str)
+        calibrate = '-c' in args_list     # calibrate bus speed
+        opened = self._test_man.open_connection(location_str, calibrate)
         if opened:
             self._box = self._test_man.bat_test(0)._if_board
         return opened
@@ -185,15 +188,17 @@ class BatShell(Cmd):
 
     def do_led_all_enable(self,args):
         if self._box:
-            self._box.gpio.led_run_enable   = 1
-            self._box.gpio.led_done_enable  = 1
-            self._box.gpio.led_error_enable = 1
+            with self._box.gpio.batch():
+                self._box.gpio.led_run_enable   = 1
+                self._box.gpio.led_done_enable  = 1
+                self._box.gpio.led_error_enable = 1
 
     def do_led_all_disable(self,args):
         if self._box:
-            self._box.gpio.led_run_enable   = 0
-            self._box.gpio.led_done_enable  = 0
-            self._box.gpio.led_error_enable = 0
+            with self._box.gpio.batch():
+                self._box.gpio.led_run_enable   = 0
+                self._box.gpio.led_done_enable  = 0
+                self._box.gpio.led_error_enable = 0
 
     def do_read_input_word(self,args):
         args_list = args.split()
@@ -248,16 +253,45 @@ class BatShell(Cmd):
                 # print('battery not present')
                 
 
+    # bus metrics
+    def do_i2c_metrics(self,args):
+        '''i2c_metrics [on|off|reset|json [fname]] - bus transaction metrics'''
+        if not self._box:
+            return
+
+        args_list = args.split()
+        cmd = args_list[0] if args_list else ''
+        i2c = self._box.i2c
+
+        if cmd == 'on':
+            i2c.enable_metrics()
+        elif cmd == 'off':
+            i2c.disable_metrics()
+        elif not i2c.metrics:
+            print('i2c metrics disabled')
+        elif cmd == 'reset':
+            i2c.metrics.reset()
+        elif cmd == 'json':
+            if len(args_list) > 1:
+                i2c.metrics.dump(args_list[1])
+            else:
+                print(i2c.metrics.to_json())
+        else:
+            print(i2c.metrics.totals)
+            return i2c.metrics.to_dict()
+
     def do_exit(self,args):
         return True
 
     # DMMs
 
     # helper methods
-    def __init__(self, standalone = False):
+    def __init__(self, standalone = False, simulated = False):
         super(BatShell, self).__init__()
         self.logger = logging.getLogger('batman.UI.BatShell')
-        self._test_man = TestManager(standalone)
+        # hardware tests resume after a restart, simulated ones start fresh
+        self._test_man = TestManager(standalone, simulated,
+            checkpoint_dir=None if simulated else CHECKPOINT_DIR)
         self._box = None
         self._test_log = None
 
@@ -278,4 +312,6 @@ class BatShell(Cmd):
 # cli app for testing
 if __name__ == '__main__':
 
-    shell = BatShell(standalone = True).cmdloop()
+    shell = BatShell(
+        standalone = True,
+        simulated = '--sim' in sys.argv).cmdloop()
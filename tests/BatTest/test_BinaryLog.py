@@ -0,0 +1,117 @@
+# unit tests for BinaryLog
+import csv
+from datetime import timedelta
+
+import pytest
+
+from source.TestBoxIF.Calibration import GasGaugeCalibration
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.TestBoxHalf import TestBoxHalf as BoxHalf
+from source.BatTest.Clock import VirtualClock
+from source.BatTest.FSM import FSM
+from source.BatTest.BinaryLog import BinaryLogReader, BinaryLogError
+from source.BatTest.TestLog import TestLog as Log, csv_headers
+
+# fixtures
+def result(i: int, current_mA: float, voltage_mV: float) -> dict:
+    return {
+        'bat_timestamp' : timedelta(seconds=i),
+        'bat_timestamp_ms' : 1000 * i,
+        'bat_voltage_mV' : voltage_mV,
+        'bat_current_mA' : current_mA,
+        'bat_charge_mAh' : i / 4,
+        'bat_charge_level' : 50,
+        'bat_temp_C' : 25
+    }
+
+def make_cycle():
+    '''precharge, constant current, tapering constant voltage, discharge'''
+    rows = [(300, 11000)] * 100 + [(1050, 14000)] * 200 \
+        + [(1000 - 5 * i, 16400) for i in range(100)] + [(-3000, 14000)] * 100
+    return [result(i, *row) for i, row in enumerate(rows)]
+
+@pytest.fixture
+def log(tmp_path):
+    log = Log(str(tmp_path / 'log.bin'), box_id='SimBox000A',
+        calibration=GasGaugeCalibration(r_sense_mohm=4.9))
+    for row in make_cycle():
+        log.add_result(row)
+    log.flush(wait=True)
+    return log
+
+# format
+def test_header(log):
+    with BinaryLogReader(log.fname) as reader:
+        assert reader.header['box_id'] == 'SimBox000A'
+        assert reader.header['calibration']['r_sense_mohm'] == 4.9
+        assert reader.header['limits']['precharge']['i_max'] == 390
+        assert len(reader) == 500
+
+def test_column_views(log):
+    with BinaryLogReader(log.fname) as reader:
+        current = reader.column('bat_current_mA')
+        assert current[0] == 300
+        assert current[-1] == -3000
+        assert reader.row(2)['bat_charge_mAh'] == 0.5
+        current.release()
+
+def test_not_a_log(tmp_path):
+    fname = tmp_path / 'log.bin'
+    fname.write_bytes(b'Time elapsed,Bat Voltage (mV)\n')
+    with pytest.raises(BinaryLogError):
+        BinaryLogReader(str(fname))
+
+# TestLog
+def test_loaded_log(log):
+    loaded = Log(log.fname, load=True)
+    assert loaded.header['box_id'] == 'SimBox000A'
+    assert loaded.last == make_cycle()[-1]
+    assert loaded.phase_stats[3].i_stats == log.phase_stats[3].i_stats
+    assert loaded.test_pass()
+
+def test_export_csv(log, tmp_path):
+    csv_fname = log.export_csv(str(tmp_path / 'export.csv'))
+    with open(csv_fname, newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[2] == csv_headers
+    assert rows[5] == ['0:00:02', '2000', '11000', '300', '0.5', '50', '25']
+
+    loaded = Log(csv_fname, load=True)
+    assert loaded.test_pass()
+
+def test_resume_cuts_torn_record(log):
+    offset = log.offset
+    with open(log.fname, 'ab') as file:
+        file.write(b'\0' * 20)    # crash mid record
+
+    resumed = Log.resume(log.fname, offset)
+    assert resumed.offset == offset
+    resumed.add_result(result(500, -3000, 14000))
+    resumed.flush(wait=True)
+    with BinaryLogReader(log.fname) as reader:
+        assert len(reader) == 501
+        assert reader.row(-1)['bat_timestamp'] == 500
+
+def test_fsm_log_names_box(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)     # test logs are written to the cwd
+    clock = VirtualClock()
+    fsms = []
+    for name in ('SimBox000A', 'SimBox001A'):
+        box = BoxHalf(I2C(FT4222Sim(), name))
+        box.gas_gauge.reg_map.cache_ttl_s = 0
+        fsm = FSM(box, clock=clock, binary_log=True)
+        fsm.start(35)
+        fsms.append(fsm)
+    for _ in range(60):
+        for fsm in fsms:
+            fsm.process()
+        clock.advance(1)
+        if all(fsm.test_log for fsm in fsms):
+            break
+
+    for fsm, name in zip(fsms, ('SimBox000A', 'SimBox001A')):
+        fsm.test_log.flush(wait=True)
+        assert name in fsm.test_log.fname
+        with BinaryLogReader(fsm.test_log.fname) as reader:
+            assert reader.header['box_id'] == name
@@ -0,0 +1,347 @@
+# unit tests for FSM
+import time
+import logging
+
+import pytest
+
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.I2C import I2C, I2CWriteError
+from source.TestBoxIF.TestBoxHalf import TestBoxHalf as BoxHalf
+from source.BatTest.FSM import FSM, IdleState, WaitState
+from source.BatTest.FSM import States
+from source.BatTest.Clock import VirtualClock
+from source.BatTest.TestManager import TestManager as Manager
+from source.BatTest.TestLog import TestLog as Log
+from source.BatTest.Checkpoint import load_checkpoint, save_checkpoint
+
+# fixtures
+def make_box(name: str):
+    sim = FT4222Sim()
+    box = BoxHalf(I2C(sim, name))
+    box.gas_gauge.reg_map.cache_ttl_s = 0   # ticks run back to back
+    return box, sim
+
+@pytest.fixture
+def boxes():
+    return [make_box('SimBox000A'), make_box('SimBox001A')]
+
+# context
+def test_contexts_independent(boxes):
+    fsms = [FSM(box) for box, sim in boxes]
+    for fsm in fsms:    # idle initializes the gauges
+        fsm.process()
+
+    fsms[0].start(90, quickcharge=True)
+    fsms[1].start(20, quickcharge=True)
+    boxes[1][1].device(0x64).set_word(0x02, 0xC000)  # 75 %
+
+    for fsm in fsms:
+        fsm.process()
+
+    assert fsms[0].context.charge_setpoint == 90
+    assert fsms[1].context.charge_setpoint == 20
+    assert fsms[0].state_name == States.CHARGE_TEST.value
+    assert fsms[1].state_name == States.DISCHARGE_TEST.value
+
+def test_quickcharge_done(boxes):
+    box, sim = boxes[0]
+    fsm = FSM(box)
+    fsm.start(90, quickcharge=True)
+    fsm.process()
+    assert box.gpio.charge_enable
+
+    sim.device(0x64).set_word(0x02, 0xF000)
+    fsm.process()
+    assert fsm.state_name == States.IDLE.value
+    assert not box.gpio.charge_enable
+
+def test_logs_separate_per_box(boxes, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)     # test logs are written to the cwd
+    clock = VirtualClock()
+    fsms = [FSM(box, clock=clock) for box, sim in boxes]
+    for fsm in fsms:
+        fsm.start(35)
+    for _ in range(60):
+        for fsm in fsms:
+            fsm.process()
+        clock.advance(1)
+        if all(fsm.test_log for fsm in fsms):
+            break
+    for _ in range(5):
+        for fsm in fsms:
+            fsm.process()
+    for fsm in fsms:
+        assert fsm.state_name == States.CHARGE_TEST.value
+        fsm.test_log.flush(wait=True)
+
+    logs = [fsm.test_log for fsm in fsms]
+    assert logs[0].fname != logs[1].fname
+    for log, (box, sim) in zip(logs, boxes):
+        assert box.box_id in log.fname
+        loaded = Log(log.fname, load=True)
+        assert len(loaded.results) == len(log.results) + 1   # csv headings
+
+def fail_thresholds(*args, **kwargs):
+    raise I2CWriteError('NACK')
+
+def test_charge_polled_without_threshold(boxes, monkeypatch):
+    box, sim = boxes[0]
+    monkeypatch.setattr(box.gas_gauge, 'set_charge_thresholds',
+        fail_thresholds)
+    fsm = FSM(box)
+    fsm.start(90, quickcharge=True)
+    fsm.process()
+
+    sim.device(0x64).set_word(0x02, 0xF000)
+    fsm.process()
+    assert fsm.state_name == States.IDLE.value
+
+def test_discharge_polled_without_threshold(boxes, monkeypatch):
+    box, sim = boxes[0]
+    monkeypatch.setattr(box.gas_gauge, 'set_voltage_thresholds',
+        fail_thresholds)
+    fsm = FSM(box)
+    fsm.process()
+    sim.device(0x64).set_word(0x02, 0xC000)  # 75 %
+    fsm.start(20, quickcharge=True)
+    fsm.process()
+    assert fsm.state_name == States.DISCHARGE_TEST.value
+
+    sim.device(0x64).set_word(0x02, 0x2000)
+    fsm.process()
+    assert fsm.state_name == States.IDLE.value
+
+# measurement frame
+def test_one_gauge_read_per_tick(boxes):
+    box, sim = boxes[0]
+    fsm = FSM(box)
+    fsm.start(90, quickcharge=True)
+    fsm.process()
+
+    num_reads = sim.num_reads
+    fsm.process()
+    assert fsm.state_name == States.CHARGE_TEST.value
+    assert sim.num_reads - num_reads == 1
+    assert fsm.tick_transactions == 1
+
+# wait state and step budget
+def test_wait_state_enable_delay(boxes):
+    box, sim = boxes[0]
+    clock = VirtualClock()
+    fsm = FSM(box, clock=clock)
+    fsm.process()
+    fsm._state = WaitState(box, fsm.context, IdleState, discharge_en=True,
+        enable_delay_td=WaitState.SWITCH_DELAY_TD)
+
+    start = time.perf_counter()
+    fsm.process()
+    assert time.perf_counter() - start < WaitState.SWITCH_DELAY_TD.total_seconds()
+    assert not box.gpio.discharge_enable
+
+    clock.advance(WaitState.SWITCH_DELAY_TD.total_seconds() / 2)
+    fsm.process()
+    assert not box.gpio.discharge_enable
+
+    clock.advance(WaitState.SWITCH_DELAY_TD.total_seconds() / 2)
+    fsm.process()
+    assert fsm.state_name == States.WAIT.value
+    assert box.gpio.discharge_enable
+
+def test_step_overrun_names_slowest_box(caplog):
+    manager = Manager(simulated=True, num_sim_boxes=2, clock=VirtualClock(),
+        checkpoint_dir=None)
+    for index in ('0', '1'):
+        manager.open_connection(index)
+    slow_test = manager.bat_test(1)
+    process = slow_test.process
+    def slow_process():
+        time.sleep(0.02)
+        process()
+    slow_test.process = slow_process
+
+    manager.step_budget_s = 0.01
+    with caplog.at_level(logging.WARNING, logger='batman.BatTest.TestManager'):
+        manager.step()
+    assert manager.num_overruns == 1
+    assert f'slowest box {slow_test.box_id}' in caplog.text
+
+# virtual clock
+def test_charge_timeout_virtual(boxes):
+    box, sim = boxes[0]
+    clock = VirtualClock()
+    fsm = FSM(box, clock=clock)
+    fsm.start(90, quickcharge=True)
+    fsm.process()
+    assert fsm.state_name == States.CHARGE_TEST.value
+
+    clock.advance(4.5 * 3600 - 1)
+    fsm.process()
+    assert fsm.state_name == States.CHARGE_TEST.value
+
+    clock.advance(2)
+    fsm.process()
+    assert fsm.state_name == States.IDLE.value
+    assert box.gpio.led_error_enable
+    assert fsm.test_time == '4:30:01'
+
+def test_run_virtual(tmp_path, monkeypatch):
+    manager = Manager(simulated=True, num_sim_boxes=2, clock=VirtualClock())
+    for index in ('0', '1'):
+        manager.open_connection(index)
+    start = manager.clock.now()
+    for test in manager._bat_tests:
+        test.start_quickcharge(90)
+
+    assert manager.run_virtual(600, tick_s=10) == 60
+    assert (manager.clock.now() - start).total_seconds() == 600
+    gas_gauge = manager.bat_test(0).if_board.gas_gauge
+    assert gas_gauge.clock() == manager.clock.now().timestamp()
+    gas_gauge.measure()     # waits on the virtual clock
+    assert (manager.clock.now() - start).total_seconds() > 600
+    assert all(test.state_name == States.CHARGE_TEST.value
+        for test in manager._bat_tests)
+
+def test_virtual_clock_forward_only():
+    with pytest.raises(ValueError):
+        VirtualClock().advance(-1)
+
+# battery model
+def test_full_cycle_virtual(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)     # test logs are written to the cwd
+    manager = Manager(simulated=True, num_sim_boxes=1,
+        sim_options={'battery' : {'seed' : 1}}, clock=VirtualClock(),
+        checkpoint_dir=str(tmp_path))
+    manager.open_connection('0')
+    test = manager.bat_test(0)
+    manager.run_virtual(10)
+
+    test.start_test()
+    states = [test.state_name]
+    for _ in range(8 * 3600):
+        manager.run_virtual(1)
+        if test.state_name != states[-1]:
+            states.append(test.state_name)
+        if test.state_name == States.IDLE.value:
+            break
+
+    assert states == [States.IDLE.value,
+        States.PRETEST.value, States.WAIT.value,
+        States.CHARGE_TEST.value, States.WAIT.value,
+        States.DISCHARGE_TEST.value, States.WAIT.value,
+        States.POSTTEST.value, States.IDLE.value]
+    assert test.test_pass
+
+    # the finished log stays readable but is left out of the idle checkpoint
+    assert test.test_log is not None
+    checkpoint = load_checkpoint(str(tmp_path / 'SimBox000A.json'))
+    assert checkpoint['context']['log_fname'] is None
+
+# checkpoints
+def run_until(fsm, clock, state_name, max_ticks=8 * 3600):
+    for _ in range(max_ticks):
+        fsm.process()
+        clock.advance(1)
+        if fsm.state_name == state_name:
+            return
+    raise AssertionError(f'{state_name} not reached')
+
+@pytest.mark.parametrize('binary_log', [False, True])
+def test_resume_from_checkpoint(tmp_path, monkeypatch, binary_log):
+    monkeypatch.chdir(tmp_path)
+    clock = VirtualClock()
+    sim = FT4222Sim(battery={
+        'time_fn' : lambda: clock.now().timestamp(), 'seed' : 1})
+    box = BoxHalf(I2C(sim, 'SimBox000A'))
+    box.gas_gauge.reg_map.cache_ttl_s = 0
+    fname = str(tmp_path / 'SimBox000A.json')
+
+    fsm = FSM(box, clock=clock, checkpoint_fname=fname, binary_log=binary_log)
+    fsm.start(35)
+    run_until(fsm, clock, States.DISCHARGE_TEST.value)
+    for _ in range(90):
+        fsm.process()
+        clock.advance(1)
+
+    # host restarts, a new FSM on the same box picks up the test
+    clock.advance(30)
+    resumed = FSM(box, clock=clock, checkpoint_fname=fname,
+        binary_log=binary_log)
+    resumed.restore(load_checkpoint(fname))
+    assert resumed.state_name == States.DISCHARGE_TEST.value
+    assert resumed.test_log.fname == fsm.test_log.fname
+    assert resumed.test_log.binary == binary_log
+    assert resumed.test_log.box_id == 'SimBox000A'
+    assert resumed.test_log.calibration == box.gas_gauge.calibration
+    assert resumed.context.charge_setpoint == 35
+    assert box.gpio.discharge_enable
+
+    run_until(resumed, clock, States.IDLE.value)
+    assert resumed.test_pass
+
+def test_resume_torn_binary_log_starts_fresh(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    manager = Manager(simulated=True, num_sim_boxes=1, clock=VirtualClock(),
+        checkpoint_dir=checkpoint_dir)
+    manager.open_connection('0')
+    test = manager.bat_test(0)
+    test.start_test()
+    for _ in range(60):
+        manager.run_virtual(1)
+        if test.test_log:
+            break
+
+    # crash while writing the header of a binary log
+    fname = checkpoint_dir + '/SimBox000A.json'
+    checkpoint = load_checkpoint(fname)
+    checkpoint['context']['log_fname'] = str(tmp_path / 'log.bin')
+    (tmp_path / 'log.bin').write_bytes(b'BATLOG')
+    save_checkpoint(fname, checkpoint)
+
+    restarted = Manager(simulated=True, num_sim_boxes=1, clock=VirtualClock(),
+        checkpoint_dir=checkpoint_dir)
+    restarted.open_connection('0')
+    assert restarted.bat_test(0).state_name == States.IDLE.value
+
+def test_log_resume_cuts_torn_row(tmp_path):
+    fname = str(tmp_path / 'log.csv')
+    log = Log(fname)
+    log.add_result({'bat_timestamp' : 0, 'bat_voltage_mV' : 12000.0})
+    log.flush(wait=True)
+    offset = log.offset
+    with open(fname, 'a') as file:
+        file.write('0:00:01,1000,120')    # crash mid row
+
+    resumed = Log.resume(fname, offset)
+    assert resumed.offset == offset
+    resumed.add_result({'bat_timestamp' : 1, 'bat_voltage_mV' : 12001.0})
+    resumed.flush(wait=True)
+    with open(fname) as file:
+        assert file.read().splitlines()[-2:] == ['0,12000.0', '1,12001.0']
+
+# live limit check
+def test_failing_battery_aborted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = Manager(simulated=True, num_sim_boxes=1,
+        sim_options={'battery' : {'seed' : 1, 'load_ohm' : 2.0}},
+        clock=VirtualClock(), checkpoint_dir=None)
+    manager.open_connection('0')
+    test = manager.bat_test(0)
+    manager.run_virtual(10)
+
+    test.start_test()
+    for _ in range(8 * 3600):
+        manager.run_virtual(1)
+        if test.state_name in (States.ERROR.value, States.POSTTEST.value):
+            break
+
+    gpio = test.if_board.gpio
+    assert test.state_name == States.ERROR.value
+    assert test.abort_reason.startswith('discharge: current')
+    assert gpio.led_error_enable
+    assert not gpio.discharge_enable
+
+    test.start_test()
+    manager.run_virtual(1)
+    assert test.state_name == States.PRETEST.value
+    assert not gpio.led_error_enable
@@ -0,0 +1,77 @@
+# unit tests for LogWriter
+import os
+import time
+import threading
+import pytest
+
+from source.BatTest.LogWriter import LogWriter
+
+# fixtures
+@pytest.fixture
+def writer():
+    writer = LogWriter(flush_rows=3, flush_period_s=60)
+    yield writer
+    writer.stop()
+
+def read_rows(fname: str) -> list:
+    with open(fname) as file:
+        return file.read().splitlines()
+
+# flush policy
+def test_flush_every_n_rows(writer, tmp_path):
+    fname = str(tmp_path / 'log.csv')
+    writer.write_rows(fname, [['header']], truncate=True)
+    writer.write_row(fname, [1, 2])
+    writer.sync(flush=False)
+    assert writer.offset(fname) == 0
+
+    writer.write_row(fname, [3, 4])
+    writer.sync(flush=False)
+    assert writer.offset(fname) == os.path.getsize(fname)
+    assert read_rows(fname) == ['header', '1,2', '3,4']
+
+def test_flush_on_request(writer, tmp_path):
+    fname = str(tmp_path / 'log.csv')
+    writer.write_row(fname, [1, 2])
+    writer.sync()
+    assert read_rows(fname) == ['1,2']
+
+def test_fsync(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, 'fsync', synced.append)
+    writer = LogWriter(flush_rows=1, fsync=True)
+    writer.write_row(str(tmp_path / 'log.csv'), [1])
+    writer.stop()
+    assert len(synced) == 1
+
+# background thread
+def test_slow_disk_does_not_block(writer, tmp_path):
+    fname = str(tmp_path / 'log.csv')
+    disk = threading.Event()
+    handle = writer._handle
+    writer._handle = lambda item: (disk.wait(), handle(item))
+
+    start = time.perf_counter()
+    for i in range(100):
+        writer.write_row(fname, [i])
+    assert time.perf_counter() - start < 0.5
+
+    disk.set()
+    writer.sync()
+    assert len(read_rows(fname)) == 100
+
+def test_default_created_once(monkeypatch):
+    monkeypatch.setattr(LogWriter, '_default', None)
+    barrier = threading.Barrier(8)
+    writers = []
+    def get_default():
+        barrier.wait()
+        writers.append(LogWriter.default())
+    threads = [threading.Thread(target=get_default) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, writers))) == 1
+    writers[0].stop()
@@ -0,0 +1,75 @@
+# unit tests for ResultStore
+import math
+from datetime import timedelta
+
+import pytest
+
+from source.BatTest.ResultStore import ResultStore
+from source.BatTest.TestLog import TestLog as Log, result_keys
+
+# fixtures
+def result(i: int) -> dict:
+    return {
+        'bat_timestamp' : timedelta(seconds=i),
+        'bat_timestamp_ms' : 1000 * i,
+        'bat_voltage_mV' : 14000 + i,
+        'bat_current_mA' : 1050,
+        'bat_charge_mAh' : i / 10,
+        'bat_charge_level' : 50,
+        'bat_temp_C' : 25
+    }
+
+@pytest.fixture
+def store():
+    return ResultStore(result_keys, timedelta_keys=('bat_timestamp',),
+        chunk_rows=4)
+
+# storage
+def test_grows_in_chunks(store):
+    for i in range(10):
+        store.append(result(i))
+
+    assert len(store) == 10
+    assert store.capacity == 12
+    assert store.nbytes == 12 * 8 * len(result_keys)
+
+def test_row_views(store):
+    for i in range(10):
+        store.append(result(i))
+
+    assert store[-1] == result(9)
+    assert [row['bat_voltage_mV'] for row in store] == \
+        [14000 + i for i in range(10)]
+    with pytest.raises(IndexError):
+        store[10]
+
+def test_column_view_survives_growth(store):
+    for i in range(4):
+        store.append(result(i))
+    view = store.column('bat_timestamp_ms')
+    for i in range(4, 10):
+        store.append(result(i))
+
+    assert view.tolist() == [0, 1000, 2000, 3000]
+    assert store.column('bat_timestamp_ms')[-1] == 9000
+
+def test_loaded_cells_converted(store):
+    store.append({'bat_timestamp' : '1:02:03.5', 'bat_voltage_mV' : ''})
+
+    row = store[0]
+    assert row['bat_timestamp'] == timedelta(hours=1, minutes=2, seconds=3.5)
+    assert math.isnan(row['bat_voltage_mV'])
+
+# TestLog
+def test_log_loads_columns(tmp_path):
+    log = Log(str(tmp_path / 'log.csv'))
+    for i in range(100):
+        log.add_result(result(i))
+    log.flush(wait=True)
+
+    loaded = Log(log.fname, load=True)
+    assert loaded.last == result(99)
+    charge = loaded.results.column('bat_charge_mAh')
+    assert math.isnan(charge[0])     # csv headings
+    assert charge[11] == pytest.approx(1.0)
+    assert loaded.memory_bytes == log.memory_bytes
@@ -0,0 +1,106 @@
+# unit tests for TestLog
+import pytest
+
+from source.TestBoxIF.Calibration import GasGaugeCalibration
+from source.BatTest.TestLog import TestLog as Log
+
+# fixtures
+def result(current_mA: float, voltage_mV: float) -> dict:
+    return {
+        'bat_timestamp' : 0,
+        'bat_timestamp_ms' : 0,
+        'bat_voltage_mV' : voltage_mV,
+        'bat_current_mA' : current_mA,
+        'bat_charge_mAh' : 0,
+        'bat_charge_level' : 0,
+        'bat_temp_C' : 25
+    }
+
+def make_cycle():
+    '''precharge, constant current, tapering constant voltage, discharge'''
+    return [result(300, 11000)] * 100 \
+        + [result(1050, 14000)] * 200 \
+        + [result(1000 - 5 * i, 16400) for i in range(100)] \
+        + [result(-3000, 14000)] * 100
+
+@pytest.fixture
+def log(tmp_path):
+    return Log(str(tmp_path / 'log.csv'))
+
+# phase tracking
+def test_phases_streamed(log):
+    phases = []
+    for row in make_cycle():
+        log.add_result(row)
+        if log.phase not in phases:
+            phases.append(log.phase)
+        assert log.partial_pass
+
+    assert phases == ['precharge', 'const_i', 'const_v', 'discharge']
+    assert log.test_pass()
+
+def test_phase_stats_leave_out_margins(log):
+    for row in make_cycle():
+        log.add_result(row)
+
+    stats = log.phase_stats
+    assert stats[0].count == 100 - 10 - 10 + 1   # precharge starts the log
+    assert stats[1].i_min == stats[1].i_max == 1050
+    assert stats[3].i_stats['avg'] == -3000
+
+def test_partial_verdict_fails_early(log):
+    rows = make_cycle()
+    rows[150] = result(1500, 14000)     # over current in constant current
+    for row in rows[:200]:
+        log.add_result(row)
+
+    assert log.phase == 'const_i'
+    assert not log.partial_pass
+
+def test_loaded_log_verdict(log):
+    for row in make_cycle():
+        log.add_result(row)
+    log.flush(wait=True)
+
+    loaded = Log(log.fname, load=True)
+    assert loaded.test_pass()
+
+# live limit check
+def test_limit_persistence(tmp_path):
+    log = Log(str(tmp_path / 'log.csv'), limit_persistence=5)
+    for _ in range(20):
+        log.add_result(result(300, 11000))
+    for _ in range(4):
+        log.add_result(result(500, 11000))   # precharge over current
+    assert log.limit_violation is None
+
+    log.add_result(result(300, 11000))
+    for _ in range(5):
+        log.add_result(result(500, 11000))
+    assert log.limit_violation.startswith('precharge: current 500 mA above')
+
+def test_limit_start_margin_ignored(tmp_path):
+    log = Log(str(tmp_path / 'log.csv'), limit_persistence=5)
+    for _ in range(9):
+        log.add_result(result(0, 0))
+    assert log.limit_violation is None
+
+def test_limit_count_resumed(tmp_path):
+    log = Log(str(tmp_path / 'log.csv'), box_id='SimBox000A',
+        calibration=GasGaugeCalibration(r_sense_mohm=4.9), limit_persistence=5)
+    for _ in range(20):
+        log.add_result(result(300, 11000))
+    for _ in range(3):
+        log.add_result(result(500, 11000))
+    log.flush(wait=True)
+    checkpoint = log.checkpoint()
+
+    resumed = Log.resume(checkpoint['log_fname'], checkpoint['log_offset'],
+        limit_persistence=5, box_id=checkpoint['log_box_id'],
+        calibration=GasGaugeCalibration(**checkpoint['log_calibration']),
+        monitor=checkpoint['log_monitor'])
+    assert resumed.box_id == 'SimBox000A'
+    assert resumed.calibration.r_sense_mohm == 4.9
+    for _ in range(2):
+        resumed.add_result(result(500, 11000))
+    assert resumed.limit_violation.startswith('precharge: current 500 mA')
@@ -0,0 +1,71 @@
+# microbenchmark of register bit/field access
+#
+# run from the repo root:
+#   python -m tests.TestBoxIF.bench_Register
+
+# standard library
+import timeit
+
+# internal packages
+from source.TestBoxIF.I2C import Register
+from source.TestBoxIF.I2C import Field
+from source.TestBoxIF.I2C import RegisterMap
+
+NUMBER = 200000
+
+class LegacyRegister(object):
+    '''Register bit access as implemented before slots and mask tables'''
+    def __init__(self, value: int):
+        self._value = value
+        self._dirty = False
+
+    @property
+    def value(self):
+        return self._value
+
+    def set_bit(self, bit_num: int, value: int) -> int:
+        word = self.value
+        mask = 2 ** bit_num
+        if value:
+            word |= mask
+        else:
+            word &= ~mask
+        self._value = word
+        self._dirty = True
+        return word
+
+    def get_bit(self, bit_num) -> bool:
+        word = self.value
+        mask = 2 ** bit_num
+        return bool(word & mask)
+
+    def get_field(self, shift: int, width: int) -> int:
+        return (self.value >> shift) & (2 ** width - 1)
+
+def bench(label: str, stmt):
+    t = min(timeit.repeat(stmt, number=NUMBER, repeat=5))
+    print(f'{label:<28} {1e9 * t / NUMBER:8.1f} ns/call')
+    return t
+
+def main():
+    legacy = LegacyRegister(0x3C)
+    reg = Register(0x01, 'rw', 1, 0x3C)
+    adc_mode = Field(0x01, 6, 2)
+    reg_map = RegisterMap(registers=[reg])
+
+    results = [
+        ('set_bit', bench('legacy set_bit', lambda: legacy.set_bit(3, 1)),
+            bench('slotted set_bit', lambda: reg.set_bit(3, 1))),
+        ('get_bit', bench('legacy get_bit', lambda: legacy.get_bit(3)),
+            bench('slotted get_bit', lambda: reg.get_bit(3))),
+        ('get_field', bench('legacy 2 bit field', lambda: legacy.get_field(6, 2)),
+            bench('Field get_field', lambda: reg.get_field(adc_mode))),
+    ]
+    bench('RegisterMap.read_field',
+        lambda: reg_map.read_field(adc_mode, transaction=False))
+
+    for name, t_legacy, t_new in results:
+        print(f'{name} speedup: {t_legacy / t_new:.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# unit tests for the asyncio driver interface
+import asyncio
+import time
+
+import pytest
+
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.GPIO import GPIO
+from source.TestBoxIF.LTC2943 import LTC2943
+from source.TestBoxIF.AsyncIF import AsyncI2C, AsyncGPIO, AsyncLTC2943
+
+# fixtures
+@pytest.fixture
+def sim():
+    return FT4222Sim()
+
+@pytest.fixture
+def async_i2c(sim):
+    async_i2c = AsyncI2C(I2C(sim, 'sim'))
+    yield async_i2c
+    async_i2c.close()
+
+def test_async_read(async_i2c, sim):
+    sim.device(0x64).set_word(0x08, 0x1234)
+    data = asyncio.run(async_i2c.read(0x64, 0x08, 2))
+    assert data == bytes((0x12, 0x34))
+
+def test_async_gas_gauge(async_i2c, sim):
+    gas_gauge = AsyncLTC2943(LTC2943(async_i2c.i2c), async_i2c)
+    sim.device(0x64).set_word(0x08, 0xFFFF)
+    assert asyncio.run(gas_gauge.voltage_mV()) == pytest.approx(23600)
+
+def test_async_gpio_batch(async_i2c, sim):
+    gpio = AsyncGPIO(GPIO(async_i2c.i2c), async_i2c)
+    asyncio.run(gpio.set(charge_enable=True, led_run_enable=True))
+    assert sim.device(0x27).get_reg(0x03) == 0x05
+    assert asyncio.run(gpio.get('charge_enable'))
+
+def test_boxes_overlap():
+    latency_s = 0.02
+    boxes = [AsyncI2C(I2C(FT4222Sim(latency_s=latency_s), f'sim{i}')) \
+        for i in range(8)]
+
+    async def read_all():
+        return await asyncio.gather(*(box.read(0x64, 0x00, 1) for box in boxes))
+
+    start = time.perf_counter()
+    asyncio.run(read_all())
+    elapsed = time.perf_counter() - start
+    for box in boxes:
+        box.close()
+
+    # each read is two transfers, serially this would take 16 latencies
+    assert elapsed < 8 * latency_s
@@ -0,0 +1,81 @@
+# unit tests for BatteryModel
+import pytest
+
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.TestBoxHalf import TestBoxHalf as BoxHalf
+
+class Clock(object):
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+# fixtures
+@pytest.fixture
+def clock():
+    return Clock()
+
+def make_box(clock, **battery):
+    sim = FT4222Sim(battery={'time_fn' : clock, 'noise_mA' : 0, **battery})
+    box = BoxHalf(I2C(sim, 'sim'))
+    box.gas_gauge.reg_map.cache_ttl_s = 0
+    box.gas_gauge.control_auto()
+    return box, sim.device(0x64).battery
+
+# charger
+def test_charge_phases(clock):
+    box, battery = make_box(clock, soc=0.0)
+    box.gpio.charge_enable = True
+
+    box.gas_gauge.snapshot()
+    clock.t += 1
+    sample = box.gas_gauge.snapshot()
+    assert sample.current_mA == pytest.approx(battery.PRECHARGE_mA, abs=1)
+
+    clock.t += 3600
+    sample = box.gas_gauge.snapshot()
+    assert sample.current_mA == pytest.approx(battery.CONST_I_mA, abs=1)
+
+    clock.t += 2.25 * 3600
+    sample = box.gas_gauge.snapshot()
+    assert sample.voltage_mV == pytest.approx(battery.CONST_V_mV, abs=1)
+    assert 0 < sample.current_mA < battery.CONST_I_mA
+
+def test_discharge_counts_down(clock):
+    box, battery = make_box(clock, soc=0.8)
+    box.gas_gauge.charge = 0x8000
+    box.gpio.discharge_enable = True
+
+    box.gas_gauge.snapshot()
+    clock.t += 60
+    sample = box.gas_gauge.snapshot()
+    assert sample.current_mA < -2000
+    assert sample.charge_reg < 0x8000
+    assert battery.soc < 0.8
+
+# coulomb counter
+def test_charge_overflow_wraps(clock):
+    box, battery = make_box(clock, soc=0.5)
+    box.gas_gauge.charge = 0xFFF0
+    box.gpio.charge_enable = True
+
+    box.gas_gauge.snapshot()
+    clock.t += 60
+    sample = box.gas_gauge.snapshot()
+    assert sample.overflow
+    assert sample.charge_reg < 0x1000
+    assert not box.gas_gauge.snapshot().overflow   # cleared on read
+
+# pack protection
+def test_protection_resets_gauge(clock):
+    box, battery = make_box(clock, soc=0.01)
+    box.gpio.discharge_enable = True
+
+    box.gas_gauge.snapshot()
+    clock.t += 600
+    sample = box.gas_gauge.snapshot()
+    assert battery.tripped
+    assert sample.discharged
+    assert sample.voltage_mV == 0
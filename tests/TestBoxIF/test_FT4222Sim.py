@@ -0,0 +1,125 @@
+# unit tests for FT4222Sim
+import ft4222
+import pytest
+
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.I2C import I2CNoDeviceError
+from source.TestBoxIF.TestBoxHalf import TestBoxHalf as BoxHalf
+from source.TestBoxIF.ConnectionManager import ConnectionManager
+
+# fixtures
+@pytest.fixture
+def sim():
+    return FT4222Sim()
+
+@pytest.fixture
+def sim_i2c(sim):
+    return I2C(sim, 'sim')
+
+# bus
+def test_write_read(sim_i2c, sim):
+    sim_i2c.write(0x64, bytearray((0x02, 0x12, 0x34)))
+    assert sim.device(0x64).get_word(0x02) == 0x1234
+    assert sim_i2c.read(0x64, 0x02, 2) == bytes((0x12, 0x34))
+
+def test_read_only_register(sim_i2c, sim):
+    sim_i2c.write(0x64, bytearray((0x08, 0xAA)))
+    assert sim.device(0x64).get_reg(0x08) == 0x00
+
+def test_tca9555_pointer_pairs(sim_i2c):
+    assert sim_i2c.read(0x27, 0x07, 2) == bytes((0xFF, 0xFF))
+    sim_i2c.write(0x27, bytearray((0x03, 0x01, 0x02)))
+    assert sim_i2c.read(0x27, 0x02, 2) == bytes((0x02, 0x01))
+
+def test_busy_polls(sim_i2c, sim):
+    sim.busy_polls = 3
+    sim_i2c.read(0x64, 0x00, 1)
+    assert sim_i2c.last_poll_count == 8
+
+def test_nack_address(sim_i2c, sim):
+    sim.nack_addresses.add(0x64)
+    with pytest.raises(I2CNoDeviceError):
+        sim_i2c.read(0x64, 0x00, 1)
+    with pytest.raises(I2CNoDeviceError):
+        sim_i2c.write(0x64, bytearray((0x01, 0x00)))
+
+def test_nack_injection_retries(sim_i2c, sim):
+    sim.nack_rate = 1.0
+    with pytest.raises(I2CNoDeviceError):
+        sim_i2c.read(0x64, 0x00, 1, retries=2)
+    assert sim.num_nacks == 3
+
+# drivers
+def test_test_box_half(sim_i2c, sim):
+    box = BoxHalf(sim_i2c)
+    sim.device(0x64).set_word(0x08, 0x8000)
+    box.gpio.charge_enable = True
+    assert sim.device(0x27).get_reg(0x03) & 0x01
+    assert box.gas_gauge.get_all()['bat_voltage_mV'] == pytest.approx(11800, 1)
+
+# connection manager
+def test_connection_manager_simulated():
+    conn_man = ConnectionManager(simulated=True, num_sim_boxes=3)
+    assert len(conn_man.device_names) == 3
+    i2c = conn_man.open_connection('1')
+    assert i2c.name == conn_man.device_names[1]
+    assert isinstance(i2c._ic, FT4222Sim)
+
+# metrics
+def test_metrics_disabled_by_default(sim_i2c):
+    assert sim_i2c.metrics is None
+
+def test_metrics_record(sim_i2c, sim):
+    metrics = sim_i2c.enable_metrics()
+    sim.busy_polls = 1
+    sim_i2c.read(0x64, 0x08, 2)
+    sim_i2c.write(0x27, bytearray((0x03, 0x01)))
+    ops = metrics.to_dict()['ops']
+    assert ops['0x64/0x8/read']['count'] == 1
+    assert ops['0x64/0x8/read']['polls'] == 4
+    assert ops['0x27/0x3/write']['latency']['count'] == 1
+
+def test_metrics_retries_and_nacks(sim_i2c, sim):
+    metrics = sim_i2c.enable_metrics()
+    sim.nack_addresses.add(0x64)
+    with pytest.raises(I2CNoDeviceError):
+        sim_i2c.read(0x64, 0x00, 1, retries=2)
+    assert metrics.totals['retries'] == 2
+    assert metrics.totals['nacks'] == 3
+    assert metrics.totals['errors'] == 1
+
+def test_metrics_device_error(sim_i2c, sim, monkeypatch):
+    metrics = sim_i2c.enable_metrics()
+    def unplugged(*args):
+        raise ft4222.FT4222DeviceError(4)     # FT_IO_ERROR
+    monkeypatch.setattr(sim, 'i2cMaster_ReadEx', unplugged)
+    with pytest.raises(ft4222.FT4222DeviceError):
+        sim_i2c.read(0x64, 0x00, 1)
+    assert metrics.to_dict()['ops']['0x64/0x0/read']['errors'] == 1
+    assert metrics.totals['errors'] == 1
+
+# bus speed
+def test_speed_honored(sim):
+    i2c = I2C(sim, speed_kbps=400)
+    assert sim.speed_kbps == 400
+
+def test_calibrate_speed(sim, sim_i2c):
+    sim.max_speed_kbps = 400
+    sim.device(0x27).set_reg(0x04, 0x12)
+    probes = [(0x64, 0x04), (0x27, 0x04)]
+    assert sim_i2c.calibrate_speed(probes) == 400
+    assert sim.speed_kbps == 400
+    assert sim.device(0x27).get_reg(0x04) == 0x12
+
+def test_calibrated_speed_persisted(tmp_path):
+    fname = str(tmp_path / 'bus_speeds.ini')
+    conn_man = ConnectionManager(
+        simulated=True, num_sim_boxes=1,
+        sim_options={'max_speed_kbps': 400}, bus_speed_fname=fname)
+    i2c = conn_man.open_connection('0', calibrate=True)
+    assert i2c.speed_kbps == 400
+
+    i2c = conn_man.open_connection('0')
+    assert i2c.speed_kbps == 400
+    assert conn_man.load_bus_speed(i2c.name) == 400
@@ -0,0 +1,89 @@
+# unit tests for GPIO
+import pytest
+
+from source.TestBoxIF.GPIO import GPIO
+from source.TestBoxIF.GPIO import GPIOError
+from source.TestBoxIF.I2C import I2CWriteError
+
+class FakeI2C(object):
+    '''Register memory standing in for an I2C bus, logs writes'''
+    def __init__(self):
+        self.memory = {}
+        self.written = []
+        self.reads = 0
+        self.nack_regs = set()
+
+    def read(self, addr, data, num_bytes, retries=0, policy=None):
+        self.reads += 1
+        return bytes(self.memory.get(data + i, 0) for i in range(num_bytes))
+
+    def write(self, addr, data, retries=0, policy=None):
+        if data[0] in self.nack_regs:
+            raise I2CWriteError(f'NACK writing {hex(data[0])}')
+        self.written.append(tuple(data))
+        self.memory[data[0]] = data[1]
+        return True
+
+# fixtures
+@pytest.fixture
+def gpio():
+    gpio = GPIO(i2c=FakeI2C())
+    gpio._i2c.written.clear()
+    return gpio
+
+# batch
+def test_batch_single_write_per_port(gpio):
+    with gpio.batch():
+        gpio.charge_enable = True
+        gpio.led_run_enable = True
+        gpio.led_done_enable = True
+    assert gpio._i2c.written == [(0x03, 0x0D)]
+
+def test_batch_interlock(gpio):
+    with pytest.raises(GPIOError):
+        with gpio.batch():
+            gpio.charge_enable = True
+            gpio.discharge_enable = True
+    assert gpio._i2c.written == []
+    assert not gpio.charge_enable
+
+def test_batch_disable_written_first(gpio):
+    gpio.charge_enable = True
+    gpio._i2c.written.clear()
+    with gpio.batch():
+        gpio.discharge_enable = True
+        gpio.charge_enable = False
+    assert gpio._i2c.written == [(0x03, 0x00), (0x02, 0x01)]
+
+def test_nested_batch(gpio):
+    with gpio.batch():
+        with gpio.batch():
+            gpio.led_run_enable = True
+        gpio.led_error_enable = True
+    assert gpio._i2c.written == [(0x03, 0x06)]
+
+def test_batch_failed_flush_reads_device(gpio):
+    gpio.discharge_enable = True
+    gpio._i2c.written.clear()
+    gpio._i2c.nack_regs.add(0x03)
+    with pytest.raises(I2CWriteError):
+        with gpio.batch():
+            gpio.discharge_enable = False
+            gpio.charge_enable = True
+    assert gpio._i2c.written == [(0x02, 0x00)]
+    assert gpio._reg_map.dirty_registers == []
+
+    reads = gpio._i2c.reads
+    assert not gpio.charge_enable
+    assert not gpio.discharge_enable
+    assert gpio._i2c.reads > reads
+
+# cache
+def test_reset_expander_noticed():
+    gpio = GPIO(i2c=FakeI2C(), cache_ttl_s=0)
+    gpio.charge_enable = False
+    for reg_addr in range(0x02, 0x08):   # brown-out, power-on values
+        gpio._i2c.memory[reg_addr] = 0xFF
+
+    assert gpio.charge_enable
+    assert gpio.reg_map.read_reg(0x06) == 0xFF
@@ -9,6 +9,11 @@ from source.TestBoxIF import TCA9555
 from source.TestBoxIF.I2C import I2C
 from source.TestBoxIF.I2C import Register
 from source.TestBoxIF.I2C import RegType
+from source.TestBoxIF.I2C import RegisterMap
+from source.TestBoxIF.I2C import I2CError
+from source.TestBoxIF.I2C import BusWait
+from source.TestBoxIF.I2C import Field
+from source.TestBoxIF.I2C import I2CTimeoutError
 
 # Fixtures
 @pytest.fixture
@@ -112,3 +117,127 @@ def test_slice_get(default_register):
     assert reg[2:6] == '0x9'
 
 # RegisterMap
+class FakeI2C(object):
+    '''Register memory standing in for an I2C bus, counts transactions'''
+    def __init__(self, memory: dict = None):
+        self.memory = memory or {}
+        self.reads = 0
+        self.writes = 0
+
+    def read(self, addr, data, num_bytes, retries=0, policy=None):
+        self.reads += 1
+        return bytes(self.memory.get(data + i, 0) for i in range(num_bytes))
+
+    def write(self, addr, data, retries=0, policy=None):
+        self.writes += 1
+        self.memory[data[0]] = data[1]
+        return True
+
+@pytest.fixture
+def block_register_map():
+    registers = [
+        Register(0x00, 'r',  1, 0x00),
+        Register(0x02, 'rw', 1, 0x00),
+        Register(0x03, 'rw', 1, 0x00),
+    ]
+    i2c = FakeI2C({0x00: 0x11, 0x01: 0x22, 0x02: 0x33, 0x03: 0x44})
+    return RegisterMap(i2c=i2c, address=0x64, registers=registers)
+
+def test_read_block_single_transaction(block_register_map):
+    block = block_register_map.read_block(0x00, 0x03)
+    assert block == bytes((0x11, 0x22, 0x33, 0x44))
+    assert block_register_map._i2c.reads == 1
+
+def test_read_block_updates_shadows(block_register_map):
+    block_register_map.read_block(0x00, 0x03)
+    assert block_register_map.read_reg(0x00, transaction=False) == 0x11
+    assert block_register_map.read_reg(0x02, transaction=False) == 0x33
+    assert block_register_map.read_reg(0x03, transaction=False) == 0x44
+
+def test_read_block_invalid_range(block_register_map):
+    with pytest.raises(I2CError):
+        block_register_map.read_block(0x03, 0x00)
+
+def test_read_word(block_register_map):
+    assert block_register_map.read_word(0x02) == 0x3344
+    assert block_register_map._i2c.reads == 1
+
+# BusWait
+def test_bus_wait_poll_count():
+    status = iter([0x01, 0x01, 0x01, 0x20])
+    stat, polls = BusWait(spin_polls=2, sleep_min_s=0).wait(
+        lambda: next(status), 0x01)
+    assert stat == 0x20
+    assert polls == 4
+
+def test_bus_wait_timeout():
+    bus_wait = BusWait(spin_polls=1, sleep_min_s=0.001, timeout_s=0.01)
+    with pytest.raises(I2CTimeoutError):
+        bus_wait.wait(lambda: 0x01, 0x01)
+
+# RegisterMap cache
+@pytest.fixture
+def cached_register_map():
+    registers = [
+        Register(0x00, 'r',  1, 0x00, volatile=True),
+        Register(0x02, 'rw', 1, 0x00, volatile=False),
+    ]
+    i2c = FakeI2C({0x00: 0x11, 0x02: 0x33})
+    return RegisterMap(
+        i2c=i2c, address=0x27, registers=registers,
+        cache=True, cache_ttl_s=60)
+
+def test_cache_stable_register_hit(cached_register_map):
+    cached_register_map.write_reg(0x02, 0x55)
+    assert cached_register_map.read_reg(0x02) == 0x55
+    assert cached_register_map._i2c.reads == 0
+    assert cached_register_map.cache_stats == {'hits': 1, 'misses': 0}
+
+def test_cache_volatile_register_ttl(cached_register_map):
+    cached_register_map.read_reg(0x00)
+    cached_register_map.read_reg(0x00)
+    assert cached_register_map._i2c.reads == 1
+
+    cached_register_map.cache_ttl_s = 0
+    cached_register_map.read_reg(0x00)
+    assert cached_register_map._i2c.reads == 2
+
+def test_cache_invalidate(cached_register_map):
+    cached_register_map.read_reg(0x02)
+    cached_register_map.invalidate()
+    cached_register_map.read_reg(0x02)
+    assert cached_register_map._i2c.reads == 2
+
+def test_dirty_tracking(cached_register_map):
+    cached_register_map._registers[0x02].set_bit(0, 1)
+    assert cached_register_map.dirty_registers == [0x02]
+    cached_register_map.write_reg(0x02)
+    assert cached_register_map.dirty_registers == []
+
+def test_cache_dirty_register_read_from_device(cached_register_map):
+    cached_register_map.write_reg(0x02, 0x55)
+    cached_register_map._registers[0x02].set_bit(1, 1)   # never written
+    assert cached_register_map.read_reg(0x02) == 0x55
+    assert cached_register_map._i2c.reads == 1
+
+# Field
+def test_field_masks():
+    field = Field(0x01, 6, 2)
+    assert field.mask == 0xC0
+    assert field.max_value == 3
+
+def test_field_write_preserves_other_bits(cached_register_map):
+    field = Field(0x02, 1, 2)
+    cached_register_map.write_reg(0x02, 0xF9)
+    cached_register_map.write_field(field, 0b10)
+    assert cached_register_map._i2c.memory[0x02] == 0xFD
+    assert cached_register_map.read_field(field) == 0b10
+
+def test_field_invalid_value(cached_register_map):
+    with pytest.raises(I2CError):
+        cached_register_map.write_field(Field(0x02, 1, 2), 4)
+
+def test_register_slots():
+    reg = Register(0x00, 'rw', 1, 0x00)
+    with pytest.raises(AttributeError):
+        reg.extra = 1
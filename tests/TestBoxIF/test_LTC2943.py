@@ -0,0 +1,168 @@
+# unit tests for LTC2943
+import pytest
+
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.LTC2943 import LTC2943
+from source.TestBoxIF.LTC2943 import ADCMode
+from source.TestBoxIF.LTC2943 import Alert
+from source.TestBoxIF.LTC2943 import GasGaugeError
+from source.TestBoxIF.Calibration import GasGaugeCalibration
+from source.TestBoxIF.Calibration import load_calibration, save_calibration
+
+# fixtures
+@pytest.fixture
+def sim():
+    return FT4222Sim()
+
+@pytest.fixture
+def gas_gauge(sim):
+    return LTC2943(I2C(sim, 'sim'), cache=False)
+
+# snapshot
+def test_snapshot_single_transaction(gas_gauge, sim):
+    sim.device(0x64).set_word(0x08, 0x8000)
+    sim.device(0x64).set_word(0x0E, 0x7FFF)
+    num_reads = sim.num_reads
+
+    sample = gas_gauge.snapshot()
+    assert sim.num_reads - num_reads == 1
+    assert sample.voltage_mV == pytest.approx(11800, 1)
+    assert sample.current_mA == pytest.approx(0)
+    assert sample.charge_reg == 0x7FFF
+    assert sample.discharged
+
+def test_snapshot_immutable(gas_gauge):
+    sample = gas_gauge.snapshot()
+    with pytest.raises(AttributeError):
+        sample.voltage_mV = 0
+
+def test_snapshot_overflow(gas_gauge, sim):
+    sim.device(0x64).set_reg(0x00, 0x20)
+    assert gas_gauge.snapshot().overflow
+
+def test_get_all_keys(gas_gauge):
+    assert set(gas_gauge.get_all()) == {'bat_timestamp', 'bat_timestamp_ms',
+        'bat_voltage_mV', 'bat_current_mA', 'bat_charge_mAh',
+        'bat_charge_level', 'bat_temp_C'}
+
+# temperature and ADC mode
+def test_temperature(gas_gauge):
+    assert gas_gauge.snapshot().temp_C == pytest.approx(25, abs=0.01)
+
+def test_control_write_fields(gas_gauge, sim):
+    gas_gauge.control_init()
+    assert sim.device(0x64).get_reg(0x01) == 0b10011010
+    gas_gauge.control_auto()
+    assert sim.device(0x64).get_reg(0x01) == 0b11011010
+    assert gas_gauge.adc_mode == ADCMode.AUTOMATIC
+
+def test_manual_conversion(gas_gauge, sim):
+    sim.device(0x64).conversion_time_s = 0.01
+    gas_gauge.start_conversion()
+    assert not gas_gauge.conversion_ready
+    sim.device(0x64).set_word(0x08, 0x8000)
+    sample = gas_gauge.measure()
+    assert sample.voltage_mV == pytest.approx(11800, 1)
+    assert gas_gauge.adc_mode == ADCMode.SLEEP
+
+def test_scan_mode_partial_reads(gas_gauge, sim):
+    gas_gauge.control_init()
+    gas_gauge.snapshot()
+    sim.device(0x64).set_word(0x08, 0x8000)
+    sim.device(0x64).set_word(0x02, 0x1234)
+
+    sample = gas_gauge.snapshot()
+    assert sample.charge_reg == 0x1234
+    assert sample.voltage_mV == 0   # scan result not due yet
+
+    gas_gauge.adc_mode = ADCMode.AUTOMATIC
+    assert gas_gauge.snapshot().voltage_mV == pytest.approx(11800, 1)
+
+def test_scan_period_on_injected_clock(sim):
+    now = [0.0]
+    gas_gauge = LTC2943(I2C(sim, 'sim'), cache=False, clock=lambda: now[0])
+    gas_gauge.control_init()
+    gas_gauge.snapshot()
+    sim.device(0x64).set_word(0x08, 0x8000)
+
+    now[0] += LTC2943.SCAN_PERIOD_S - 1
+    assert gas_gauge.snapshot().voltage_mV == 0
+    now[0] += 1
+    assert gas_gauge.snapshot().voltage_mV == pytest.approx(11800, 1)
+
+class FakeClock(object):
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += seconds
+
+def test_measure_waits_on_injected_clock(sim):
+    clock = FakeClock()
+    gas_gauge = LTC2943(I2C(sim, 'sim'), cache=False,
+        clock=clock, sleep=clock.sleep)
+    gas_gauge.measure()
+    assert clock.t == pytest.approx(LTC2943.CONVERSION_TIME_S)
+
+    sim.device(0x64).conversion_time_s = 3600    # never ready
+    with pytest.raises(GasGaugeError):
+        gas_gauge.measure(timeout_s=0.5)
+    assert clock.t > 0.5
+
+# thresholds and alerts
+def test_charge_threshold_alert(gas_gauge, sim):
+    gas_gauge.set_charge_thresholds(high_level=50)
+    assert sim.device(0x64).get_word(0x04) == 0x8000
+    sim.device(0x64).set_word(0x02, 0x7000)
+    assert Alert.CHARGE_HIGH not in gas_gauge.snapshot().alerts
+    sim.device(0x64).set_word(0x02, 0x9000)
+    assert Alert.CHARGE_HIGH in gas_gauge.snapshot().alerts
+
+def test_voltage_threshold_alert(gas_gauge, sim):
+    gas_gauge.set_voltage_thresholds(low_mV=10000)
+    sim.device(0x64).set_word(0x08, 0x8000)
+    assert gas_gauge.clear_alerts() == Alert.NONE
+    sim.device(0x64).set_word(0x08, 0x4000)
+    assert gas_gauge.clear_alerts() == Alert.VOLTAGE
+
+def test_charge_write_single_transaction(gas_gauge, sim):
+    num_writes = sim.num_writes
+    gas_gauge.charge = 0x1234
+    assert sim.num_writes - num_writes == 1
+    assert sim.device(0x64).get_word(0x02) == 0x1234
+
+# calibration
+def test_r_sense_honored(sim):
+    gas_gauge = LTC2943(I2C(sim, 'sim'), r_sense_mohm=10.0, cache=False)
+    sim.device(0x64).set_word(0x0E, 0xFFFE)
+    assert gas_gauge.current_mA == pytest.approx(6000, rel=1e-3)
+
+def test_calibration_trims(sim):
+    calibration = GasGaugeCalibration(voltage_gain=1.01, voltage_offset_mV=-5)
+    gas_gauge = LTC2943(I2C(sim, 'sim'), calibration=calibration, cache=False)
+    sim.device(0x64).set_word(0x08, 0x8000)
+    nominal = 23600 * 0x8000 / 0xFFFF
+    assert gas_gauge.voltage_mV == pytest.approx(1.01 * nominal - 5)
+
+def test_fixed_point_matches_float(gas_gauge):
+    for reg in (0x0000, 0x1234, 0x7FFF, 0xFFFF):
+        assert gas_gauge.scale.voltage_mV(reg) == \
+            pytest.approx(23600 * reg / 0xFFFF, abs=1e-4)
+        assert gas_gauge.scale.current_mA(reg) == \
+            pytest.approx(12000 * (reg - 0x7FFF) / 0x7FFF, abs=1e-4)
+
+def test_bulk_conversion(gas_gauge):
+    regs = [0x0000, 0x4000, 0x8000]
+    assert gas_gauge.scale.voltage_mV(regs) == \
+        [gas_gauge.scale.voltage_mV(reg) for reg in regs]
+
+def test_calibration_ini(tmp_path):
+    fname = str(tmp_path / 'calibration.ini')
+    calibration = GasGaugeCalibration(r_sense_mohm=4.95, current_gain=0.99)
+    save_calibration('SimBox000A', calibration, fname)
+    assert load_calibration('SimBox000A', fname) == calibration
+    assert load_calibration('SimBox001A', fname) == GasGaugeCalibration()
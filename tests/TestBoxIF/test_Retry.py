@@ -0,0 +1,71 @@
+# unit tests for retry policy and circuit breaker
+import pytest
+
+from source.TestBoxIF.Retry import RetryPolicy
+from source.TestBoxIF.Retry import CircuitBreaker
+from source.TestBoxIF.Retry import BreakerState
+from source.TestBoxIF.FT4222Sim import FT4222Sim
+from source.TestBoxIF.I2C import I2C
+from source.TestBoxIF.I2C import I2CNoDeviceError
+from source.TestBoxIF.I2C import I2CCircuitOpenError
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# RetryPolicy
+def test_backoff_bounds():
+    policy = RetryPolicy(backoff_s=0.01, backoff_max_s=0.03, jitter=0.5)
+    for retry_num, nominal in enumerate((0.01, 0.02, 0.03, 0.03)):
+        delay = policy.delay(retry_num)
+        assert nominal / 2 <= delay <= nominal
+
+def test_no_jitter():
+    policy = RetryPolicy(backoff_s=0.01, jitter=0)
+    assert policy.delay(1) == pytest.approx(0.02)
+
+# CircuitBreaker
+def test_breaker_opens():
+    breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == BreakerState.OPEN
+    assert not breaker.allow()
+
+def test_breaker_half_open_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 5
+    assert breaker.allow()
+    assert breaker.state == BreakerState.HALF_OPEN
+    assert not breaker.allow()      # one probe at a time
+    breaker.record_success()
+    assert breaker.state == BreakerState.CLOSED
+
+def test_breaker_half_open_failure():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 5
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == BreakerState.OPEN
+
+# I2C
+def test_i2c_fails_fast():
+    sim = FT4222Sim()
+    sim.nack_addresses.add(0x64)
+    i2c = I2C(sim, breaker_options={'failure_threshold': 2})
+    for _ in range(2):
+        with pytest.raises(I2CNoDeviceError):
+            i2c.read(0x64, 0x00, 1)
+    reads = sim.num_reads + sim.num_writes
+    with pytest.raises(I2CCircuitOpenError):
+        i2c.read(0x64, 0x00, 1)
+    assert sim.num_reads + sim.num_writes == reads
+    i2c.read(0x27, 0x00, 1)     # other devices unaffected